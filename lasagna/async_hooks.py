@@ -0,0 +1,156 @@
+"""
+Run plugin hooks that declare themselves asynchronous on a pool of worker threads.
+
+Hooks such as updateStatusBar_End run inside the mouse-move handler, so a slow hook (e.g. the
+ARA area contours) delays the next mouse event. A plugin marks such a hook with the asyncHook
+decorator and splits it into three parts:
+
+  prepare - runs on the GUI thread when the hook is called. It reads what the computation needs
+            from the viewer and returns the arguments of the hook, or None to skip this call.
+  hook    - the decorated method. Runs on a worker thread and returns a result. It must not touch
+            Qt widgets or plot items.
+  apply   - runs on the GUI thread with the result, e.g. to update an ingredient and redraw.
+
+Only one call of each hook runs at a time. Calls made while it runs replace each other so that
+only the latest is run next and superseded calls are dropped. The overlay therefore lags a frame
+behind the cursor instead of blocking it. Results are handed back to the GUI thread through a
+Qt signal. Results arriving after the plugin detached its hooks are discarded.
+
+Example:
+
+    @asyncHook(prepare="_nearestPointArgs", apply="_showNearestPoint")
+    def hook_updateMainWindowOnMouseMove_End(self, points, position):
+        return nearest(points, position)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5 import QtCore
+
+
+def asyncHook(prepare=None, apply=None):
+    """
+    Decorator marking a plugin hook_ method as asynchronous (see the module docstring).
+    prepare and apply are the names of methods of the plugin. Without prepare the hook
+    receives the arguments passed to the hook. Without apply the result is discarded.
+    """
+
+    def decorator(function):
+        function.asyncHook = {"prepare": prepare, "apply": apply}
+        return function
+
+    return decorator
+
+
+def isAsyncHook(method):
+    return getattr(method, "asyncHook", None) is not None
+
+
+class AsyncHookCall(object):
+    """
+    Stands in for an asynchronous hook method in Lasagna.hooks. Calling it (from runHook)
+    prepares the arguments on the GUI thread and submits the work to the pool.
+    """
+
+    def __init__(self, pool, method):
+        self.pool = pool
+        self.method = method
+        options = method.asyncHook
+        owner = method.__self__
+        self.prepare = getattr(owner, options["prepare"]) if options["prepare"] else None
+        self.apply = getattr(owner, options["apply"]) if options["apply"] else None
+
+        # Read by the hook profiler (hookOrigin) and by LasagnaPlugin.detachHooks (through repr)
+        self.__self__ = owner
+        self.__name__ = method.__name__
+
+    def __call__(self, *args):
+        if self.prepare is not None:
+            args = self.prepare(*args)
+            if args is None:
+                return
+        self.pool.submit(self, args)
+
+    def __repr__(self):
+        return "<async %r>" % (self.method,)
+
+
+class AsyncHookPool(QtCore.QObject):
+    # Emitted from a worker thread. Qt queues it to the GUI thread because this object lives there.
+    resultReady = QtCore.pyqtSignal(object)
+
+    def __init__(self, maxWorkers=2):
+        super(AsyncHookPool, self).__init__()
+        self._executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        # The following are only used on the GUI thread
+        self._running = set()  # hook calls with a job on a worker
+        self._pending = dict()  # hook call -> arguments of the latest call made while it was running
+        self._generation = dict()  # hook call -> incremented on cancel so that late results are dropped
+        self.dropped = 0  # number of superseded calls that were never run
+        self.resultReady.connect(self._applyResult)
+
+    def wrap(self, method):
+        """
+        Return the callable to register in Lasagna.hooks for the asynchronous hook method
+        """
+        return AsyncHookCall(self, method)
+
+    def submit(self, hookCall, args):
+        """
+        Run hookCall.method(*args) on a worker, or keep args to run next if it is already running
+        """
+        if hookCall in self._running:
+            if hookCall in self._pending:
+                self.dropped += 1
+            self._pending[hookCall] = args
+            return
+        self._running.add(hookCall)
+        generation = self._generation.setdefault(hookCall, 0)
+        self._executor.submit(self._run, hookCall, generation, args)
+
+    def _run(self, hookCall, generation, args):
+        try:
+            result = hookCall.method(*args)
+            failed = False
+        except Exception as err:  # report it on the console rather than lose it in the thread
+            print("AsyncHookPool - hook %s failed: %s" % (hookCall.method, err))
+            result = None
+            failed = True
+        self.resultReady.emit((hookCall, generation, failed, result))
+
+    def _applyResult(self, job):
+        hook_call, generation, failed, result = job
+        self._running.discard(hook_call)
+        if generation != self._generation.get(hook_call):
+            self._generation.pop(hook_call, None)  # cancelled while running
+            return
+
+        # Start the latest call made in the meantime before applying, so the worker is kept busy
+        if hook_call in self._pending:
+            self.submit(hook_call, self._pending.pop(hook_call))
+
+        if failed or hook_call.apply is None:
+            return
+        try:
+            hook_call.apply(result)
+        except Exception as err:
+            print("Error applying result of plugin method {}; main error {}".format(hook_call.method, err))
+
+    def cancel(self, owner):
+        """
+        Drop the pending calls and discard the results of running calls of the hooks of owner
+        (a plugin). Called when the plugin detaches its hooks.
+        """
+        for hook_call in list(self._generation.keys()):
+            if hook_call.__self__ is owner:
+                self._pending.pop(hook_call, None)
+                if hook_call in self._running:
+                    self._generation[hook_call] += 1
+                else:
+                    del self._generation[hook_call]
+
+    def pending(self):
+        return len(self._running) + len(self._pending)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,9 @@
+"""
+Scripts that time parts of Lasagna with synthetic data. They create the main window and so
+need a display, or run with QT_QPA_PLATFORM=offscreen. For example:
+
+    python -m lasagna.benchmarks.hover_benchmark
+
+replay_benchmark replays mouse use recorded in Lasagna (View > Record interactions) against
+given data and plugins instead.
+"""
@@ -0,0 +1,118 @@
+"""
+Time how long Lasagna takes to handle mouse moves over the three views.
+
+A synthetic image stack (and optionally some point series) is loaded and a sweep of mouse
+moves is sent to Lasagna.mouseMoved, the slot that the views' mouse-move signals are
+connected to in main.py. The mouse visits each view in turn. After every move the Qt event
+loop is run so that redraws and painting are included in the "event" timings.
+
+Reports the per-move time of the handler itself (Lasagna.hoverStats) and of the handler plus
+the event loop, against the hoverBudget_ms preference.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+from PyQt5 import QtCore
+from PyQt5.QtWidgets import QApplication
+
+from lasagna.utils.timing_stats import durationStats
+
+
+class _MouseRelay(QtCore.QObject):
+    """
+    Stands in for the pg.SignalProxy of main.py: Lasagna.mouseMoved reads axisID from its sender
+    """
+    moved = QtCore.pyqtSignal(object)
+
+    def __init__(self, axisID):
+        super(_MouseRelay, self).__init__()
+        self.axisID = axisID
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description=__doc__.strip().split("\n")[0])
+    parser.add_argument('--shape', type=int, nargs=3, default=[200, 512, 512],
+                        help='Shape of the synthetic image stack')
+    parser.add_argument('--stacks', type=int, default=1, help='Number of image stacks to load')
+    parser.add_argument('--points', type=int, default=0,
+                        help='Number of point-series ingredients to overlay')
+    parser.add_argument('--moves', type=int, default=600, help='Number of mouse moves to send')
+    return parser
+
+
+def sweep(view, nMoves):
+    """
+    Return nMoves scene positions zig-zagging across the view
+    """
+    rect = view.sceneBoundingRect()
+    t = np.linspace(0, 1, nMoves)
+    x = rect.left() + rect.width() * (0.1 + 0.8 * t)
+    y = rect.top() + rect.height() * (0.5 + 0.4 * np.sin(t * 6 * np.pi))
+    return [QtCore.QPointF(xi, yi) for xi, yi in zip(x, y)]
+
+
+def run(shape=(200, 512, 512), stacks=1, points=0, moves=600):
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    from lasagna.lasagna_object import Lasagna
+    lasagna = Lasagna()
+    lasagna.app = app
+    lasagna.resize(1400, 700)
+    lasagna.show()
+
+    rng = np.random.default_rng(0)
+    for i in range(stacks):
+        data = rng.integers(0, 4096, size=shape, dtype=np.uint16)
+        lasagna.addIngredient(kind='imagestack', objectName='stack_%d' % i, data=data)
+        lasagna.returnIngredientByName('stack_%d' % i).addToPlots()
+    for i in range(points):
+        xyz = rng.uniform(0, 1, size=(50, 3)) * np.array(shape)
+        lasagna.addIngredient(kind='sparsepoints', objectName='points_%d' % i, data=xyz)
+        lasagna.returnIngredientByName('points_%d' % i).addToPlots()
+
+    lasagna.initialiseAxes(resetAxes=True)
+    app.processEvents()
+
+    relays = []
+    for axis_id in range(3):
+        relay = _MouseRelay(axis_id)
+        relay.moved.connect(lasagna.mouseMoved)
+        relays.append(relay)
+
+    event_stats = durationStats(budget_ms=lasagna.hoverStats.budget_ms)
+    lasagna.hoverStats.reset()
+    lasagna.redrawScheduler.resetCounters()
+    moves_per_view = max(1, moves // 3)
+    for axis_id, relay in enumerate(relays):
+        for pos in sweep(lasagna.axes2D[axis_id].view, moves_per_view):
+            start = time.perf_counter()
+            relay.moved.emit((pos,))
+            app.processEvents()
+            event_stats.record(time.perf_counter() - start)
+
+    report = dict(handler=lasagna.hoverStats.summary(), event=event_stats.summary(),
+                  redraws=lasagna.redrawScheduler.stats())
+    lasagna.redrawScheduler.shutdown()
+    lasagna.filterWorkers.shutdown()
+    return report
+
+
+def main():
+    args = get_parser().parse_args()
+    report = run(tuple(args.shape), args.stacks, args.points, args.moves)
+
+    print("\nHover benchmark: %d moves, stack shape %s x %d, %d point series" %
+          (report["handler"]["count"], "x".join(str(s) for s in args.shape), args.stacks, args.points))
+    for name in ("handler", "event"):
+        stats = report[name]
+        print("%-8s p50 %6.2f ms   p95 %6.2f ms   max %6.2f ms   over %g ms budget: %d" %
+              (name, stats["p50_ms"], stats["p95_ms"], stats["max_ms"], stats["budget_ms"], stats["overBudget"]))
+    print("redraws  requested %(requested)d  executed %(executed)d  flushes %(flushes)d" % report["redraws"])
+
+
+if __name__ == '__main__':
+    main()
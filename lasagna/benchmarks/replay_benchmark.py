@@ -0,0 +1,298 @@
+"""
+Replay a recording of mouse use on the views and time how long Lasagna takes to respond.
+
+Record with View > Record interactions or the --record option of lasagna (see
+lasagna.interaction_recorder). The recording is replayed against the given data and plugins:
+image stacks (--stacks), a session (--session) or, if neither is given, a synthetic stack. The
+views are first put in the state they were in when recording started. Each event is then sent
+to the view it was recorded on, at the same data coordinates and with the same buttons and
+keyboard modifiers, so Ctrl-wheel changes slice and Ctrl-drag moves the cross hairs as they did.
+The views' signals are connected as in main.py, rate-limiting SignalProxy included.
+
+The latency of an event is the time from sending it until Lasagna is idle again: the signal
+proxies have delivered it, no redraws are pending and no display filters, plugin hooks or session
+loads are running. By default events are sent at their recorded times. If Lasagna is still busy
+when the next event is due, that event is sent as soon as it is idle, as queued input would be.
+With --fast each event is sent as soon as the previous one has been handled. pyqtgraph drops
+mouse moves that arrive faster than its mouseRateLimit option, so fewer of them then reach
+Lasagna.mouseMoved (compare the "handler" and "move" counts).
+
+Reports the latency distribution of each type of event (move, press, release, wheel), the time
+spent in the mouse-move handler (Lasagna.hoverStats) and the redraw counts. Save the report with
+--output and compare a later run against it with --compare. For example:
+
+    QT_QPA_PLATFORM=offscreen python -m lasagna.benchmarks.replay_benchmark drag.json --stacks brain.tif \
+        --output before.json
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+from PyQt5 import QtCore, QtGui
+from PyQt5.QtTest import QTest
+from PyQt5.QtWidgets import QApplication
+
+from lasagna.interaction_recorder import readRecording
+from lasagna.utils.timing_stats import durationStats
+
+EVENT_TYPES = ("move", "press", "release", "wheel")
+
+# Latency histogram bin edges in ms: roughly 1/4, 1/2, 1, 2, 4 and 6 frames at 60 Hz
+HISTOGRAM_EDGES_MS = [4, 8, 16, 33, 66, 100]
+
+# Keys pressed and released to give the keyboard modifiers of each event
+MODIFIER_KEYS = (
+    (QtCore.Qt.ControlModifier, QtCore.Qt.Key_Control),
+    (QtCore.Qt.ShiftModifier, QtCore.Qt.Key_Shift),
+    (QtCore.Qt.AltModifier, QtCore.Qt.Key_Alt),
+)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description=__doc__.strip().split("\n")[0])
+    parser.add_argument('recording', help='Interaction recording (.json) to replay')
+    parser.add_argument('--stacks', nargs='+', default=[], help='Image stacks to load')
+    parser.add_argument('--session', default=None, help='Session file to restore before loading --stacks')
+    parser.add_argument('--shape', type=int, nargs=3, default=[200, 512, 512],
+                        help='Shape of the synthetic image stack used when no data are given')
+    parser.add_argument('--plugins', nargs='+', default=[], help='Plugins to start, named as in the plugins menu')
+    parser.add_argument('--fast', action='store_true',
+                        help='Send each event as soon as the previous one has been handled')
+    parser.add_argument('--repeat', type=int, default=1, help='Number of times to replay the recording')
+    parser.add_argument('--timeout', type=float, default=5.0,
+                        help='Seconds to wait for Lasagna to become idle after an event')
+    parser.add_argument('--output', default=None, help='Save the report to this JSON file')
+    parser.add_argument('--compare', default=None, help='Report saved with --output by an earlier run to compare with')
+    return parser
+
+
+def loadData(lasagna, stacks=(), session=None, shape=(200, 512, 512)):
+    if session:
+        lasagna.loadSession(session)
+    for fname in stacks:
+        lasagna.loadImageStack(fname)
+    if not lasagna.ingredientList:
+        data = np.random.default_rng(0).integers(0, 4096, size=shape, dtype=np.uint16)
+        lasagna.addIngredient(kind='imagestack', objectName='synthetic', data=data)
+        lasagna.returnIngredientByName('synthetic').addToPlots()
+    lasagna.initialiseAxes(resetAxes=True)
+
+
+def isIdle(lasagna, proxies):
+    """
+    True if Lasagna has finished handling the events sent so far
+    """
+    return (all(proxy.args is None for proxy in proxies)
+            and not lasagna.redrawScheduler.hasPendingRedraws()
+            and lasagna.filterWorkers.pending() == 0
+            and lasagna.asyncHooks.pending() == 0
+            and lasagna.sessions.pending() == 0)
+
+
+def waitUntilIdle(app, lasagna, proxies, timeout):
+    """
+    Run the event loop until Lasagna is idle. Returns False if it is still busy after timeout seconds.
+    """
+    end = time.perf_counter() + timeout
+    while True:
+        app.processEvents()
+        if isIdle(lasagna, proxies):
+            return True
+        if time.perf_counter() > end:
+            return False
+        time.sleep(0.0002)
+
+
+def setModifiers(widget, modifiers):
+    """
+    Press or release Ctrl, Shift and Alt so that QApplication.keyboardModifiers() returns modifiers.
+    The views read the modifiers from there rather than from the mouse events.
+    """
+    current = int(QApplication.keyboardModifiers())
+    for modifier, key in MODIFIER_KEYS:
+        wanted = modifiers & int(modifier)
+        if wanted and not current & int(modifier):
+            current |= int(modifier)
+            QTest.keyPress(widget, key, QtCore.Qt.KeyboardModifiers(current))
+        elif not wanted and current & int(modifier):
+            current &= ~int(modifier)
+            QTest.keyRelease(widget, key, QtCore.Qt.KeyboardModifiers(current))
+
+
+def makeEvent(lasagna, entry):
+    """
+    Return the viewport the recorded event entry happened in and a new Qt event for it
+    """
+    view = lasagna.axes2D[entry["view"]].view
+    viewport = view.viewport()
+    scene_pos = view.getViewBox().mapViewToScene(QtCore.QPointF(entry["x"], entry["y"]))
+    pos = view.viewportTransform().map(scene_pos)
+    global_pos = QtCore.QPointF(viewport.mapToGlobal(pos.toPoint()))
+    buttons = QtCore.Qt.MouseButtons(entry["buttons"])
+    modifiers = QtCore.Qt.KeyboardModifiers(entry["modifiers"])
+
+    if entry["type"] == "wheel":
+        event = QtGui.QWheelEvent(pos, global_pos, QtCore.QPoint(0, 0), QtCore.QPoint(0, entry["delta"]),
+                                  buttons, modifiers, QtCore.Qt.NoScrollPhase, False)
+        return viewport, event
+
+    event_type = {
+        "move": QtCore.QEvent.MouseMove,
+        "press": QtCore.QEvent.MouseButtonPress,
+        "release": QtCore.QEvent.MouseButtonRelease,
+    }[entry["type"]]
+    button = QtCore.Qt.MouseButton(entry.get("button", 0))
+    return viewport, QtGui.QMouseEvent(event_type, pos, global_pos, button, buttons, modifiers)
+
+
+def replay(app, lasagna, proxies, events, stats, fast=False, timeout=5.0):
+    """
+    Send the recorded events and record the latency of each in stats, a dictionary of
+    durationStats by event type with an "all" entry. Returns the number of events after which
+    Lasagna was still busy when the timeout expired.
+    """
+    timeouts = 0
+    start = time.perf_counter()
+    for entry in events:
+        if not fast:
+            wait = start + entry["t"] - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+        viewport, event = makeEvent(lasagna, entry)
+        setModifiers(viewport, entry["modifiers"])
+        sent = time.perf_counter()
+        app.sendEvent(viewport, event)
+        if not waitUntilIdle(app, lasagna, proxies, timeout):
+            timeouts += 1
+        latency = time.perf_counter() - sent
+        stats[entry["type"]].record(latency)
+        stats["all"].record(latency)
+
+    setModifiers(lasagna.axes2D[0].view.viewport(), 0)
+    return timeouts
+
+
+def run(recording, stacks=(), session=None, shape=(200, 512, 512), plugins=(), fast=False, repeat=1, timeout=5.0):
+    app = QApplication.instance() or QApplication(sys.argv)
+    recorded = readRecording(recording)
+    events = [entry for entry in recorded["events"] if entry["type"] in EVENT_TYPES]
+
+    from lasagna.lasagna_object import Lasagna
+    from lasagna.main import connect_view_signals
+    lasagna = Lasagna()
+    lasagna.app = app
+    lasagna.resize(*recorded.get("windowSize", [1400, 700]))
+    lasagna.show()
+
+    loadData(lasagna, stacks, session, shape)
+    for name in plugins:
+        if name in lasagna.plugins:
+            lasagna.startPlugin(name)
+            lasagna.pluginActions[name].setChecked(True)
+        else:
+            print("No plugin {}: not starting".format(name))
+    proxies = connect_view_signals(lasagna)
+    waitUntilIdle(app, lasagna, proxies, timeout=60)  # e.g. stacks of a session loading in the background
+
+    budget_ms = lasagna.hoverStats.budget_ms
+    history = max(1, len(events) * repeat)
+    stats = dict((name, durationStats(budget_ms=budget_ms, history=history)) for name in EVENT_TYPES + ("all",))
+    lasagna.hoverStats.reset()
+    lasagna.redrawScheduler.resetCounters()
+    timeouts = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        # Start each pass from the recorded view state so that repeats are alike
+        for spin_box, value in zip(lasagna.viewZ_spinBoxes, recorded.get("zSpread", [])):
+            spin_box.setValue(value)
+        lasagna.sessions.applyViewState(recorded.get("views", []))
+        lasagna.initialiseAxes()
+        lasagna.sessions.applyViewRanges(recorded.get("views", []))
+        waitUntilIdle(app, lasagna, proxies, timeout)
+        timeouts += replay(app, lasagna, proxies, events, stats, fast=fast, timeout=timeout)
+
+    report = dict(
+        recording=recording,
+        data=list(stacks) + ([session] if session else []) or ["synthetic %s" % "x".join(str(s) for s in shape)],
+        plugins=list(plugins),
+        fast=fast,
+        repeat=repeat,
+        duration_s=time.perf_counter() - start,
+        timeouts=timeouts,
+        histogramEdges_ms=HISTOGRAM_EDGES_MS,
+        events=dict((name, dict(s.summary(), histogram=s.histogram(HISTOGRAM_EDGES_MS)))
+                    for name, s in stats.items()),
+        handler=lasagna.hoverStats.summary(),
+        redraws=lasagna.redrawScheduler.stats(),
+    )
+    lasagna.redrawScheduler.shutdown()
+    lasagna.filterWorkers.shutdown()
+    lasagna.asyncHooks.shutdown()
+    lasagna.sessions.shutdown()
+    return report
+
+
+def printReport(report):
+    print("\nReplay of %s: %d events x %d, %s, %.1f s" %
+          (report["recording"], report["events"]["all"]["count"] // max(report["repeat"], 1), report["repeat"],
+           "fast" if report["fast"] else "recorded timing", report["duration_s"]))
+    print("data: %s   plugins: %s" % (", ".join(report["data"]), ", ".join(report["plugins"]) or "none"))
+    edges = report["histogramEdges_ms"]
+    bins = ["<%g" % edges[0]] + ["<%g" % edge for edge in edges[1:]] + [">=%g" % edges[-1]]
+    print("%-8s %6s %8s %8s %8s  %s" % ("event", "count", "p50 ms", "p95 ms", "max ms", "  ".join(bins)))
+    for name in EVENT_TYPES + ("all",):
+        stats = report["events"][name]
+        if not stats["count"]:
+            continue
+        print("%-8s %6d %8.2f %8.2f %8.2f  %s" %
+              (name, stats["count"], stats["p50_ms"], stats["p95_ms"], stats["max_ms"],
+               "  ".join("%*d" % (len(label), n) for label, n in zip(bins, stats["histogram"]))))
+    stats = report["handler"]
+    print("handler  %6d %8.2f %8.2f %8.2f  (Lasagna.mouseMoved)" %
+          (stats["count"], stats["p50_ms"], stats["p95_ms"], stats["max_ms"]))
+    print("redraws  requested %(requested)d  executed %(executed)d  flushes %(flushes)d" % report["redraws"])
+    if report["timeouts"]:
+        print("%d events were still being handled when the timeout expired" % report["timeouts"])
+
+
+def printComparison(report, baseline, name="baseline"):
+    """
+    Print the change in latency and redraws of report relative to baseline, an earlier report
+    """
+    print("\nCompared with %s:" % name)
+    for name in EVENT_TYPES + ("all",):
+        old, new = baseline["events"].get(name), report["events"][name]
+        if not old or not old["count"] or not new["count"]:
+            continue
+        print("%-8s p50 %7.2f -> %7.2f ms (%+5.0f%%)   p95 %7.2f -> %7.2f ms (%+5.0f%%)" %
+              (name, old["p50_ms"], new["p50_ms"], percentChange(old["p50_ms"], new["p50_ms"]),
+               old["p95_ms"], new["p95_ms"], percentChange(old["p95_ms"], new["p95_ms"])))
+    for key in ("requested", "executed"):
+        print("redraws %s %d -> %d" % (key, baseline["redraws"][key], report["redraws"][key]))
+
+
+def percentChange(old, new):
+    return 100.0 * (new - old) / old if old else 0.0
+
+
+def main():
+    args = get_parser().parse_args()
+    report = run(args.recording, args.stacks, args.session, tuple(args.shape), args.plugins,
+                 fast=args.fast, repeat=args.repeat, timeout=args.timeout)
+    printReport(report)
+    if args.compare:
+        with open(args.compare, "r") as stream:
+            printComparison(report, json.load(stream), args.compare)
+    if args.output:
+        with open(args.output, "w") as stream:
+            json.dump(report, stream, indent=2)
+        print("Saved report to %s" % args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Run display filters (see lasagna.image_processing.display_filters) on a pool of worker threads.
+
+The scipy filters release the GIL so several slices can be filtered at once without blocking
+the GUI. While a slice is being filtered the unfiltered slice is shown. When the result is ready
+it is handed back to the GUI thread through a Qt signal, stored in the ingredient's filter cache
+and the axis is redrawn if it still shows that slice.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5 import QtCore
+
+
+class FilterWorkerPool(QtCore.QObject):
+    # Emitted from a worker thread. Qt queues it to the GUI thread because this object lives there.
+    resultReady = QtCore.pyqtSignal(object)
+
+    def __init__(self, lasagna_serving, maxWorkers=None):
+        super(FilterWorkerPool, self).__init__()
+        self.lasagna = lasagna_serving
+        if maxWorkers is None:
+            maxWorkers = max(1, min(4, (os.cpu_count() or 2) - 1))
+        self._executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self._inFlight = set()  # (ingredient name, cache key) of jobs not yet returned
+        self._lock = threading.Lock()  # submit is also called from the render threads of RedrawScheduler
+        self.resultReady.connect(self._storeResult)
+
+    def submit(self, ingredient, axisIndex, sliceToPlot, image, cacheKey):
+        """
+        Filter image with ingredient.displayFilter on a worker thread unless the same job is
+        already running
+        """
+        job = (ingredient.objectName, cacheKey)
+        with self._lock:
+            if job in self._inFlight:
+                return
+            self._inFlight.add(job)
+        self._executor.submit(self._run, ingredient, axisIndex, sliceToPlot, image, cacheKey, ingredient.displayFilter)
+
+    def _run(self, ingredient, axisIndex, sliceToPlot, image, cacheKey, displayFilter):
+        try:
+            result = displayFilter.apply(image)
+        except Exception as err:  # report it on the console rather than lose it in the thread
+            print("FilterWorkerPool - filter %s failed on %s: %s" % (displayFilter, ingredient.objectName, err))
+            result = None
+        self.resultReady.emit((ingredient, axisIndex, sliceToPlot, cacheKey, result))
+
+    def _storeResult(self, job):
+        ingredient, axis_index, slice_to_plot, cache_key, result = job
+        with self._lock:
+            self._inFlight.discard((ingredient.objectName, cache_key))
+        if result is None or ingredient not in self.lasagna.ingredientRegistry:
+            return
+
+        ingredient.filterCache.put(cache_key, result)
+        axis = self.lasagna.axes2D[axis_index]
+        if axis.currentSlice == slice_to_plot:
+            self.lasagna.redrawScheduler.requestRedraw(axis, slice_to_plot)
+
+    def pending(self):
+        with self._lock:
+            return len(self._inFlight)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
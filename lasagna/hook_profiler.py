@@ -0,0 +1,97 @@
+"""
+Time the plugin hooks run by Lasagna.runHook.
+
+Hooks such as updateMainWindowOnMouseMove_End and updateStatusBar_End run on every mouse move,
+so one slow plugin makes hovering sluggish. When enabled, the profiler times every hook
+function separately and keeps, for each (hook, function) pair, the number of calls and the
+cumulative, median, 95th percentile and longest durations. The function's plugin is taken
+from the module that defines it.
+
+A hook function that takes longer than the budget (hookBudget_ms preference, one frame at
+60 Hz by default) is reported on the console. When the profiler is disabled runHook only
+checks the enabled flag, so it costs nothing noticeable.
+"""
+
+import time
+
+from lasagna.utils.timing_stats import durationStats
+
+
+def hookOrigin(hook):
+    """
+    Return the name of the plugin (module) and of the function of hook
+    """
+    owner = getattr(hook, "__self__", None)
+    module = type(owner).__module__ if owner is not None else getattr(hook, "__module__", None)
+    function = getattr(hook, "__name__", repr(hook))
+    return (module or "?").rsplit(".", 1)[-1], function
+
+
+class HookProfiler(object):
+    def __init__(self, hooks, budget_ms=0, enabled=False):
+        """
+        hooks - Lasagna's dictionary of hook name -> list of hook functions
+        budget_ms - durations above this are reported. 0 means no warnings.
+        """
+        self.hooks = hooks
+        self.budget_ms = budget_ms
+        self.enabled = enabled
+        self._stats = dict()  # (hook name, plugin, function name) -> durationStats
+        self._hookNames = dict()  # id of a hook list -> hook name
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self._stats = dict()
+
+    def hookName(self, hookArray):
+        """
+        Return the name of the hook whose list of functions is hookArray
+        """
+        name = self._hookNames.get(id(hookArray))
+        if name is None:
+            self._hookNames = {id(functions): n for n, functions in self.hooks.items()}
+            name = self._hookNames.get(id(hookArray), "?")
+        return name
+
+    def timeHook(self, hookArray, hook, args):
+        """
+        Run hook (one of the functions in hookArray) with args and record how long it took
+        """
+        start = time.perf_counter()
+        try:
+            hook(*args)
+        finally:
+            self.record(self.hookName(hookArray), hook, time.perf_counter() - start)
+
+    def record(self, hookName, hook, duration):
+        plugin, function = hookOrigin(hook)
+        key = (hookName, plugin, function)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = durationStats(budget_ms=self.budget_ms)
+        stats.budget_ms = self.budget_ms
+        stats.record(duration)
+
+        # Report the first slow call and then every 100th, so the console is not flooded
+        if self.budget_ms and duration * 1000 > self.budget_ms and stats.overBudget % 100 == 1:
+            print(
+                "Hook %s from plugin %s (%s) took %0.1f ms, over the %g ms budget (%d times so far)"
+                % (hookName, plugin, function, duration * 1000, self.budget_ms, stats.overBudget)
+            )
+
+    def report(self):
+        """
+        Return a list with one dictionary per (hook, plugin, function), slowest in total first.
+        Each has the keys hook, plugin, function, and those of durationStats.summary plus total_ms.
+        """
+        rows = []
+        for (hook_name, plugin, function), stats in self._stats.items():
+            row = dict(hook=hook_name, plugin=plugin, function=function, total_ms=stats.total * 1000)
+            row.update(stats.summary())
+            rows.append(row)
+        return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
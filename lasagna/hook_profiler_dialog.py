@@ -0,0 +1,84 @@
+"""
+A small non-modal dialog showing the timings collected by the hook profiler
+(see lasagna.hook_profiler). The table refreshes itself while the dialog is open.
+"""
+
+from PyQt5 import QtCore, QtWidgets
+
+
+COLUMNS = (
+    ("hook", "Hook", "%s"),
+    ("plugin", "Plugin", "%s"),
+    ("function", "Function", "%s"),
+    ("count", "Calls", "%d"),
+    ("total_ms", "Total (ms)", "%0.1f"),
+    ("p50_ms", "p50 (ms)", "%0.2f"),
+    ("p95_ms", "p95 (ms)", "%0.2f"),
+    ("max_ms", "Max (ms)", "%0.2f"),
+    ("overBudget", "Over budget", "%d"),
+)
+
+
+class HookProfilerDialog(QtWidgets.QDialog):
+    def __init__(self, lasagna_serving, parent=None):
+        super(HookProfilerDialog, self).__init__(parent)
+        self.lasagna = lasagna_serving
+        self.profiler = lasagna_serving.hookProfiler
+        self.setWindowTitle("Plugin hook timings")
+
+        self.table = QtWidgets.QTableWidget(0, len(COLUMNS), self)
+        self.table.setHorizontalHeaderLabels([title for _, title, _ in COLUMNS])
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+
+        self.enable_checkBox = QtWidgets.QCheckBox("Profile hooks", self)
+        self.enable_checkBox.setChecked(self.profiler.enabled)
+        self.budget_label = QtWidgets.QLabel(self)
+        self.reset_button = QtWidgets.QPushButton("Reset", self)
+
+        controls_layout = QtWidgets.QHBoxLayout()
+        controls_layout.addWidget(self.enable_checkBox)
+        controls_layout.addWidget(self.budget_label)
+        controls_layout.addStretch()
+        controls_layout.addWidget(self.reset_button)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(self.table)
+        layout.addLayout(controls_layout)
+        self.resize(800, 300)
+
+        self.refreshTimer = QtCore.QTimer(self)
+        self.refreshTimer.setInterval(1000)
+        self.refreshTimer.timeout.connect(self.refresh)
+
+        self.enable_checkBox.toggled.connect(self.profiler.enable)
+        self.reset_button.clicked.connect(self.reset)
+
+    def refresh(self):
+        """
+        Fill the table with the current timings, slowest in total first
+        """
+        if self.profiler.budget_ms:
+            self.budget_label.setText("Budget %g ms per call" % self.profiler.budget_ms)
+        else:
+            self.budget_label.setText("No budget")
+
+        rows = self.profiler.report()
+        self.table.setRowCount(len(rows))
+        for row_index, row in enumerate(rows):
+            for col, (key, _, fmt) in enumerate(COLUMNS):
+                self.table.setItem(row_index, col, QtWidgets.QTableWidgetItem(fmt % row[key]))
+        self.table.resizeColumnsToContents()
+
+    def reset(self):
+        self.profiler.reset()
+        self.refresh()
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refreshTimer.start()
+        super(HookProfilerDialog, self).showEvent(event)
+
+    def hideEvent(self, event):
+        self.refreshTimer.stop()
+        super(HookProfilerDialog, self).hideEvent(event)
@@ -0,0 +1,113 @@
+"""
+Filters applied to the displayed slice of an image stack (not to the data).
+
+Each filter takes a 2-D image and returns a filtered float32 image. scipy is imported only
+when a filter is first used, since most sessions never use one.
+
+gaussian - Gaussian smoothing with standard deviation sigma (pixels)
+median   - median filter over a size x size neighbourhood
+tophat   - background subtraction: the image minus its grey opening with a disk of the
+           given radius (a rolling-ball style background estimate)
+unsharp  - unsharp masking: image + amount * (image - gaussian(image, sigma))
+
+Filtered slices are kept in a filterCache, a small LRU keyed by whatever identifies the
+input slice and the filter parameters. It may be used from several threads at once.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Filter name -> default parameters. The order of the parameters is the order they are asked for.
+FILTERS = OrderedDict([
+    ("gaussian", OrderedDict([("sigma", 2.0)])),
+    ("median", OrderedDict([("size", 3)])),
+    ("tophat", OrderedDict([("radius", 15)])),
+    ("unsharp", OrderedDict([("sigma", 2.0), ("amount", 1.0)])),
+])
+
+
+def _disk(radius):
+    radius = int(max(1, round(radius)))
+    y, x = np.ogrid[-radius:radius + 1, -radius:radius + 1]
+    return x ** 2 + y ** 2 <= radius ** 2
+
+
+def applyFilter(image, name, params):
+    """
+    Return image filtered by the filter name (a key of FILTERS) with parameters params
+    """
+    from scipy import ndimage
+
+    image = np.asarray(image, dtype=np.float32)
+    if name == "gaussian":
+        return ndimage.gaussian_filter(image, sigma=float(params["sigma"]))
+    if name == "median":
+        return ndimage.median_filter(image, size=int(params["size"]))
+    if name == "tophat":
+        return image - ndimage.grey_opening(image, footprint=_disk(params["radius"]))
+    if name == "unsharp":
+        blurred = ndimage.gaussian_filter(image, sigma=float(params["sigma"]))
+        return image + float(params["amount"]) * (image - blurred)
+    raise ValueError("Unknown filter {}. Valid filters are {}".format(name, list(FILTERS)))
+
+
+class displayFilter(object):
+    def __init__(self, name, **params):
+        """
+        name - a key of FILTERS. Parameters that are not supplied take their default values.
+        """
+        if name not in FILTERS:
+            raise ValueError("Unknown filter {}. Valid filters are {}".format(name, list(FILTERS)))
+        self.name = name
+        self.params = OrderedDict(FILTERS[name])
+        for key, value in params.items():
+            if key not in self.params:
+                raise ValueError("Filter {} has no parameter {}".format(name, key))
+            self.params[key] = value
+
+    def key(self):
+        return (self.name,) + tuple(self.params.items())
+
+    def apply(self, image):
+        return applyFilter(image, self.name, self.params)
+
+    def __str__(self):
+        return "%s(%s)" % (self.name, ", ".join("%s=%g" % kv for kv in self.params.items()))
+
+
+class filterCache(object):
+    def __init__(self, maxEntries=64):
+        self.maxEntries = maxEntries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the cached image for key or None
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, image):
+        with self._lock:
+            self._entries[key] = image
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+
+    def nbytes(self):
+        with self._lock:
+            return sum(image.nbytes for image in self._entries.values())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
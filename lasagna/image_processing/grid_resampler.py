@@ -0,0 +1,171 @@
+"""
+Resample slices of an image stack onto the voxel grid of another (reference) stack.
+
+Each stack has a voxel size and an origin, so voxel index i along a dimension is at world
+position origin + i * voxelSize. The views show the reference stack's grid. To overlay a stack
+with a different voxel size or origin, only the slice being displayed is resampled: no
+resampled copy of the volume is ever made.
+
+Because both grids are axis-aligned the mapping is separable. The source positions for a
+displayed slice are described by three 1-D index maps (slice, rows and columns) and the
+slice is extracted with two fancy-indexing operations. The maps are cached per
+(axis, slice) and thrown away if either grid changes. The cache is shared by the three views,
+which may be drawn on different threads, so it is guarded by a lock.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+INTERPOLATION_MODES = ("nearest", "linear")
+
+
+class gridResampler(object):
+    def __init__(self, interpolation="linear", maxCachedMaps=32):
+        if interpolation not in INTERPOLATION_MODES:
+            raise ValueError("Unknown interpolation {}. Valid values are {}".format(
+                interpolation, INTERPOLATION_MODES))
+        self.interpolation = interpolation
+        self.maxCachedMaps = maxCachedMaps
+        self._geometry = None
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def setGeometry(self, sourceShape, sourceVoxelSize, sourceOrigin,
+                    referenceShape, referenceVoxelSize, referenceOrigin):
+        """
+        Define the source and reference grids. Shapes, voxel sizes and origins are 3-element
+        sequences in array dimension order. The cached maps are kept if nothing changed.
+        """
+        geometry = tuple(tuple(float(v) for v in g) for g in (
+            sourceShape, sourceVoxelSize, sourceOrigin,
+            referenceShape, referenceVoxelSize, referenceOrigin))
+        with self._lock:
+            if geometry != self._geometry:
+                self._geometry = geometry
+                self._maps.clear()
+
+    def geometryKey(self):
+        return self._geometry
+
+    def nbytes(self):
+        n_bytes = 0
+        with self._lock:
+            for maps in self._maps.values():
+                for dim_map in maps:
+                    n_bytes += sum(a.nbytes for a in dim_map if isinstance(a, np.ndarray))
+        return n_bytes
+
+    def clear(self):
+        with self._lock:
+            self._maps.clear()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Index maps
+    def _dimensionMap(self, dim, referenceIndexes):
+        """
+        Map reference voxel indexes along dimension dim onto the source grid.
+        Returns (lower index, upper index, weight of upper, valid) as 1-D arrays.
+        """
+        src_shape, src_size, src_origin, _, ref_size, ref_origin = self._geometry
+        n = int(src_shape[dim])
+        position = (ref_origin[dim] + referenceIndexes * ref_size[dim] - src_origin[dim]) / src_size[dim]
+
+        if self.interpolation == "nearest":
+            lower = np.rint(position).astype(np.intp)
+            valid = (lower >= 0) & (lower < n)
+            lower = np.clip(lower, 0, n - 1)
+            return lower, lower, None, valid
+
+        # Points within half a voxel of the edge take the edge value
+        valid = (position >= -0.5) & (position <= n - 0.5)
+        lower = np.clip(np.floor(position), 0, max(n - 2, 0)).astype(np.intp)
+        upper = np.minimum(lower + 1, n - 1)
+        weight = np.clip(position - lower, 0, 1).astype(np.float32)
+        if n == 1:
+            weight[:] = 0
+        return lower, upper, weight, valid
+
+    def indexMaps(self, axisToPlot, sliceToPlot):
+        """
+        Return the (slice, row, column) maps for slice sliceToPlot of the reference grid as seen
+        by the axis that slices along axisToPlot
+        """
+        key = (axisToPlot, sliceToPlot)
+        with self._lock:
+            if key in self._maps:
+                self._maps.move_to_end(key)
+                return self._maps[key]
+
+        ref_shape = self._geometry[3]
+        dims = list(range(3))
+        dims[0], dims[axisToPlot] = dims[axisToPlot], dims[0]  # the order seen by the axis
+
+        maps = (
+            self._dimensionMap(dims[0], np.array([sliceToPlot], dtype=np.float64)),
+            self._dimensionMap(dims[1], np.arange(ref_shape[dims[1]])),
+            self._dimensionMap(dims[2], np.arange(ref_shape[dims[2]])),
+        )
+
+        with self._lock:
+            self._maps[key] = maps
+            while len(self._maps) > self.maxCachedMaps:
+                self._maps.popitem(last=False)
+        return maps
+
+    def sourceSlice(self, axisToPlot, sliceToPlot):
+        """
+        Return the index of the source slice nearest to reference slice sliceToPlot, or -1 if
+        it falls outside the source
+        """
+        lower, upper, weight, valid = self.indexMaps(axisToPlot, sliceToPlot)[0]
+        if not valid[0]:
+            return -1
+        if weight is not None and weight[0] > 0.5:
+            return int(upper[0])
+        return int(lower[0])
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Resampling
+    def resampleSlice(self, volume, axisToPlot, sliceToPlot):
+        """
+        Return reference slice sliceToPlot resampled from volume, which must already be
+        swapped so that axisToPlot is the first dimension (i.e. imagestack.data(axisToPlot))
+        """
+        slice_map, row_map, col_map = self.indexMaps(axisToPlot, sliceToPlot)
+        lower, upper, weight, valid = slice_map
+        if not valid[0]:
+            return np.zeros((row_map[0].size, col_map[0].size), dtype=volume.dtype)
+
+        if weight is None or weight[0] == 0 or lower[0] == upper[0]:
+            return self.resamplePlane(volume[lower[0]], axisToPlot, sliceToPlot)
+
+        # Blend the two neighbouring slices. Resample each in-plane first so that we only
+        # ever work with reference-sized images.
+        below = self.resamplePlane(volume[lower[0]], axisToPlot, sliceToPlot).astype(np.float32)
+        above = self.resamplePlane(volume[upper[0]], axisToPlot, sliceToPlot).astype(np.float32)
+        return below * (1 - weight[0]) + above * weight[0]
+
+    def resamplePlane(self, image, axisToPlot, sliceToPlot):
+        """
+        Resample a 2-D source image (e.g. a slice or a slab projection) in-plane onto the
+        reference grid
+        """
+        _, row_map, col_map = self.indexMaps(axisToPlot, sliceToPlot)
+        row_lower, row_upper, row_weight, row_valid = row_map
+        col_lower, col_upper, col_weight, col_valid = col_map
+
+        if row_weight is None:  # nearest
+            out = image[np.ix_(row_lower, col_lower)]
+        else:
+            rows = image[row_lower].astype(np.float32)
+            rows += (image[row_upper] - rows) * row_weight[:, np.newaxis]
+            out = rows[:, col_lower]
+            out += (rows[:, col_upper] - out) * col_weight[np.newaxis, :]
+
+        if not (row_valid.all() and col_valid.all()):
+            out[~row_valid, :] = 0
+            out[:, ~col_valid] = 0
+        return out
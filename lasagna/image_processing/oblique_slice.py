@@ -0,0 +1,159 @@
+"""
+Sample an image stack on an arbitrary (oblique) plane.
+
+The plane is described relative to one of the three orthogonal views. With no tilt it
+is identical to the slice that view normally shows. Tilting rotates the plane about the
+view's horizontal and/or vertical axis through the centre of the volume, so panning and
+zooming the view do not change which plane is shown. Scrolling moves the plane along its
+normal, one voxel per slice.
+
+Only the region of the plane that is visible in the view is sampled, at no more than the
+view's pixel resolution. The grid of volume coordinates for that region is cached, so
+scrolling (which only changes the plane offset) costs one addition per coordinate plus
+the interpolation itself.
+"""
+
+import numpy as np
+
+
+INTERPOLATION_MODES = ("nearest", "linear")
+
+
+class obliquePlane(object):
+    def __init__(self, tiltX=0.0, tiltY=0.0, interpolation="linear"):
+        """
+        tiltX - rotation in degrees about the view's horizontal (x) axis
+        tiltY - rotation in degrees about the view's vertical (y) axis
+        interpolation - 'nearest' or 'linear' (trilinear)
+        """
+        self.setTilt(tiltX, tiltY)
+        self.setInterpolation(interpolation)
+
+    def setTilt(self, tiltX, tiltY):
+        self.tiltX = float(tiltX)
+        self.tiltY = float(tiltY)
+        self._gridKey = None
+        self._grid = None
+
+        # Rotate the (z, x, y) basis of the view. Column 0 is the plane normal and
+        # columns 1 and 2 are the in-plane directions corresponding to image x and y.
+        a = np.deg2rad(self.tiltX)
+        b = np.deg2rad(self.tiltY)
+        rot_about_x = np.array([[np.cos(a), 0, -np.sin(a)],
+                                [0, 1, 0],
+                                [np.sin(a), 0, np.cos(a)]])
+        rot_about_y = np.array([[np.cos(b), -np.sin(b), 0],
+                                [np.sin(b), np.cos(b), 0],
+                                [0, 0, 1]])
+        self._basis = rot_about_y.dot(rot_about_x)
+
+    def setInterpolation(self, interpolation):
+        if interpolation not in INTERPOLATION_MODES:
+            raise ValueError("Unknown interpolation {}. Valid values are {}".format(
+                interpolation, INTERPOLATION_MODES))
+        self.interpolation = interpolation
+
+    def normal(self):
+        return self._basis[:, 0]
+
+    def nbytes(self):
+        return 0 if self._grid is None else self._grid.nbytes
+
+    def coordinateGrid(self, volumeShape, region, outShape):
+        """
+        Return a (3, rows, cols) array of volume coordinates for the plane through the centre
+        of the stack (offset zero). The grid is cached until the tilt, the region or the output
+        shape change.
+
+        volumeShape - shape of the volume as seen by the view (slicing axis first)
+        region - (x0, y0, width, height) of the plane to sample, in view (voxel) coordinates
+        outShape - (rows, cols) of the output image
+        """
+        key = (tuple(volumeShape), tuple(region), tuple(outShape))
+        if key == self._gridKey:
+            return self._grid
+
+        x0, y0, width, height = region
+        # Sample at pixel centres so that the sampled image lines up with setRect(region)
+        x = x0 + (np.arange(outShape[0]) + 0.5) * (width / float(outShape[0])) - 0.5
+        y = y0 + (np.arange(outShape[1]) + 0.5) * (height / float(outShape[1])) - 0.5
+
+        # The plane pivots about the centre of the volume, a fixed point, so the region only
+        # chooses which part of the same plane is sampled
+        centre = (np.array(volumeShape[:3], dtype=np.float64) - 1) / 2.0
+
+        du = (x - centre[1]).astype(np.float32)
+        dv = (y - centre[2]).astype(np.float32)
+        grid = np.empty((3, outShape[0], outShape[1]), dtype=np.float32)
+        for dim in range(3):
+            grid[dim] = (centre[dim]
+                         + self._basis[dim, 1] * du[:, np.newaxis]
+                         + self._basis[dim, 2] * dv[np.newaxis, :])
+
+        self._gridKey = key
+        self._grid = grid
+        return grid
+
+    def sample(self, volume, sliceToPlot, region, outShape, interpolation=None):
+        """
+        Return a 2D image of shape outShape sampled from volume on the plane that sits
+        sliceToPlot voxels along the plane normal (measured from slice 0 when untilted).
+        Points falling outside the volume are set to zero.
+        interpolation overrides the plane's own interpolation if it is not None.
+        """
+        if interpolation is None:
+            interpolation = self.interpolation
+
+        grid = self.coordinateGrid(volume.shape, region, outShape)
+        offset = sliceToPlot - (volume.shape[0] - 1) / 2.0
+        coords = grid + (offset * self.normal()).astype(np.float32)[:, np.newaxis, np.newaxis]
+
+        if interpolation == "nearest":
+            return self._sampleNearest(volume, coords)
+        return self._sampleLinear(volume, coords)
+
+    @staticmethod
+    def _sampleNearest(volume, coords):
+        idx = np.rint(coords).astype(np.intp)
+        inside = np.ones(idx.shape[1:], dtype=bool)
+        for dim in range(3):
+            inside &= (idx[dim] >= 0) & (idx[dim] < volume.shape[dim])
+
+        out = np.zeros(idx.shape[1:], dtype=volume.dtype)
+        out[inside] = volume[idx[0][inside], idx[1][inside], idx[2][inside]]
+        return out
+
+    @staticmethod
+    def _sampleLinear(volume, coords):
+        # Points within the volume. The lower corner of each 2x2x2 neighbourhood is clipped so
+        # that points lying exactly on the last voxel still interpolate correctly.
+        inside = np.ones(coords.shape[1:], dtype=bool)
+        base = np.empty(coords.shape, dtype=np.intp)
+        for dim in range(3):
+            inside &= (coords[dim] >= 0) & (coords[dim] <= volume.shape[dim] - 1)
+            base[dim] = np.clip(np.floor(coords[dim]), 0, max(volume.shape[dim] - 2, 0))
+        frac = coords - base
+
+        # A volume only one voxel thick along some dimension has no neighbour to blend with
+        for dim in range(3):
+            if volume.shape[dim] == 1:
+                frac[dim] = 0
+
+        z, x, y = base[0][inside], base[1][inside], base[2][inside]
+        fz, fx, fy = frac[0][inside], frac[1][inside], frac[2][inside]
+
+        values = np.zeros(z.shape, dtype=np.float32)
+        for dz in (0, 1):
+            wz = fz if dz else 1 - fz
+            for dx in (0, 1):
+                wx = fx if dx else 1 - fx
+                for dy in (0, 1):
+                    wy = fy if dy else 1 - fy
+                    if (dz and volume.shape[0] == 1) or (dx and volume.shape[1] == 1) or \
+                            (dy and volume.shape[2] == 1):
+                        continue
+                    values += wz * wx * wy * volume[z + dz, x + dx, y + dy]
+
+        out = np.zeros(base.shape[1:], dtype=np.float32)
+        out[inside] = values
+        return out
@@ -0,0 +1,63 @@
+"""
+Histogram of the part of a slice that is visible in a view.
+
+The counts are computed into the same fixed bins as the stack's whole-volume histogram so the
+two can be swapped in the histogram plot without its axes jumping around. Bins are found with
+np.bincount rather than np.histogram, which sorts or searches for every value. For 8 and
+16-bit data the values are first counted once each (at most 65,536 counts) and only those
+counts are assigned to bins, so the cost barely depends on how many bins there are.
+"""
+
+import numpy as np
+
+
+def binEdges(histogram):
+    """
+    Return the bin edges of a histogram dictionary as produced by imagestack.calcHistogram,
+    whose "x" entry holds the left edge of each bin
+    """
+    if "edges" in histogram:
+        return histogram["edges"]
+    x = np.asarray(histogram["x"], dtype=np.float64)
+    width = x[1] - x[0] if len(x) > 1 else 1.0
+    return np.append(x, x[-1] + width)
+
+
+def binIndex(values, edges):
+    """
+    Return the bin of each of values for the evenly spaced bin edges, or -1 for values outside them.
+    As with np.histogram the last bin includes its right edge.
+    """
+    n_bins = len(edges) - 1
+    lo = float(edges[0])
+    hi = float(edges[-1])
+    if hi <= lo:
+        return np.zeros(np.shape(values), dtype=np.intp)
+
+    bins = np.floor((np.asarray(values, dtype=np.float64) - lo) * (n_bins / (hi - lo)))
+    bins[values == hi] = n_bins - 1
+    bins[~((bins >= 0) & (bins < n_bins))] = -1  # also catches NaN
+    return bins.astype(np.intp)
+
+
+def histogramCounts(values, edges):
+    """
+    Count values (any shape) into the evenly spaced bins defined by edges. Returns an array of
+    len(edges) - 1 counts. Values outside the edges and non-finite values are not counted.
+    """
+    n_bins = len(edges) - 1
+    values = np.asarray(values).ravel()
+
+    if values.dtype.kind in "ui" and values.dtype.itemsize <= 2:
+        # Count each possible value once, then move those counts into the bins
+        offset = int(np.iinfo(values.dtype).min)
+        if offset:
+            values = values.astype(np.int32) - offset
+        value_counts = np.bincount(values)
+        bins = binIndex(np.arange(len(value_counts)) + offset, edges)
+        in_range = bins >= 0
+        counts = np.bincount(bins[in_range], weights=value_counts[in_range], minlength=n_bins)
+        return counts.astype(np.int64)
+
+    bins = binIndex(values, edges)
+    return np.bincount(bins[bins >= 0], minlength=n_bins)
@@ -0,0 +1,146 @@
+"""
+Pre-quantise slices for display so that pyqtgraph has no per-pixel work left to do.
+
+pyqtgraph maps each pixel of a slice through the display levels (a floating point rescale)
+and then through the colour look-up table every time an image is drawn. For 8 and 16-bit data
+there are at most 65,536 possible pixel values, so the rescale can be replaced by a table
+holding the colour-map row of every possible value. The table only depends on the levels and
+the colour map so it is built once and reused until either changes. Each slice is then
+converted with a single np.take. Floating point slices (e.g. filtered or resampled ones) are
+rescaled directly.
+
+* colour maps with up to 256 colours (all the named maps) give a uint8 image of colour-map
+  rows. pyqtgraph shows it as an indexed image with the colour map as its colour table.
+* larger colour maps (e.g. label volumes with many labels) give an RGBA image.
+
+The mapping is pyqtgraph's own: value v goes to colour-map row
+clip((v - min) * nColors / (max - min), 0, nColors - 1). Non-finite values go to row 0.
+"""
+
+import threading
+
+import numpy as np
+
+
+# Integer types for which a dense table is small (at most 65,536 entries)
+TABLE_DTYPES = (np.uint8, np.int8, np.uint16, np.int16)
+
+
+def supportsTable(dtype):
+    return np.dtype(dtype).type in TABLE_DTYPES
+
+
+def canQuantise(dtype):
+    """
+    True if renderTable.apply accepts images of type dtype
+    """
+    return supportsTable(dtype) or np.dtype(dtype).kind == "f"
+
+
+def asRGBA(lut):
+    """
+    Return the colour map lut (nColors, nColors x 3 or nColors x 4) as an nColors x 4 uint8 array
+    """
+    lut = np.asarray(lut, dtype=np.ubyte)
+    if lut.ndim == 1:
+        lut = np.repeat(lut[:, np.newaxis], 3, axis=1)
+    if lut.shape[1] == 3:
+        lut = np.concatenate([lut, np.full((lut.shape[0], 1), 255, dtype=np.ubyte)], axis=1)
+    return lut
+
+
+def levelRows(values, levels, nColors):
+    """
+    Return the colour-map row (as float) of each of values for display range levels
+    """
+    level_range = float(levels[1]) - float(levels[0])
+    if level_range == 0:
+        level_range = 1
+    rows = (np.asarray(values, dtype=np.float32) - np.float32(levels[0])) * np.float32(nColors / level_range)
+    np.clip(rows, 0, nColors - 1, out=rows)
+    return np.nan_to_num(rows, copy=False, nan=0.0)
+
+
+def rowsToImage(rows, lut):
+    """
+    Convert float colour-map rows to a uint8 image of rows (lut with up to 256 colours) or RGBA
+    """
+    if lut.shape[0] <= 256:
+        return rows.astype(np.ubyte)
+    packed = np.ascontiguousarray(lut).view(np.uint32).ravel()
+    return np.take(packed, rows.astype(np.intp)).view(np.ubyte).reshape(rows.shape + (4,))
+
+
+def buildTable(dtype, levels, lut):
+    """
+    Return a table with one entry per possible value of dtype, indexed by value minus the
+    smallest value of dtype. Entries are uint8 colour-map rows if lut has at most 256 rows,
+    otherwise packed RGBA colours (uint32).
+    levels - [min, max] display range
+    lut - colour map as returned by asRGBA
+    """
+    info = np.iinfo(dtype)
+    rows = levelRows(np.arange(info.min, info.max + 1), levels, lut.shape[0])
+    if lut.shape[0] <= 256:
+        return rows.astype(np.ubyte)
+    return np.ascontiguousarray(lut[rows.astype(np.intp)]).view(np.uint32).ravel()
+
+
+class renderTable(object):
+    def __init__(self):
+        self._lutKey = None
+        self._sourceLut = None  # keeps a colour map passed as an array alive, so its id stays unique
+        self._lut = None
+        self._tableKey = None
+        self._table = None
+        self._lock = threading.Lock()  # slices of the three views may be quantised at the same time
+
+    def apply(self, image, levels, lutKey, makeLut):
+        """
+        Quantise image (2-D, see canQuantise) for display.
+        Returns (uint8 image of colour-map rows, colour map) or (RGBA uint8 image, None).
+        levels - [min, max] display range
+        lutKey - identifies the colour map. The table is rebuilt only when the levels, the
+                 data type or lutKey change.
+        makeLut - function returning the colour map. Only called when lutKey changes.
+        """
+        with self._lock:
+            if lutKey != self._lutKey:
+                self._sourceLut = makeLut()
+                self._lut = asRGBA(self._sourceLut)
+                self._lutKey = lutKey
+                self._tableKey = None
+            lut = self._lut
+
+            table = None
+            if supportsTable(image.dtype):
+                key = (image.dtype.str, float(levels[0]), float(levels[1]))
+                if key != self._tableKey:
+                    self._table = buildTable(image.dtype, levels, lut)
+                    self._tableKey = key
+                table = self._table
+
+        if table is None:
+            quantised = rowsToImage(levelRows(image, levels, lut.shape[0]), lut)
+        else:
+            offset = np.iinfo(image.dtype).min
+            index = image if offset == 0 else image.astype(np.int32) - offset
+            quantised = np.take(table, index)
+            if table.dtype != np.ubyte:
+                quantised = quantised.view(np.ubyte).reshape(image.shape + (4,))
+
+        if quantised.ndim == 2:
+            return quantised, lut
+        return quantised, None
+
+    def nbytes(self):
+        n_bytes = 0 if self._table is None else self._table.nbytes
+        return n_bytes + (0 if self._lut is None else self._lut.nbytes)
+
+    def clear(self):
+        with self._lock:
+            self._lutKey = None
+            self._sourceLut = None
+            self._lut = None
+            self._tableKey = None
+            self._table = None
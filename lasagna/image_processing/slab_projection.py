@@ -0,0 +1,175 @@
+"""
+Thin-slab projections (maximum, mean or sum) of an image stack around the displayed slice.
+
+The slab spans sliceToPlot-halfWidth to sliceToPlot+halfWidth and is clipped at the edges
+of the stack. Scrolling through the stack moves the slab by one or a few sections at a time,
+so the projections are updated incrementally rather than recomputed from the whole slab:
+
+* sum and mean keep a running sum: slices that enter the slab are added and slices that
+  leave it are subtracted.
+* max uses the van Herk/Gil-Werman block scheme. The stack is split into blocks as long as
+  the slab and the running maximum is accumulated forwards and backwards within a block.
+  Any slab then covers at most two blocks and its maximum is the element-wise maximum of one
+  backward and one forward partial result. Blocks are computed on demand and only the most
+  recently used ones are kept.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+PROJECTION_MODES = ("max", "mean", "sum")
+
+
+class slabProjector(object):
+    def __init__(self, mode="max", maxCachedBlocks=3):
+        """
+        mode - one of PROJECTION_MODES
+        maxCachedBlocks - the number of max-projection blocks to keep. Two are needed for
+                          smooth scrolling; one extra avoids thrashing when the user scrolls
+                          back and forth.
+        """
+        if mode not in PROJECTION_MODES:
+            raise ValueError("Unknown projection mode {}. Valid modes are {}".format(mode, PROJECTION_MODES))
+
+        self.mode = mode
+        self.maxCachedBlocks = maxCachedBlocks
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all incremental state. Called automatically when the source data change.
+        """
+        self._source = None
+        self._halfWidth = None
+
+        # Running sum state
+        self._sum = None
+        self._lo = None
+        self._hi = None
+
+        # Max-projection blocks: block index -> (forward running max, backward running max)
+        self._blocks = OrderedDict()
+
+    def nbytes(self):
+        """
+        Return the number of bytes held in incremental state
+        """
+        n_bytes = 0 if self._sum is None else self._sum.nbytes
+        for forward, backward in self._blocks.values():
+            n_bytes += forward.nbytes + backward.nbytes
+        return n_bytes
+
+    def project(self, volume, sliceToPlot, halfWidth, source=None):
+        """
+        Return the projection of volume[sliceToPlot-halfWidth : sliceToPlot+halfWidth+1]
+        along the first dimension.
+
+        volume - 3D array whose first dimension is the one we project along
+        source - any object identifying the underlying data (e.g. the un-swapped array). If it
+                 differs from the previous call the incremental state is discarded.
+        """
+        if source is None:
+            source = volume
+
+        if source is not self._source or halfWidth != self._halfWidth:
+            self.reset()
+            self._source = source
+            self._halfWidth = halfWidth
+
+        n_slices = volume.shape[0]
+        lo = max(0, sliceToPlot - halfWidth)
+        hi = min(n_slices - 1, sliceToPlot + halfWidth)
+
+        if hi < lo:  # slab lies entirely outside the stack
+            return np.zeros(volume.shape[1:], dtype=volume.dtype)
+
+        if halfWidth == 0:
+            return volume[lo]
+
+        if self.mode == "max":
+            return self._max(volume, lo, hi, 2 * halfWidth + 1)
+
+        projection = self._runningSum(volume, lo, hi)
+        if self.mode == "mean":
+            return projection / float(hi - lo + 1)
+        return projection.copy()  # the running sum is updated in place on the next call
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Sum and mean
+    def _runningSum(self, volume, lo, hi):
+        """
+        Update the running sum so that it covers slices lo to hi (inclusive)
+        """
+        if self._sum is not None:
+            n_changed = abs(lo - self._lo) + abs(hi - self._hi)
+            overlaps = lo <= self._hi and hi >= self._lo
+            if overlaps and n_changed < hi - lo + 1:
+                # Slices entering and leaving the slab
+                for ii in range(lo, self._lo):
+                    self._sum += volume[ii]
+                for ii in range(self._lo, lo):
+                    self._sum -= volume[ii]
+                for ii in range(self._hi + 1, hi + 1):
+                    self._sum += volume[ii]
+                for ii in range(hi + 1, self._hi + 1):
+                    self._sum -= volume[ii]
+                self._lo, self._hi = lo, hi
+                return self._sum
+
+        # Nothing to re-use, so compute from scratch
+        self._sum = volume[lo:hi + 1].sum(axis=0, dtype=self._accumulatorType(volume.dtype))
+        self._lo, self._hi = lo, hi
+        return self._sum
+
+    @staticmethod
+    def _accumulatorType(dtype):
+        if np.issubdtype(dtype, np.integer) or np.issubdtype(dtype, np.bool_):
+            return np.int64
+        return np.float64
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Max
+    def _max(self, volume, lo, hi, blockSize):
+        """
+        Maximum over slices lo to hi (inclusive) using forward/backward running maxima in blocks
+        of length blockSize. hi-lo+1 never exceeds blockSize.
+        """
+        first_block = lo // blockSize
+        last_block = hi // blockSize
+        first_start = first_block * blockSize
+        last_start = last_block * blockSize
+
+        if first_block != last_block:
+            _, backward = self._block(volume, first_block, blockSize)
+            forward, _ = self._block(volume, last_block, blockSize)
+            return np.maximum(backward[lo - first_start], forward[hi - last_start])
+
+        block_end = min(first_start + blockSize, volume.shape[0]) - 1
+        if lo == first_start:
+            forward, _ = self._block(volume, first_block, blockSize)
+            return forward[hi - first_start]
+        if hi == block_end:
+            _, backward = self._block(volume, first_block, blockSize)
+            return backward[lo - first_start]
+
+        # A short slab in the middle of a block can only happen if the stack is oddly
+        # clipped. Just compute it directly.
+        return volume[lo:hi + 1].max(axis=0)
+
+    def _block(self, volume, blockIndex, blockSize):
+        if blockIndex in self._blocks:
+            self._blocks.move_to_end(blockIndex)
+            return self._blocks[blockIndex]
+
+        start = blockIndex * blockSize
+        block = np.asarray(volume[start:start + blockSize])
+        forward = np.maximum.accumulate(block, axis=0)
+        backward = np.maximum.accumulate(block[::-1], axis=0)[::-1]
+
+        self._blocks[blockIndex] = (forward, backward)
+        while len(self._blocks) > self.maxCachedBlocks:
+            self._blocks.popitem(last=False)
+
+        return forward, backward
@@ -0,0 +1,176 @@
+"""
+Display levels chosen separately for every slice of a stack (per-slice auto-contrast).
+
+Intensity often changes several-fold through a stack (e.g. from the surface of a brain to the
+deep sections) so no single pair of levels suits every slice. Instead the levels of a slice
+are set to two percentiles of its values. The percentiles of each slice are computed once and
+stored in one small (nSlices x 2) array per axis, so moving to a slice that was seen before
+costs a single look-up.
+
+Percentiles are estimated from an evenly spaced sample of at most MAX_SAMPLES pixels of the
+slice. The same sample is used whether a slice is computed on demand (the first time it is
+shown) or in the background for the whole stack, so both give the same levels.
+"""
+
+import threading
+import warnings
+
+import numpy as np
+
+
+MAX_SAMPLES = 2 ** 16  # Pixels per slice on which the percentiles are based
+
+
+def sampleStride(shape):
+    """
+    Return the step along both dimensions of a 2-D slice of shape that leaves at most MAX_SAMPLES pixels
+    """
+    n_pixels = shape[0] * shape[1]
+    return max(1, int(np.ceil(np.sqrt(n_pixels / float(MAX_SAMPLES)))))
+
+
+def slicePercentiles(images, percentiles):
+    """
+    Return the percentiles of each slice of images (nSlices x X x Y, already subsampled) as an
+    nSlices x len(percentiles) float32 array. Non-finite values are ignored.
+    """
+    images = np.asarray(images)
+    flat = images.reshape(images.shape[0], -1)
+    if flat.dtype.kind == "f":
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # slices with no finite values give NaN
+            flat = np.where(np.isfinite(flat), flat, np.nan)
+            levels = np.nanpercentile(flat, percentiles, axis=1)
+    else:
+        levels = np.percentile(flat, percentiles, axis=1)
+    return np.asarray(levels, dtype=np.float32).T
+
+
+class sliceLevels(object):
+    """
+    The per-slice levels of one stack. Levels are stored per axis and are reset when the data
+    they were computed from change (see sourceKey in levels).
+    """
+
+    def __init__(self, percentiles=(0.5, 99.5)):
+        self.percentiles = tuple(float(p) for p in percentiles)
+        self._levels = [None, None, None]  # nSlices x 2 float32 per axis. NaN until computed.
+        self._sourceKey = None
+        self._lock = threading.Lock()
+        self._worker = None
+        self._stopWorker = threading.Event()
+
+    def levels(self, axisToPlot, sliceToPlot, nSlices, sourceKey, getImage):
+        """
+        Return [min, max] for slice sliceToPlot along axisToPlot, computing it the first time
+        it is asked for.
+        nSlices - number of slices along axisToPlot
+        sourceKey - identifies the data the slices come from. A new key discards all levels.
+        getImage - function returning the 2-D slice. Only called if the levels are not known.
+        """
+        with self._lock:
+            self._checkSource(sourceKey)
+            axis_levels = self._axisLevels(axisToPlot, nSlices)
+            row = axis_levels[sliceToPlot].copy()
+        if not np.isnan(row[0]):
+            return self._ordered(row)
+
+        image = getImage()
+        stride = sampleStride(image.shape)
+        row = slicePercentiles(image[np.newaxis, ::stride, ::stride], self.percentiles)[0]
+        with self._lock:
+            if self._sourceKey == sourceKey and self._levels[axisToPlot] is axis_levels:
+                axis_levels[sliceToPlot] = row
+        return self._ordered(row)
+
+    @staticmethod
+    def _ordered(row):
+        """
+        Levels as a list, made valid if the slice is uniform or entirely non-finite
+        """
+        low, high = float(row[0]), float(row[1])
+        if not np.isfinite(low) or not np.isfinite(high):
+            return [0.0, 1.0]
+        if high <= low:
+            high = low + 1
+        return [low, high]
+
+    def _checkSource(self, sourceKey):
+        # Called with the lock held
+        if sourceKey != self._sourceKey:
+            self._sourceKey = sourceKey
+            self._levels = [None, None, None]
+            self._stopWorker.set()
+
+    def _axisLevels(self, axisToPlot, nSlices):
+        # Called with the lock held
+        axis_levels = self._levels[axisToPlot]
+        if axis_levels is None or axis_levels.shape[0] != nSlices:
+            axis_levels = np.full((nSlices, 2), np.nan, dtype=np.float32)
+            self._levels[axisToPlot] = axis_levels
+        return axis_levels
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Background computation
+    def precompute(self, data, sourceKey, chunkSize=16):
+        """
+        Compute the levels of every slice of the 3-D array data along all three axes on a
+        background thread. Slices that have already been computed are skipped. Stops early if
+        the source changes or stop is called.
+        """
+        self.stop()
+        with self._lock:
+            self._checkSource(sourceKey)
+            self._stopWorker = threading.Event()
+            stop_event = self._stopWorker
+        self._worker = threading.Thread(
+            target=self._precompute, args=(data, sourceKey, chunkSize, stop_event), name="sliceLevels"
+        )
+        self._worker.daemon = True
+        self._worker.start()
+
+    def _precompute(self, data, sourceKey, chunkSize, stopEvent):
+        for axis_to_plot in range(3):
+            slices = data.swapaxes(0, axis_to_plot)
+            stride = sampleStride(slices.shape[1:])
+            with self._lock:
+                if self._sourceKey != sourceKey:
+                    return
+                axis_levels = self._axisLevels(axis_to_plot, slices.shape[0])
+
+            for first in range(0, slices.shape[0], chunkSize):
+                if stopEvent.is_set():
+                    return
+                last = min(first + chunkSize, slices.shape[0])
+                with self._lock:
+                    if not np.isnan(axis_levels[first:last, 0]).any():
+                        continue
+                # The subsampling reads only the sampled rows of a memory-mapped stack
+                rows = slicePercentiles(slices[first:last, ::stride, ::stride], self.percentiles)
+                with self._lock:
+                    if self._sourceKey != sourceKey or self._levels[axis_to_plot] is not axis_levels:
+                        return
+                    missing = np.isnan(axis_levels[first:last, 0])
+                    axis_levels[first:last][missing] = rows[missing]
+
+    def isComplete(self):
+        with self._lock:
+            return all(levels is not None and not np.isnan(levels).any() for levels in self._levels)
+
+    def stop(self):
+        """
+        Stop the background computation, if any. Does not wait for the current chunk to finish.
+        """
+        self._stopWorker.set()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Housekeeping
+    def nbytes(self):
+        with self._lock:
+            return sum(levels.nbytes for levels in self._levels if levels is not None)
+
+    def clear(self):
+        self.stop()
+        with self._lock:
+            self._levels = [None, None, None]
+            self._sourceKey = None
@@ -0,0 +1,288 @@
+"""
+Render orthogonal slices of stacks, with point and line overlays, to RGBA arrays without Qt.
+
+This is the part of drawing the views that does not need a Lasagna window, so that slices can
+be rendered in scripts and batch jobs (see lasagna.render_cli). It follows what the views show:
+
+* a stack is sliced as imagestack.data(axisToPlot)[sliceToPlot] and mapped through its display
+  levels and colour map exactly as the views do (image_processing.render_table and colorMapLUT)
+* stacks are composited additively, as QPainter.CompositionMode_Plus does for the image layers
+* points and lines within zSpread - 1 slices of the shown slice are drawn over the images.
+  Points further from the slice are smaller and more transparent, as in sparsepoints. Symbol
+  sizes and line widths are in voxels rather than screen pixels.
+
+Returned images have one row per display row: rgba[y, x], with y increasing downwards as in the
+views. Only numpy is needed.
+"""
+
+import warnings
+
+import numpy as np
+
+from lasagna.image_processing.render_table import asRGBA, levelRows, rowsToImage
+from lasagna.image_processing.slice_levels import sampleStride, slicePercentiles
+
+
+COLOR_NAMES = ("gray", "red", "green", "blue", "magenta", "cyan", "yellow")
+
+
+def colorName2value(colorName, nVal=255, alpha=255):
+    """
+    Return the RGBA colour at the top of the named colour map. Unknown names give gray.
+    """
+    colorName = colorName.lower()
+    color_dict = {
+        "gray": [nVal, nVal, nVal, alpha],
+        "red": [nVal, 0, 0, alpha],
+        "green": [0, nVal, 0, alpha],
+        "blue": [0, 0, nVal, alpha],
+        "magenta": [nVal, 0, nVal, alpha],
+        "cyan": [0, nVal, nVal, alpha],
+        "yellow": [nVal, nVal, 0, alpha],
+    }
+    if colorName in color_dict:
+        return color_dict[colorName]
+    print("no pre-defined colormap %s. reverting to gray " % colorName)
+    return color_dict["gray"]
+
+
+def colorMapLUT(colorName, alpha=255, nVal=255):
+    """
+    Return the (nVal + 1) x 4 uint8 colour map running from opaque black to the named colour
+    with opacity alpha (0-nVal). The same table pyqtgraph.ColorMap builds from these two stops.
+    """
+    start = np.array([0, 0, 0, nVal], dtype=np.float64)
+    stop = np.array(colorName2value(colorName, nVal=nVal, alpha=alpha), dtype=np.float64)
+    x = np.linspace(0.0, 1.0, nVal + 1)
+    lut = np.empty((nVal + 1, 4), dtype=np.ubyte)
+    for channel in range(4):
+        lut[:, channel] = np.interp(x, [0.0, 1.0], [start[channel], stop[channel]])
+    return lut
+
+
+def orthogonalSlice(data, axisToPlot, sliceToPlot):
+    """
+    Return slice sliceToPlot along axisToPlot of the 3-D array data, indexed [x, y] as the views
+    show it. Reads only that slice of a memory-mapped array.
+    """
+    return data.swapaxes(0, axisToPlot)[sliceToPlot]
+
+
+def percentileLevels(data, percentiles=(0.5, 99.5)):
+    """
+    Display levels for data (any shape) set to two percentiles of an evenly spaced sample of it
+    """
+    data = np.asarray(data)
+    if data.ndim == 2:
+        data = data[np.newaxis]
+    stride = sampleStride(data.shape[-2:])
+    step = max(1, data.shape[0] // 16)  # a few slices are enough for levels
+    low, high = slicePercentiles(data[::step, ::stride, ::stride].reshape(1, -1, 1), percentiles)[0]
+    if not np.isfinite(low) or not np.isfinite(high):
+        return [0.0, 1.0]
+    return [float(low), float(max(high, low + 1))]
+
+
+def applyLevels(image, levels, lut):
+    """
+    Return the 2-D image mapped through the display range levels and colour map lut as RGBA
+    """
+    lut = asRGBA(lut)
+    rows = levelRows(image, levels, lut.shape[0])
+    if lut.shape[0] > 256:
+        return rowsToImage(rows, lut)
+    return lut[rows.astype(np.intp)]
+
+
+def composite(images):
+    """
+    Add the RGBA images, each premultiplied by its alpha, onto black as CompositionMode_Plus does.
+    Returns an opaque RGBA uint8 image.
+    """
+    total = None
+    for image in images:
+        premultiplied = image[..., :3].astype(np.float32) * (image[..., 3:4].astype(np.float32) / 255)
+        total = premultiplied if total is None else total + premultiplied
+    out = np.empty(total.shape[:2] + (4,), dtype=np.ubyte)
+    out[..., :3] = np.clip(np.round(total), 0, 255)
+    out[..., 3] = 255
+    return out
+
+
+def _blend(rgba, xs, ys, color, alpha):
+    """
+    Draw color (RGB) with opacity alpha (0-255) over the pixels (xs, ys) of rgba[y, x]
+    """
+    keep = (xs >= 0) & (ys >= 0) & (xs < rgba.shape[1]) & (ys < rgba.shape[0])
+    xs, ys = xs[keep], ys[keep]
+    weight = float(alpha) / 255
+    pixels = rgba[ys, xs, :3].astype(np.float32)
+    rgba[ys, xs, :3] = np.round(pixels * (1 - weight) + np.asarray(color[:3], np.float32) * weight)
+
+
+def _disc(radius):
+    """
+    Offsets (dx, dy) of the pixels of a filled disc of the given radius
+    """
+    r = int(np.ceil(radius))
+    dx, dy = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = dx ** 2 + dy ** 2 <= max(radius, 0.5) ** 2
+    return dx[inside], dy[inside]
+
+
+def projectOverlay(points, axisToPlot):
+    """
+    Return the in-plane (x, y) coordinates and the depth of the n x 3 points (Z, X, Y) in the
+    view slicing along axisToPlot, as sparsepoints.data and lines.data do
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    depth = points[:, axisToPlot]
+    xy = np.delete(points, axisToPlot, 1)
+    if axisToPlot == 2:
+        xy = np.fliplr(xy)
+    return xy, depth
+
+
+def drawPoints(rgba, points, axisToPlot, sliceToPlot, color, size=5, alpha=255, zSpread=1):
+    """
+    Draw the points (n x 3, Z X Y voxel coordinates) that lie within zSpread - 1 slices of
+    sliceToPlot onto rgba[y, x] in place. Points off the slice are drawn smaller and fainter.
+    """
+    xy, depth = projectOverlay(points, axisToPlot)
+    distance = np.abs(np.round(depth) - sliceToPlot)
+    for (x, y), d in zip(xy[distance <= zSpread - 1], distance[distance <= zSpread - 1]):
+        point_size = max(size - d * 2, 1)
+        point_alpha = max(alpha - d * 20, 10)
+        dx, dy = _disc(point_size / 2.0)
+        _blend(rgba, int(round(x)) + dx, int(round(y)) + dy, color, point_alpha)
+
+
+def drawLines(rgba, points, axisToPlot, sliceToPlot, color, width=1, alpha=255, zSpread=1):
+    """
+    Draw the polyline through the points (n x 3, Z X Y voxel coordinates) onto rgba[y, x] in
+    place. Rows of NaNs separate lines. Vertices more than zSpread - 1 slices from sliceToPlot
+    break the line, as in lines.plotIngredient.
+    """
+    xy, depth = projectOverlay(points, axisToPlot)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # NaN rows
+        off_slice = np.abs(np.round(depth) - sliceToPlot) > zSpread - 1
+    xy[off_slice | ~np.isfinite(depth)] = np.nan
+
+    dx, dy = _disc(width / 2.0)
+    for start, stop in zip(xy[:-1], xy[1:]):
+        if not (np.all(np.isfinite(start)) and np.all(np.isfinite(stop))):
+            continue
+        n_steps = int(np.ceil(np.abs(stop - start).max())) + 1
+        t = np.linspace(0.0, 1.0, n_steps)
+        xs = np.round(start[0] + (stop[0] - start[0]) * t).astype(np.intp)
+        ys = np.round(start[1] + (stop[1] - start[1]) * t).astype(np.intp)
+        pixels = set(zip((xs[:, None] + dx).ravel(), (ys[:, None] + dy).ravel()))  # each pixel once
+        if pixels:
+            pixel_x, pixel_y = (np.array(c, dtype=np.intp) for c in zip(*pixels))
+            _blend(rgba, pixel_x, pixel_y, color, alpha)
+
+
+class stackLayer(object):
+    """
+    An image stack to render: the data (a 3-D array, possibly memory-mapped) with its display
+    levels, colour map and opacity (0-100, as imagestack.alpha is set). Levels default to the
+    0.5th and 99.5th percentiles of the data.
+    """
+
+    def __init__(self, data, levels=None, lut="gray", alpha=100):
+        self.data = data
+        self.levels = percentileLevels(data) if levels is None else levels
+        self.lut = colorMapLUT(lut, int(255 * (alpha / 100.0))) if isinstance(lut, str) else asRGBA(lut)
+
+    def render(self, axisToPlot, sliceToPlot):
+        image = np.asarray(orthogonalSlice(self.data, axisToPlot, sliceToPlot))
+        return applyLevels(image, self.levels, self.lut).swapaxes(0, 1)  # [x, y] -> [y, x]
+
+
+class overlayLayer(object):
+    """
+    Points or lines to draw over the stacks. points is an n x 3 array of (Z, X, Y) voxel
+    coordinates. For lines, rows of NaNs separate the lines. zSpread is one value or one per
+    axis, as the defaultPointZSpread preference.
+    """
+
+    def __init__(self, points, color=(255, 0, 0), size=5, alpha=255, zSpread=1, connect=False):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.color = tuple(color)
+        self.size = size
+        self.alpha = alpha
+        self.zSpread = zSpread
+        self.connect = connect
+
+    def draw(self, rgba, axisToPlot, sliceToPlot):
+        z_spread = self.zSpread[axisToPlot] if np.ndim(self.zSpread) else self.zSpread
+        if self.connect:
+            drawLines(rgba, self.points, axisToPlot, sliceToPlot, self.color, self.size, self.alpha, z_spread)
+        else:
+            drawPoints(rgba, self.points, axisToPlot, sliceToPlot, self.color, self.size, self.alpha, z_spread)
+
+
+def renderSlice(stacks, axisToPlot, sliceToPlot, overlays=()):
+    """
+    Return slice sliceToPlot along axisToPlot as an RGBA uint8 array [y, x]: the stackLayers
+    composited in order, with the overlayLayers drawn on top. The stacks must have the same shape.
+    """
+    rgba = composite([stack.render(axisToPlot, sliceToPlot) for stack in stacks])
+    for overlay in overlays:
+        overlay.draw(rgba, axisToPlot, sliceToPlot)
+    return rgba
+
+
+def resize(rgba, maxSize):
+    """
+    Shrink rgba (nearest neighbour) so that neither side is longer than maxSize. Never enlarges.
+    """
+    scale = float(maxSize) / max(rgba.shape[:2])
+    if scale >= 1:
+        return rgba
+    rows = (np.arange(max(1, int(rgba.shape[0] * scale))) / scale).astype(np.intp)
+    cols = (np.arange(max(1, int(rgba.shape[1] * scale))) / scale).astype(np.intp)
+    return rgba[rows][:, cols]
+
+
+def montage(images, columns=None, gap=2):
+    """
+    Tile the RGBA images row by row, columns per row (default: all in one row), on black
+    """
+    if not images:
+        return np.zeros((0, 0, 4), dtype=np.ubyte)
+    columns = len(images) if columns is None else max(1, columns)
+    n_rows = int(np.ceil(len(images) / float(columns)))
+    cell_h = max(image.shape[0] for image in images)
+    cell_w = max(image.shape[1] for image in images)
+    out = np.zeros((n_rows * cell_h + (n_rows - 1) * gap, columns * cell_w + (columns - 1) * gap, 4), dtype=np.ubyte)
+    out[..., 3] = 255
+    for ii, image in enumerate(images):
+        top = (ii // columns) * (cell_h + gap)
+        left = (ii % columns) * (cell_w + gap)
+        out[top:top + image.shape[0], left:left + image.shape[1]] = image
+    return out
+
+
+def writePNG(fname, rgba):
+    """
+    Save the RGBA uint8 image rgba[y, x] as a PNG file using only the standard library
+    """
+    import struct
+    import zlib
+
+    rgba = np.ascontiguousarray(rgba, dtype=np.ubyte)
+    height, width = rgba.shape[:2]
+    raw = np.zeros((height, width * 4 + 1), dtype=np.ubyte)  # each row starts with filter type 0
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+
+    def chunk(kind, payload):
+        return (struct.pack(">I", len(payload)) + kind + payload
+                + struct.pack(">I", zlib.crc32(kind + payload) & 0xFFFFFFFF))
+
+    with open(fname, "wb") as fid:
+        fid.write(b"\x89PNG\r\n\x1a\n")
+        fid.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        fid.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        fid.write(chunk(b"IEND", b""))
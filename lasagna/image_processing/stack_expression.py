@@ -0,0 +1,140 @@
+"""
+Arithmetic expressions over image stacks, e.g. "a - b", "a / b" or "where(b > 0, a, 0)".
+
+Expressions are parsed once with the ast module and only a small set of operations is allowed:
+arithmetic, comparisons, & | ~, numbers, variable names and the functions in FUNCTIONS.
+Nothing else (attribute access, indexing, arbitrary calls) is accepted, so an expression
+typed by the user can not run arbitrary code.
+
+The variables are bound to arrays when the expression is evaluated. The arrays are normally
+single slices, so evaluating an expression costs no more memory than the displayed image.
+"""
+
+import ast
+
+import numpy as np
+
+
+# Expressions for common comparisons. "t" is a threshold supplied as a constant.
+PRESETS = {
+    "difference": "a - b",
+    "ratio": "a / b",
+    "masked": "where(b > 0, a, 0)",
+    "thresholded": "where(a > t, a, 0)",
+}
+
+FUNCTIONS = {
+    "abs": np.abs,
+    "where": np.where,
+    "minimum": np.minimum,
+    "maximum": np.maximum,
+    "clip": np.clip,
+    "log": np.log,
+    "log10": np.log10,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+}
+
+_BINARY_OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+    ast.BitAnd: np.logical_and,
+    ast.BitOr: np.logical_or,
+}
+
+_COMPARISONS = {
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+
+
+class stackExpression(object):
+    def __init__(self, expression):
+        """
+        expression - a string such as "a - b". Raises ValueError if it can not be parsed
+                     or uses anything that is not allowed.
+        """
+        self.expression = expression
+        try:
+            self._tree = ast.parse(expression, mode="eval").body
+        except SyntaxError as err:
+            raise ValueError("Can not parse expression '%s': %s" % (expression, err))
+
+        self.names = []  # variable names in order of appearance
+        self._check(self._tree)
+
+    def _check(self, node):
+        if isinstance(node, ast.BinOp):
+            if type(node.op) not in _BINARY_OPERATORS:
+                raise ValueError("Operator %s is not allowed" % type(node.op).__name__)
+            self._check(node.left)
+            self._check(node.right)
+        elif isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, (ast.USub, ast.UAdd, ast.Invert)):
+                raise ValueError("Operator %s is not allowed" % type(node.op).__name__)
+            self._check(node.operand)
+        elif isinstance(node, ast.Compare):
+            if len(node.ops) != 1 or type(node.ops[0]) not in _COMPARISONS:
+                raise ValueError("Only single comparisons (e.g. a > 0) are allowed")
+            self._check(node.left)
+            self._check(node.comparators[0])
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+                raise ValueError("Only these functions are allowed: %s" % ", ".join(sorted(FUNCTIONS)))
+            [self._check(arg) for arg in node.args]
+        elif isinstance(node, ast.Name):
+            if node.id in FUNCTIONS:
+                raise ValueError("%s is a function" % node.id)
+            if node.id not in self.names:
+                self.names.append(node.id)
+        elif isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float)):
+                raise ValueError("Only numeric constants are allowed")
+        else:
+            raise ValueError("'%s' is not allowed in a stack expression" % type(node).__name__)
+
+    def evaluate(self, variables):
+        """
+        Evaluate the expression. variables is a dictionary of name -> array (or number).
+        The result is float32. Values that are not finite (e.g. division by zero) are set to zero.
+        """
+        missing = [name for name in self.names if name not in variables]
+        if missing:
+            raise ValueError("No value for %s in expression '%s'" % (", ".join(missing), self.expression))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = np.asarray(self._evaluate(self._tree, variables), dtype=np.float32)
+        result[~np.isfinite(result)] = 0
+        return result
+
+    def _evaluate(self, node, variables):
+        if isinstance(node, ast.BinOp):
+            return _BINARY_OPERATORS[type(node.op)](
+                self._evaluate(node.left, variables), self._evaluate(node.right, variables)
+            )
+        if isinstance(node, ast.UnaryOp):
+            operand = self._evaluate(node.operand, variables)
+            if isinstance(node.op, ast.USub):
+                return np.negative(operand)
+            if isinstance(node.op, ast.Invert):
+                return np.logical_not(operand)
+            return operand
+        if isinstance(node, ast.Compare):
+            return _COMPARISONS[type(node.ops[0])](
+                self._evaluate(node.left, variables), self._evaluate(node.comparators[0], variables)
+            )
+        if isinstance(node, ast.Call):
+            return FUNCTIONS[node.func.id](*[self._evaluate(arg, variables) for arg in node.args])
+        if isinstance(node, ast.Name):
+            value = variables[node.id]
+            if isinstance(value, np.ndarray) and not np.issubdtype(value.dtype, np.floating):
+                value = value.astype(np.float32)  # so that a - b does not wrap around for unsigned data
+            return value
+        return node.value
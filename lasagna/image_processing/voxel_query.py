@@ -0,0 +1,34 @@
+"""
+Read single voxels from stack data for the status bar and plugins.
+
+The image shown in a view may be a projection, a filtered, resampled or quantised version of
+the slice, so values are read from the stack data instead. Indexing a memory-mapped or chunked
+(lazy) array with a single voxel reads only the page or chunk that holds it.
+"""
+
+import numpy as np
+
+
+def voxelAt(data, index):
+    """
+    Return the value of data at the integer index (one entry per dimension) as a Python scalar,
+    or None if index falls outside data
+    """
+    if data is None or len(index) != len(data.shape):
+        return None
+    for i, n in zip(index, data.shape):
+        if i < 0 or i >= n:
+            return None
+    value = data[tuple(index)]
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def formatVoxelValue(value):
+    """
+    Format a value returned by voxelAt for the status bar
+    """
+    if value is None:
+        return "-"
+    if isinstance(value, float) and not value.is_integer():
+        return "%0.4g" % value
+    return "%d" % value
@@ -0,0 +1,84 @@
+"""
+Index of the ingredients loaded into Lasagna by name and by type.
+
+Ingredients are looked up by name or type many times per mouse event (plugin hooks, level
+changes, the status bar), and a session may hold hundreds of ingredients (e.g. one point
+series per cell class). The registry answers those look-ups with a dictionary access rather
+than a scan of Lasagna.ingredientList. It is kept in sync by Lasagna.addIngredient and
+Lasagna.removeIngredient and keeps ingredients in the order they were added.
+
+The type of an ingredient is the name of the module defining its class (e.g. 'imagestack').
+An ingredient is also registered under the types of the classes it derives from, so a
+labelstack is found among the imagestacks.
+"""
+
+from collections import OrderedDict
+
+
+def ingredientTypes(ingredient):
+    """
+    Return the type names of ingredient: its own and those of the classes it derives from
+    """
+    return [cls.__module__.rsplit(".", 1)[-1] for cls in type(ingredient).__mro__ if cls is not object]
+
+
+class IngredientRegistry(object):
+    def __init__(self):
+        self._byName = OrderedDict()
+        self._byType = dict()  # type name -> OrderedDict of name -> ingredient
+
+    def add(self, ingredient):
+        """
+        Register ingredient, replacing any ingredient with the same name
+        """
+        if ingredient.objectName in self._byName:
+            self.remove(self._byName[ingredient.objectName])
+        self._byName[ingredient.objectName] = ingredient
+        for type_name in ingredientTypes(ingredient):
+            self._byType.setdefault(type_name, OrderedDict())[ingredient.objectName] = ingredient
+
+    def remove(self, ingredient):
+        if self._byName.get(ingredient.objectName) is not ingredient:
+            return
+        del self._byName[ingredient.objectName]
+        for type_name in ingredientTypes(ingredient):
+            same_type = self._byType.get(type_name)
+            if same_type is not None:
+                same_type.pop(ingredient.objectName, None)
+                if not same_type:
+                    del self._byType[type_name]
+
+    def reorder(self, ingredients):
+        """
+        Put the registered ingredients in the order of the list ingredients (e.g. Lasagna.ingredientList)
+        """
+        for ingredient in ingredients:
+            if ingredient in self:
+                self.remove(ingredient)
+                self.add(ingredient)
+
+    def byName(self, objectName):
+        """
+        Return the ingredient called objectName or None
+        """
+        return self._byName.get(objectName)
+
+    def byType(self, ingredientType):
+        """
+        Return a list of the ingredients of type ingredientType (e.g. 'imagestack'), including
+        those whose class derives from it
+        """
+        return list(self._byType.get(ingredientType, dict()).values())
+
+    def isOfType(self, ingredient, ingredientType):
+        same_type = self._byType.get(ingredientType)
+        return same_type is not None and same_type.get(ingredient.objectName) is ingredient
+
+    def names(self):
+        return list(self._byName.keys())
+
+    def __len__(self):
+        return len(self._byName)
+
+    def __contains__(self, ingredient):
+        return self._byName.get(getattr(ingredient, "objectName", None)) is ingredient
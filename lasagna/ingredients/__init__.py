@@ -1 +1 @@
-from . import imagestack, sparsepoints, lines
+from . import imagestack, labelstack, derivedstack, timeseriesstack, sparsepoints, lines
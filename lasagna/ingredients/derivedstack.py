@@ -0,0 +1,297 @@
+"""
+This class defines a virtual image stack that is computed from other image stacks by an expression,
+e.g. the difference "a - b" between a registered image and the fixed image.
+
+Nothing is computed up front. The expression is evaluated only on the slice that each axis is
+showing, and the result is cached per axis until the slice or one of the source stacks changes.
+A derived stack therefore costs a few slices of memory rather than a whole volume.
+
+The sources are looked up by name every time, so a derived stack simply shows nothing if one
+of them is removed and shows the new data if one is reloaded.
+"""
+
+import weakref
+
+import numpy as np
+from PyQt5 import QtCore, QtWidgets
+
+from lasagna.image_processing.stack_expression import stackExpression
+from lasagna.ingredients.imagestack import imagestack
+from lasagna.io_libs.image_stack_loader import save_stack
+
+
+class derivedVolume(object):
+    """
+    Stands in for the volume of a derived stack as seen by one axis. Provides .shape, .size and
+    integer indexing (returning the evaluated slice) which is all that plotting needs.
+    """
+
+    def __init__(self, stack, axisToPlot):
+        self.stack = stack
+        self.axisToPlot = axisToPlot
+        shape = list(stack.shape())
+        shape[0], shape[axisToPlot] = shape[axisToPlot], shape[0]
+        self.shape = tuple(shape)
+        self.size = int(np.prod(self.shape))
+
+    def __getitem__(self, sliceToPlot):
+        return self.stack.evaluateSlice(self.axisToPlot, sliceToPlot)
+
+
+class derivedstack(imagestack):
+    def __init__(
+        self,
+        parent=None,
+        data=None,
+        fnameAbsPath="",
+        enable=True,
+        objectName="",
+        expression="a - b",
+        sources=None,
+        constants=None,
+        minMax=None,
+        lut="gray",
+    ):
+        """
+        expression - e.g. "a - b". See lasagna.image_processing.stack_expression
+        sources - dictionary of expression variable name -> objectName of an image stack
+        constants - dictionary of expression variable name -> number (e.g. {'t': 100})
+        data is ignored: derived stacks hold no data of their own
+        """
+        self.expression = stackExpression(expression)
+        self.sources = dict(sources) if sources else dict()
+        self.constants = dict(constants) if constants else dict()
+
+        self._checkBindings()
+
+        self._sliceCache = [None, None, None]  # per axis: (key, evaluated slice)
+
+        super(derivedstack, self).__init__(
+            parent,
+            None,
+            fnameAbsPath,
+            enable,
+            objectName,
+            minMax=minMax,
+            lut=lut,
+        )
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Sources
+    def _checkBindings(self):
+        unbound = [n for n in self.expression.names if n not in self.sources and n not in self.constants]
+        if unbound:
+            raise ValueError("derivedstack - no source stack or constant for %s" % ", ".join(unbound))
+        if not any(n in self.sources for n in self.expression.names):
+            raise ValueError("derivedstack - the expression must use at least one source stack")
+
+    def firstSourceName(self):
+        """
+        The variable name of the first source stack in the expression. It defines the shape.
+        """
+        return [n for n in self.expression.names if n in self.sources][0]
+
+    def sourceIngredients(self):
+        """
+        Return a dictionary of variable name -> source ingredient, or None if a source is missing
+        """
+        ingredients = dict()
+        for name, object_name in self.sources.items():
+            ingredient = self.parent.returnIngredientByName(object_name)
+            if not ingredient or ingredient is self:
+                return None
+            ingredients[name] = ingredient
+        return ingredients
+
+    def shape(self):
+        """
+        Shape of the derived volume, which is that of the first source. Zeros if a source is missing.
+        """
+        ingredients = self.sourceIngredients()
+        if not ingredients:
+            return (0, 0, 0)
+        return tuple(ingredients[self.firstSourceName()].displayShape(0))
+
+    def data(self, axisToPlot=0):
+        return derivedVolume(self, axisToPlot)
+
+    @staticmethod
+    def _dataReference(ingredient):
+        """
+        Something that identifies the current data (and grid) of a source without keeping them alive
+        """
+        if isinstance(ingredient._data, np.ndarray):
+            return weakref.ref(ingredient._data), ingredient.gridKey()
+        return ingredient  # another derived stack: its own cache keeps track of its sources
+
+    def _filterSourceKey(self):
+        ingredients = self.sourceIngredients() or dict()
+        return (self.expression.expression, tuple(sorted(self.constants.items()))) + tuple(
+            (name, ingredient._filterSourceKey()) for name, ingredient in sorted(ingredients.items())
+        )
+
+    def _cacheIsValid(self, key, ingredients, sliceToPlot):
+        cached_slice, references = key
+        if cached_slice != sliceToPlot or len(references) != len(ingredients):
+            return False
+        for name, reference in references.items():
+            current = ingredients.get(name)
+            if current is None:
+                return False
+            if isinstance(reference, tuple):
+                data_reference, grid_key = reference
+                if data_reference() is not current._data or grid_key != current.gridKey():
+                    return False
+            elif reference is not current:
+                return False
+        return True
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Evaluation
+    def evaluateSlice(self, axisToPlot, sliceToPlot):
+        """
+        Return the expression evaluated on slice sliceToPlot along axisToPlot
+        """
+        ingredients = self.sourceIngredients()
+        if ingredients is None:
+            print("derivedstack %s - a source stack is missing" % self.objectName)
+            return np.zeros((1, 1), dtype=np.float32)
+
+        cached = self._sliceCache[axisToPlot]
+        if cached is not None and self._cacheIsValid(cached[0], ingredients, sliceToPlot):
+            return cached[1]
+
+        variables = dict(self.constants)
+        for name, ingredient in ingredients.items():
+            variables[name] = ingredient.gridSlice(axisToPlot, sliceToPlot)
+        result = self._evaluate(variables)
+
+        references = {name: self._dataReference(i) for name, i in ingredients.items()}
+        self._sliceCache[axisToPlot] = ((sliceToPlot, references), result)
+        return result
+
+    def _evaluate(self, variables):
+        try:
+            return self.expression.evaluate(variables)
+        except ValueError as err:  # e.g. sources of different shapes
+            print("derivedstack %s - %s" % (self.objectName, err))
+            return np.zeros((1, 1), dtype=np.float32)
+
+    def setExpression(self, expression, sources=None, constants=None):
+        """
+        Change the expression (and optionally the sources and constants)
+        """
+        self.expression = stackExpression(expression)
+        if sources is not None:
+            self.sources = dict(sources)
+        if constants is not None:
+            self.constants = dict(constants)
+        self._checkBindings()
+        self.clearCaches()
+        self.histogram = self.calcHistogram()
+
+    def volume(self):
+        """
+        Evaluate the whole derived volume. This allocates a full-size array.
+        """
+        n_slices = self.data(0).shape[0]
+        ingredients = self.sourceIngredients()
+        out = np.empty(self.shape(), dtype=np.float32)
+        for ii in range(n_slices):
+            variables = dict(self.constants)
+            for name, ingredient in ingredients.items():
+                variables[name] = ingredient.gridSlice(0, ii)
+            out[ii] = self._evaluate(variables)
+        return out
+
+    def histogramSample(self, nValsForCalc, verbose=False):
+        """
+        Evaluate evenly spaced slices along the first axis until we have about nValsForCalc values
+        """
+        volume = self.data(0)
+        if not volume.size:
+            return np.zeros(1)
+        n_slices = volume.shape[0]
+        slice_size = max(1, volume.size // max(1, n_slices))
+        n_wanted = int(min(n_slices, max(1, nValsForCalc // slice_size), 16))
+        slices = np.linspace(0, n_slices - 1, n_wanted).astype(int)
+        if verbose:
+            print("Histogram based on %d evaluated slices" % n_wanted)
+        ingredients = self.sourceIngredients()
+        sample = []
+        for ii in slices:
+            variables = dict(self.constants)
+            for name, ingredient in ingredients.items():
+                variables[name] = ingredient.gridSlice(0, ii)
+            sample.append(self._evaluate(variables).ravel())
+        return np.concatenate(sample)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Plotting
+    def setProjectionMode(self, axisToPlot, mode=None):
+        if mode is not None:
+            print("derivedstack - slab projections are not available for derived stacks")
+
+    def renderSlice(self, axisToPlot=0, sliceToPlot=0, zSpread=None):
+        if self.sourceIngredients() is None:
+            return None  # hides the plot item
+        return super(derivedstack, self).renderSlice(axisToPlot, sliceToPlot, zSpread)
+
+    def plotObliquePlane(self, pyqtObject, plane, axisToPlot=0, sliceToPlot=0):
+        """
+        Sample each source on the oblique plane and evaluate the expression on the samples
+        """
+        ingredients = self.sourceIngredients()
+        first = ingredients[self.firstSourceName()].data(axisToPlot)
+        sampling = self.parent.axes2D[axisToPlot].obliqueSamplingRegion(first.shape[1:])
+        if sampling is None:
+            pyqtObject.setVisible(False)
+            return
+        region, out_shape = sampling
+
+        variables = dict(self.constants)
+        for name, ingredient in ingredients.items():
+            variables[name] = plane.sample(ingredient.data(axisToPlot), sliceToPlot, region, out_shape)
+
+        self.showImage(pyqtObject, self._evaluate(variables))
+        pyqtObject.setRect(QtCore.QRectF(*region))
+        pyqtObject.showsObliquePlane = True
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Sessions
+    def sessionArguments(self):
+        return dict(expression=self.expression.expression, sources=self.sources, constants=self.constants)
+
+    def sessionData(self):
+        return None  # evaluated from the source stacks
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Housekeeping
+    def cacheNbytes(self):
+        return sum(c[1].nbytes for c in self._sliceCache if c is not None)
+
+    def clearCaches(self):
+        self._sliceCache = [None, None, None]
+
+    def changeData(self, imageData, imageAbsPath, recalculateDefaultHistRange=False):
+        print("derivedstack - can not change the data of a derived stack. Change its expression instead.")
+        return False
+
+    def flipAlongAxis(self, axisToFlip):
+        print("derivedstack - flip the source stacks instead")
+
+    def rotateAlongDimension(self, axisToRotate):
+        print("derivedstack - rotate the source stacks instead")
+
+    def swapAxes(self, ax1, ax2):
+        print("derivedstack - swap the axes of the source stacks instead")
+
+    def save(self, path=None):
+        if path is None:
+            path = QtWidgets.QFileDialog.getSaveFileName(
+                self.parent, "File to save {}".format(self.objectName)
+            )
+        if not path:
+            return
+        save_stack(path, self.volume())
+        print(("%s saved as %s" % (self.objectName, path)))
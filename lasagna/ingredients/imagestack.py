@@ -2,16 +2,32 @@
 This class defines the basic imagestack and instructs lasagna as to how to handle image stacks.
 """
 
+import itertools
+import os
+import tempfile
 
 import numpy as np
-import pyqtgraph as pg
-from PyQt5 import QtGui, QtCore
-
+from PyQt5 import QtGui, QtCore, QtWidgets
+
+from lasagna.image_processing.display_filters import displayFilter, filterCache
+from lasagna.image_processing.grid_resampler import gridResampler
+from lasagna.image_processing.render_table import canQuantise, renderTable
+from lasagna.image_processing.slab_projection import slabProjector
+from lasagna.image_processing.slice_levels import sliceLevels
+from lasagna.image_processing.slice_render import colorMapLUT, colorName2value
+from lasagna.image_processing.voxel_query import voxelAt
 from lasagna.ingredients.lasagna_ingredient import lasagna_ingredient
 from lasagna.io_libs.image_stack_loader import save_stack
+from lasagna.utils import preferences
+
+# Source of imagestack._dataGeneration values. Shared by all stacks so no two data arrays get the same one.
+_dataGenerations = itertools.count()
 
 
 class imagestack(lasagna_ingredient):
+    levelsAdjustable = True  # False if the display levels must not follow the intensity histogram
+    obliqueInterpolation = None  # None uses the interpolation chosen for the oblique plane
+
     def __init__(
         self,
         parent=None,
@@ -46,6 +62,33 @@ class imagestack(lasagna_ingredient):
         # image transparency stored in _alpha. see getters and setter at end of class def
         self._alpha = (100)
 
+        # Each axis can show either the slice itself (None) or a max/mean/sum projection over the
+        # slab defined by the z-spread spin boxes. See setProjectionMode
+        self.projectionModes = [None, None, None]
+        self._slabProjectors = [None, None, None]
+
+        # Set by moveDataToDisk when the memory manager swaps the data for a memory-mapped copy
+        self.spillFile = None
+
+        # Position of the voxels in the world (see setWorldTransform). Stacks whose grid differs
+        # from that of the reference stack are resampled onto it slice by slice.
+        self.voxelSize = None  # None means unknown, in which case the stack is never resampled
+        self.origin = (0.0, 0.0, 0.0)
+        self.resampleInterpolation = "linear"
+        self._resampler = None
+
+        # Optional filter applied to the displayed slices only (see setDisplayFilter)
+        self.displayFilter = None
+        self.filterCache = filterCache()
+
+        # Levels and colour map combined into one value -> RGBA table for 8 and 16-bit slices
+        self.renderTable = renderTable()
+
+        # If autoLevels is True each slice is shown with its own levels instead of minMax
+        # (see setAutoLevels)
+        self.autoLevels = False
+        self.sliceLevels = sliceLevels(preferences.readPreference("autoLevelPercentiles"))
+
         self.build_model_for_list(objectName)
         self.model = self.parent.imageStackLayers_Model
         self.addToList()
@@ -73,12 +116,9 @@ class imagestack(lasagna_ingredient):
             print("valid color maps are {}".format(valid_cmaps))
             return
 
-        pos = np.array([0.0, 1.0])
-        n_val = self.maxColMapValue
-        final_color = self.colorName2value(cmap, nVal=n_val, alpha=self.alpha)
-        color = np.array([[0, 0, 0, n_val], final_color], dtype=np.ubyte)
-        color_map = pg.ColorMap(pos, color)
-        lut = color_map.getLookupTable(0.0, 1.0, n_val + 1)
+        lut = colorMapLUT(cmap, alpha=self.alpha, nVal=self.maxColMapValue)
+        if (lut[:, 3] == self.maxColMapValue).all():
+            lut = lut[:, :3]  # opaque, as pyqtgraph.ColorMap returns it
 
         return lut
 
@@ -88,23 +128,7 @@ class imagestack(lasagna_ingredient):
         colorName is a color name, output is an RGBalpha vector.
         nVal is the maximum intensity value
         """
-        colorName = colorName.lower()
-
-        color_dict = {
-            "gray": [nVal, nVal, nVal, alpha],
-            "red": [nVal, 0, 0, alpha],
-            "green": [0, nVal, 0, alpha],
-            "blue": [0, 0, nVal, alpha],
-            "magenta": [nVal, 0, nVal, alpha],
-            "cyan": [0, nVal, nVal, alpha],
-            "yellow": [nVal, nVal, 0, alpha],
-        }
-
-        if colorName in color_dict:
-            return color_dict[colorName]
-        else:
-            print(("no pre-defined colormap %s. reverting to gray " % colorName))
-            return color_dict["gray"]
+        return colorName2value(colorName, nVal=nVal, alpha=alpha)
 
     def calcHistogram(self,verbose=False):
         """
@@ -114,6 +138,16 @@ class imagestack(lasagna_ingredient):
             print("Calculating histogram")
 
         nValsForCalc = 10E6 #Number of values on which to base histogram calculation
+        y, edges = np.histogram(self.histogramSample(nValsForCalc, verbose), bins=256)
+        x = edges[0:-1]  # chop off last value
+        if verbose:
+            print("Done")
+        return {"x": x, "y": y, "edges": edges}
+
+    def histogramSample(self, nValsForCalc, verbose=False):
+        """
+        Return roughly nValsForCalc values from the stack on which to base histogram calculations
+        """
         sampleEverynSamples = self.data().size
         if self.data().size > nValsForCalc:
             sampleEverynSamples = int(self.data().size/nValsForCalc)
@@ -122,11 +156,7 @@ class imagestack(lasagna_ingredient):
         else:
             sampleEverynSamples=1
 
-        y, x = np.histogram(self.data()[::sampleEverynSamples], bins=256)
-        x = x[0:-1]  # chop off last value
-        if verbose:
-            print("Done")
-        return {"x": x, "y": y}
+        return self.data()[::sampleEverynSamples]
 
     def histBrushColor(self):
         """
@@ -156,29 +186,392 @@ class imagestack(lasagna_ingredient):
         """
         return self._data.swapaxes(0, axisToPlot)
 
+    def setProjectionMode(self, axisToPlot, mode=None):
+        """
+        Set how this stack is drawn in the axis that slices along axisToPlot.
+        mode is None to show single slices or one of 'max', 'mean' or 'sum' to project
+        over the slab sliceToPlot +/- (z-spread - 1)
+        """
+        self.projectionModes[axisToPlot] = mode
+        if mode is None:
+            self._slabProjectors[axisToPlot] = None
+        else:
+            self._slabProjectors[axisToPlot] = slabProjector(mode)
+
+    def sliceData(self, axisToPlot=0, sliceToPlot=0, zSpread=None):
+        """
+        Return the 2D image to display for slice sliceToPlot along axisToPlot.
+        This is either the slice itself or a slab projection around it, on the reference grid.
+        zSpread - value of the axis' z-spread spin box. Read from the spin box if None, which may
+                  only be done on the GUI thread.
+        """
+        projector = self._slabProjectors[axisToPlot]
+        if projector is None:
+            return self.gridSlice(axisToPlot, sliceToPlot)
+
+        if zSpread is None:
+            zSpread = self.parent.viewZ_spinBoxes[axisToPlot].value()
+        data = self.data(axisToPlot)
+        half_width = zSpread - 1
+        resampler = self.gridResampler()
+        if resampler is None:
+            return projector.project(data, sliceToPlot, half_width, source=self._data)
+
+        # Project around the nearest source slice then resample in-plane
+        source_slice = resampler.sourceSlice(axisToPlot, sliceToPlot)
+        projection = projector.project(data, max(source_slice, 0), half_width, source=self._data)
+        image = resampler.resamplePlane(projection, axisToPlot, sliceToPlot)
+        if source_slice < 0:
+            image[:] = 0
+        return image
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # World transform and resampling onto the reference grid
+    def setWorldTransform(self, voxelSize=None, origin=None):
+        """
+        voxelSize - size of a voxel along each array dimension (e.g. from
+                    image_stack_loader.get_voxel_size). None if unknown.
+        origin - world position of voxel (0,0,0) in the same units. Defaults to zero.
+        """
+        self.voxelSize = None if voxelSize is None else tuple(float(v) for v in voxelSize)
+        self.origin = (0.0, 0.0, 0.0) if origin is None else tuple(float(o) for o in origin)
+
+    def gridResampler(self):
+        """
+        Return the resampler that maps this stack onto the reference stack's grid, or None if
+        the stack is displayed as it is (it is the reference, the grids match or either voxel
+        size is unknown)
+        """
+        reference = self.parent.referenceStack()
+        if (reference is None or reference is self or self.voxelSize is None
+                or reference.voxelSize is None or not isinstance(self._data, np.ndarray)):
+            return None
+
+        if (self._data.shape == reference._data.shape and self.voxelSize == reference.voxelSize
+                and self.origin == reference.origin):
+            return None
+
+        if self._resampler is None or self._resampler.interpolation != self.resampleInterpolation:
+            self._resampler = gridResampler(self.resampleInterpolation)
+        self._resampler.setGeometry(self._data.shape, self.voxelSize, self.origin,
+                                    reference._data.shape, reference.voxelSize, reference.origin)
+        return self._resampler
+
+    def gridKey(self):
+        """
+        Identifies the grid on which this stack is displayed. Changes if the stack or the
+        reference stack are given a different geometry.
+        """
+        resampler = self.gridResampler()
+        return None if resampler is None else resampler.geometryKey()
+
+    def displayShape(self, axisToPlot=0):
+        """
+        Shape of the stack as displayed by the axis that slices along axisToPlot
+        """
+        resampler = self.gridResampler()
+        if resampler is None:
+            return self.data(axisToPlot).shape
+        return self.parent.referenceStack().data(axisToPlot).shape
+
+    def gridSlice(self, axisToPlot=0, sliceToPlot=0):
+        """
+        Return slice sliceToPlot along axisToPlot on the displayed (reference) grid
+        """
+        resampler = self.gridResampler()
+        if resampler is None:
+            return self.data(axisToPlot)[sliceToPlot]
+        return resampler.resampleSlice(self.data(axisToPlot), axisToPlot, sliceToPlot)
+
+    def sourceIndex(self, position):
+        """
+        Convert a voxel position on the displayed grid to the nearest voxel of this stack
+        """
+        reference = self.parent.referenceStack()
+        if self.gridResampler() is None:
+            return tuple(int(p) for p in position)
+        return tuple(
+            int(np.rint((reference.origin[d] + position[d] * reference.voxelSize[d] - self.origin[d])
+                        / self.voxelSize[d]))
+            for d in range(3)
+        )
+
+    def valueAt(self, position):
+        """
+        Return the value of the voxel at position (a 3-element sequence on the displayed grid)
+        read from the stack data, or None if position is outside the stack
+        """
+        if len(position) != 3:
+            return None
+        return voxelAt(self._data, self.sourceIndex(position))
+
+    def sessionState(self):
+        state = dict(
+            minMax=list(self.minMax),
+            alpha=self._alpha,
+            autoLevels=self.autoLevels,
+            projectionModes=list(self.projectionModes),
+            resampleInterpolation=self.resampleInterpolation,
+            voxelSize=self.voxelSize,
+            origin=self.origin,
+        )
+        if isinstance(self.lut, str):  # look-up tables set by plugins are set again by the plugin
+            state["lut"] = self.lut
+        return state
+
+    def restoreSessionState(self, state):
+        if "minMax" in state:
+            self.minMax = state["minMax"]
+        if "lut" in state:
+            self.lut = state["lut"]
+        if "alpha" in state:
+            self.alpha = state["alpha"]
+        self.resampleInterpolation = state.get("resampleInterpolation", self.resampleInterpolation)
+        self.setWorldTransform(state.get("voxelSize"), state.get("origin"))
+        for axis, mode in enumerate(state.get("projectionModes", [])):
+            if mode is not None:
+                self.setProjectionMode(axis, mode)
+        if state.get("autoLevels"):
+            self.setAutoLevels(True)
+
+    def cacheNbytes(self):
+        n_bytes = sum(p.nbytes() for p in self._slabProjectors if p is not None)
+        if self._resampler is not None:
+            n_bytes += self._resampler.nbytes()
+        return n_bytes + self.filterCache.nbytes() + self.renderTable.nbytes() + self.sliceLevels.nbytes()
+
+    def clearCaches(self):
+        [p.reset() for p in self._slabProjectors if p is not None]
+        if self._resampler is not None:
+            self._resampler.clear()
+        self.filterCache.clear()
+        self.renderTable.clear()
+        self.sliceLevels.clear()
+
+    def moveDataToDisk(self, directory):
+        """
+        Write the stack to a .npy file in directory and replace the in-RAM data with a
+        read-only memory map of that file. Returns True on success.
+        """
+        if isinstance(self.raw_data(), np.memmap):
+            return False
+
+        fd, fname = tempfile.mkstemp(suffix=".npy", dir=directory)
+        os.close(fd)
+        try:
+            np.save(fname, self.raw_data())
+        except (IOError, OSError) as err:
+            print("imagestack.moveDataToDisk failed to write %s: %s" % (fname, err))
+            os.remove(fname)
+            return False
+
+        self._setData(np.load(fname, mmap_mode="r"))
+        self.clearCaches()
+        self.spillFile = fname
+        return True
+
+    def _setData(self, data):
+        """
+        Replace the array returned by raw_data with data, which hold the same values
+        """
+        self._data = data
+
+    def deleteSpillFile(self):
+        """
+        Delete the file created by moveDataToDisk. Only call once the data are no longer needed.
+        """
+        fname = self.spillFile
+        if fname is None:
+            return
+        self._data = None
+        self.spillFile = None
+        try:
+            os.remove(fname)
+        except OSError as err:
+            print("imagestack.deleteSpillFile failed to delete %s: %s" % (fname, err))
+
     def plotIngredient(self, pyqtObject, axisToPlot=0, sliceToPlot=0):
         """
         Plots the ingredient onto pyqtObject along axisAxisToPlot,
         onto the object with which it is associated
         """
+        self.applyRenderedSlice(
+            pyqtObject, self.renderSlice(axisToPlot, sliceToPlot), axisToPlot, sliceToPlot
+        )
 
-        data = self.data(axisToPlot)
+    def renderSlice(self, axisToPlot=0, sliceToPlot=0, zSpread=None):
+        """
+        Do the work of plotIngredient that does not touch the plot item: extract the slice and
+        quantise it for display. Safe to run on a worker thread (see RedrawScheduler) if zSpread,
+        the value of the axis' z-spread spin box, is given: widgets may only be read on the GUI thread.
+        Returns a dictionary to pass to applyRenderedSlice, or None if there is nothing to show.
+        """
+        n_slices = self.displayShape(axisToPlot)[0]
+        rendered = dict(visible=0 <= sliceToPlot < n_slices, image=None, quantised=None)
+        sliceToPlot = min(max(sliceToPlot, 0), n_slices - 1)
+
+        # Oblique planes depend on the view geometry so they are sampled in applyRenderedSlice
+        if self.parent.axes2D[axisToPlot].obliquePlane is None:
+            rendered["image"] = self.filteredSlice(axisToPlot, sliceToPlot, zSpread)
+            rendered["quantised"] = self.quantiseImage(
+                rendered["image"], self.displayLevels(axisToPlot, sliceToPlot)
+            )
+        return rendered
 
-        if data.shape[0] - 1 < sliceToPlot:
-            pyqtObject.setVisible(False)
-            sliceToPlot = data.shape[0] - 1
-        elif sliceToPlot < 0:
+    def applyRenderedSlice(self, pyqtObject, rendered, axisToPlot=0, sliceToPlot=0):
+        """
+        Show the result of renderSlice in pyqtObject. Must run on the GUI thread.
+        """
+        if rendered is None:
             pyqtObject.setVisible(False)
-            sliceToPlot = 0
-        else:
-            pyqtObject.setVisible(True)
+            return
+        pyqtObject.setVisible(rendered["visible"])
+
+        oblique_plane = self.parent.axes2D[axisToPlot].obliquePlane
+        if oblique_plane is not None:
+            n_slices = self.displayShape(axisToPlot)[0]
+            self.plotObliquePlane(pyqtObject, oblique_plane, axisToPlot, min(max(sliceToPlot, 0), n_slices - 1))
+            return
+
+        if getattr(pyqtObject, "showsObliquePlane", False):
+            pyqtObject.resetTransform()  # undo the setRect of plotObliquePlane
+            pyqtObject.showsObliquePlane = False
 
+        self.showImage(pyqtObject, rendered["image"], rendered["quantised"])
+
+    def _lutKey(self):
+        """
+        Identifies the colour map that setColorMap returns for the current settings
+        """
+        if isinstance(self.lut, str):
+            return self.lut, self.alpha, self.maxColMapValue
+        return id(self.lut)
+
+    def quantiseImage(self, image, levels=None):
+        """
+        Return (image for pyqtgraph, levels, lut) for the 2-D image.
+        Integer and float images are quantised here with a cached table (see
+        image_processing.render_table) so that pyqtgraph does no per-pixel work.
+        levels - [min, max] display range. Defaults to minMax.
+        """
+        if levels is None:
+            levels = self.minMax
+        if canQuantise(image.dtype):
+            quantised, lut = self.renderTable.apply(
+                image, levels, self._lutKey(), lambda: self.setColorMap(self.lut)
+            )
+            return quantised, None, lut
+        return image, levels, self.setColorMap(self.lut)
+
+    def showImage(self, pyqtObject, image, quantised=None):
+        """
+        Display the 2-D image with the current levels and colour map. quantised is the result
+        of quantiseImage(image) if it has already been computed. The image itself is kept as
+        pyqtObject.dataImage so that the values under the mouse can still be read.
+        """
+        if quantised is None:
+            quantised = self.quantiseImage(image)
+        display_image, levels, lut = quantised
         pyqtObject.setImage(
-            data[sliceToPlot],
-            levels=self.minMax,
+            display_image,
+            levels=levels,
+            lut=lut,
             compositionMode=self.compositionMode,
-            lut=self.setColorMap(self.lut),
         )
+        pyqtObject.dataImage = image
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Per-slice levels
+    def setAutoLevels(self, enabled=True, percentiles=None):
+        """
+        Show each slice with levels set to percentiles (low, high) of its own values rather than
+        with minMax. Defaults to the autoLevelPercentiles preference. When enabled, the levels of
+        all slices are computed in the background; slices shown before then are computed as they
+        are drawn. Returns False if the stack's levels can not be changed (e.g. label volumes).
+        """
+        if not self.levelsAdjustable:
+            return False
+        if percentiles is not None and tuple(percentiles) != self.sliceLevels.percentiles:
+            self.sliceLevels.clear()
+            self.sliceLevels = sliceLevels(percentiles)
+
+        self.autoLevels = enabled
+        if not enabled:
+            self.sliceLevels.stop()
+        elif isinstance(self._data, np.ndarray) and self.gridResampler() is None:
+            self.sliceLevels.precompute(self._data, self._filterSourceKey())
+        return True
+
+    def displayLevels(self, axisToPlot=0, sliceToPlot=0):
+        """
+        Return the [min, max] levels of slice sliceToPlot along axisToPlot
+        """
+        if not self.autoLevels:
+            return self.minMax
+        return self.sliceLevels.levels(
+            axisToPlot,
+            sliceToPlot,
+            self.displayShape(axisToPlot)[0],
+            self._filterSourceKey(),
+            lambda: self.gridSlice(axisToPlot, sliceToPlot),
+        )
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Display filters
+    def setDisplayFilter(self, name=None, **params):
+        """
+        Filter the displayed slices with filter name (see image_processing.display_filters.FILTERS)
+        and parameters params. name None removes the filter.
+        """
+        self.displayFilter = None if name is None else displayFilter(name, **params)
+
+    def _filterSourceKey(self):
+        """
+        Identifies the data the displayed slices come from. Part of the filter cache key.
+        Uses the data generation rather than id(self._data), which Python reuses once an array is freed.
+        """
+        return self._dataGeneration, self.gridKey()
+
+    def filteredSlice(self, axisToPlot=0, sliceToPlot=0, zSpread=None):
+        """
+        Return the slice to display with the display filter applied. If the filtered slice is
+        not cached yet it is computed on a worker thread and the unfiltered slice is returned
+        in the meantime. The axis is redrawn when the result arrives.
+        zSpread - as for sliceData
+        """
+        if zSpread is None:
+            zSpread = self.parent.viewZ_spinBoxes[axisToPlot].value()
+        image = self.sliceData(axisToPlot, sliceToPlot, zSpread)
+        if self.displayFilter is None:
+            return image
+
+        projection = (self.projectionModes[axisToPlot], zSpread)
+        key = (axisToPlot, sliceToPlot, projection, self._filterSourceKey(), self.displayFilter.key())
+        filtered = self.filterCache.get(key)
+        if filtered is not None:
+            return filtered
+
+        self.parent.filterWorkers.submit(self, axisToPlot, sliceToPlot, image, key)
+        return image
+
+    def plotObliquePlane(self, pyqtObject, plane, axisToPlot=0, sliceToPlot=0):
+        """
+        Sample the stack on an oblique plane at the resolution of the view and
+        position the resulting image over the region it covers
+        """
+        data = self.data(axisToPlot)
+        sampling = self.parent.axes2D[axisToPlot].obliqueSamplingRegion(data.shape[1:])
+        if sampling is None:
+            pyqtObject.setVisible(False)
+            return
+        region, out_shape = sampling
+
+        self.showImage(
+            pyqtObject,
+            plane.sample(data, sliceToPlot, region, out_shape, interpolation=self.obliqueInterpolation),
+        )
+        pyqtObject.setRect(QtCore.QRectF(*region))
+        pyqtObject.showsObliquePlane = True
 
     def defaultHistRange(self, logY=False, verbose=False):
         """
@@ -190,16 +583,7 @@ class imagestack(lasagna_ingredient):
             print("Determining default histogram range")
 
         nValsForCalc = 1E6 #Number of values on which to base histogram calculation
-        sampleEverynSamples = self.data().size
-        if self.data().size > nValsForCalc:
-            sampleEverynSamples = int(self.data().size/nValsForCalc)
-            if verbose:
-                print("Histogram based on one value every %d" % sampleEverynSamples)
-        else:
-            sampleEverynSamples=1
-
-
-        y, x = np.histogram(self.data()[::sampleEverynSamples], bins=100)
+        y, x = np.histogram(self.histogramSample(nValsForCalc, verbose), bins=100)
         y = np.append(y, 0)
 
         # Remove negative numbers from the calculation. Sometimes these happen with registered images
@@ -284,6 +668,7 @@ class imagestack(lasagna_ingredient):
         self._data = np.swapaxes(self._data, ax1, ax2)
 
     def removeFromList(self):
+        self.sliceLevels.stop()
         super(imagestack, self).removeFromList()
         if len(self.parent.ingredientList) == 1:
             self.parent.ingredientList[0].lut = "gray"
@@ -309,3 +694,14 @@ class imagestack(lasagna_ingredient):
         self._alpha = value
 
     alpha = property(get_alpha, set_alpha)
+
+    # Every assignment to _data (loading, flips, rotations, plugins replacing the array) gives the
+    # stack a new _dataGeneration, which keys the filter and level caches (see _filterSourceKey)
+    def get_data_array(self):
+        return self.__dict__.get("_stackData")
+
+    def set_data_array(self, data):
+        self._stackData = data
+        self._dataGeneration = next(_dataGenerations)
+
+    _data = property(get_data_array, set_data_array)
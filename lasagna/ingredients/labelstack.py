@@ -0,0 +1,324 @@
+"""
+This class defines a label volume (e.g. an atlas annotation) and instructs lasagna how to display it.
+
+Each voxel holds the ID of the structure it belongs to. IDs can be arbitrarily large (the ARA uses
+IDs above 65535) so they are not used for display directly. Instead the volume is stored as a
+compact index into a sorted array of the label IDs that are present (labelIDs). The index uses the
+smallest unsigned integer type that can hold it. Because labelIDs is sorted, the index preserves
+the order of the IDs. Index 0 is always label 0, which is treated as background.
+
+Colours are looked up through a dense RGBA table with one row per index, so drawing a slice
+needs no per-label work. Three render modes are available:
+filled     - every label is drawn in its colour
+boundaries - only the outlines of labels are drawn. Outlines are found with vectorised
+             comparisons between neighbouring pixels and cached per (axis, slice).
+selected   - only the labels in selectedLabels are drawn. This only changes the colour table.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PyQt5 import QtGui, QtWidgets
+
+from lasagna.ingredients.imagestack import imagestack
+from lasagna.io_libs.image_stack_loader import save_stack
+
+
+RENDER_MODES = ("filled", "boundaries", "selected")
+
+
+def compactLabels(labelVolume):
+    """
+    Return (index, labelIDs) such that labelIDs[index] equals labelVolume.
+    labelIDs is sorted and always starts with 0. index is the smallest unsigned integer type
+    able to hold len(labelIDs)-1.
+    """
+    label_ids, inverse = np.unique(labelVolume, return_inverse=True)
+    if label_ids.size == 0 or label_ids[0] != 0:
+        label_ids = np.concatenate(([0], label_ids)).astype(label_ids.dtype)
+        inverse = inverse + 1
+
+    for index_type in (np.uint8, np.uint16, np.uint32):
+        if label_ids.size - 1 <= np.iinfo(index_type).max:
+            break
+    index = inverse.astype(index_type).reshape(labelVolume.shape)
+    return index, label_ids
+
+
+def hashedColors(labelIDs):
+    """
+    Return an (n,3) uint8 array of colours for labels that have no assigned colour.
+    Each colour depends only on the label ID, so a label keeps its colour whatever else is loaded.
+    """
+    h = np.asarray(labelIDs).astype(np.uint64) * np.uint64(2654435761)  # Knuth's multiplicative hash
+    h ^= h >> np.uint64(15)
+    rgb = np.stack([(h >> np.uint64(shift)) & np.uint64(0xFF) for shift in (0, 8, 16)], axis=1)
+    return (64 + rgb.astype(np.uint16) * 191 // 255).astype(np.uint8)  # avoid near-black colours
+
+
+def hexToRGB(hexTriplet):
+    """
+    Convert a hex colour string such as 'FF7080' or '#ff7080' to an (r, g, b) tuple. Also accepts
+    the int that readers produce from an all-digit triplet (e.g. 9900 from '009900').
+    """
+    hexTriplet = str(hexTriplet).lstrip("#").zfill(6)
+    return tuple(int(hexTriplet[ii:ii + 2], 16) for ii in (0, 2, 4))
+
+
+class labelstack(imagestack):
+    # The display levels are tied to the colour table so the intensity histogram must not change them
+    levelsAdjustable = False
+    obliqueInterpolation = "nearest"  # interpolating between label IDs is meaningless
+
+    def __init__(
+        self,
+        parent=None,
+        data=None,
+        fnameAbsPath="",
+        enable=True,
+        objectName="",
+        labelColors=None,
+        renderMode="filled",
+        maxCachedBoundaries=64,
+    ):
+        """
+        labelColors - optional dictionary of label ID -> (r, g, b) or hex triplet string.
+                      Labels that are not in the dictionary get a hashed colour.
+        renderMode - one of RENDER_MODES
+        maxCachedBoundaries - number of boundary images to keep
+        """
+        index, self.labelIDs = compactLabels(np.asarray(data))
+
+        self._labelColors = dict()
+        self.selectedLabels = set()
+        self.labelAlpha = 255
+        self.renderMode = "filled"
+        self.maxCachedBoundaries = maxCachedBoundaries
+        self._boundaries = OrderedDict()  # (axis, slice) -> boundary mask
+        self._boundaryLock = threading.Lock()  # the views may be drawn on different threads
+        self._boundarySource = None
+        self._labelLut = None
+
+        super(labelstack, self).__init__(
+            parent,
+            index,
+            fnameAbsPath,
+            enable,
+            objectName,
+        )
+
+        # Blending label indexes would create labels that do not exist
+        self.resampleInterpolation = "nearest"
+
+        # Labels are drawn over the other stacks rather than added to them
+        self.compositionMode = QtGui.QPainter.CompositionMode_SourceOver
+
+        # Keep the histogram neutral; the colour table would give it an arbitrary colour
+        self.histPenCustomColor = [180, 180, 180, 255]
+        self.histBrushCustomColor = [150, 150, 150, 150]
+
+        self.setLabelColors(labelColors)
+        self.setRenderMode(renderMode)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Colours
+    def setLabelColors(self, labelColors=None):
+        """
+        Assign colours to label IDs. labelColors is a dictionary of ID -> (r, g, b) or hex triplet
+        (a string, or an int if the triplet was all digits).
+        """
+        self._labelColors = dict()
+        if labelColors:
+            for label_id, color in labelColors.items():
+                if isinstance(color, (str, int, np.integer)):
+                    color = hexToRGB(color)
+                self._labelColors[int(label_id)] = tuple(color)[:3]
+        self.buildLut()
+
+    def buildLut(self):
+        """
+        Build the dense RGBA table with one row per compact index
+        """
+        lut = np.empty((self.labelIDs.size, 4), dtype=np.ubyte)
+        lut[:, :3] = hashedColors(self.labelIDs)
+        lut[:, 3] = self.labelAlpha
+
+        if self._labelColors:
+            position = {label_id: ii for ii, label_id in enumerate(self.labelIDs.tolist())}
+            for label_id, color in self._labelColors.items():
+                if label_id in position:
+                    lut[position[label_id], :3] = color
+
+        if self.renderMode == "selected":
+            keep = np.isin(self.labelIDs, list(self.selectedLabels))
+            lut[~keep, 3] = 0
+
+        lut[0] = 0  # background is transparent
+        self._labelLut = lut
+
+    def _getLut(self):
+        return self._labelLut
+
+    def _setLut(self, lut):
+        # The imagestack code (and plugins) assign colour map names to lut. These make no
+        # sense for labels so only a full colour table is accepted.
+        if isinstance(lut, np.ndarray):
+            self._labelLut = lut
+
+    lut = property(_getLut, _setLut)
+
+    def _getMinMax(self):
+        # With these levels pyqtgraph maps index i onto row i of the colour table
+        return [0, self.labelIDs.size]
+
+    def _setMinMax(self, minMax):
+        pass
+
+    minMax = property(_getMinMax, _setMinMax)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Render modes
+    def setRenderMode(self, mode):
+        if mode not in RENDER_MODES:
+            print("labelstack.setRenderMode - unknown mode %s. Valid modes are %s" % (mode, RENDER_MODES))
+            return
+        self.renderMode = mode
+        self.buildLut()
+
+    def setSelectedLabels(self, labelIDs):
+        """
+        Set the label IDs shown in 'selected' render mode
+        """
+        self.selectedLabels = set(int(label_id) for label_id in labelIDs)
+        if self.renderMode == "selected":
+            self.buildLut()
+
+    def setProjectionMode(self, axisToPlot, mode=None):
+        if mode is not None:
+            print("labelstack - slab projections are not available for label volumes")
+
+    def setDisplayFilter(self, name=None, **params):
+        if name is not None:
+            print("labelstack - display filters are not available for label volumes")
+
+    def sliceData(self, axisToPlot=0, sliceToPlot=0, zSpread=None):
+        index_slice = self.gridSlice(axisToPlot, sliceToPlot)
+        if self.renderMode != "boundaries":
+            return index_slice
+        return np.where(self.boundaries(axisToPlot, sliceToPlot), index_slice, 0)
+
+    def boundaries(self, axisToPlot, sliceToPlot):
+        """
+        Return a boolean image that is True on the outline of every label in the slice
+        """
+        key = (axisToPlot, sliceToPlot, self.gridKey())
+        with self._boundaryLock:
+            if self._boundarySource is not self._data:
+                self._boundaries.clear()
+                self._boundarySource = self._data
+
+            if key in self._boundaries:
+                self._boundaries.move_to_end(key)
+                return self._boundaries[key]
+
+        index_slice = self.gridSlice(axisToPlot, sliceToPlot)
+        edges = np.zeros(index_slice.shape, dtype=bool)
+        differs = index_slice[1:, :] != index_slice[:-1, :]
+        edges[1:, :] |= differs
+        edges[:-1, :] |= differs
+        differs = index_slice[:, 1:] != index_slice[:, :-1]
+        edges[:, 1:] |= differs
+        edges[:, :-1] |= differs
+        edges &= index_slice != 0
+
+        with self._boundaryLock:
+            self._boundaries[key] = edges
+            while len(self._boundaries) > self.maxCachedBoundaries:
+                self._boundaries.popitem(last=False)
+        return edges
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Label lookup
+    def labelAt(self, position):
+        """
+        Return the label ID at voxel position (a 3-element sequence on the displayed grid)
+        or -1 if outside the volume
+        """
+        label_id = self.valueAt(position)
+        return -1 if label_id is None else label_id
+
+    def valueAt(self, position):
+        """
+        As imagestack.valueAt but returns the label ID rather than its compact index
+        """
+        index = super(labelstack, self).valueAt(position)
+        return None if index is None else self.labelIDs[index].item()
+
+    def labelIndex(self, labelID):
+        """
+        Return the compact index of labelID or -1 if it is not present in the volume
+        """
+        ii = np.searchsorted(self.labelIDs, labelID)
+        if ii < self.labelIDs.size and self.labelIDs[ii] == labelID:
+            return int(ii)
+        return -1
+
+    def labelData(self):
+        """
+        Return the volume of label IDs. This makes a full-size copy.
+        """
+        return self.labelIDs[self._data]
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Sessions
+    def sessionState(self):
+        state = super(labelstack, self).sessionState()
+        state.update(renderMode=self.renderMode, labelAlpha=self.labelAlpha, selectedLabels=self.selectedLabels)
+        return state
+
+    def restoreSessionState(self, state):
+        super(labelstack, self).restoreSessionState(state)
+        self.labelAlpha = state.get("labelAlpha", self.labelAlpha)
+        self.setSelectedLabels(state.get("selectedLabels", []))
+        self.setRenderMode(state.get("renderMode", self.renderMode))
+
+    def sessionArguments(self):
+        return dict(labelColors=self._labelColors)
+
+    def sessionData(self):
+        """
+        The data are indexes into labelIDs, so the label IDs are saved. They are saved even if the
+        volume has a file because it may have been flipped, rotated or reordered since it was read.
+        """
+        return self.labelData()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Housekeeping
+    def cacheNbytes(self):
+        n_bytes = super(labelstack, self).cacheNbytes()
+        with self._boundaryLock:
+            return n_bytes + sum(b.nbytes for b in self._boundaries.values())
+
+    def clearCaches(self):
+        super(labelstack, self).clearCaches()
+        with self._boundaryLock:
+            self._boundaries.clear()
+            self._boundarySource = None
+
+    def changeData(self, imageData, imageAbsPath, recalculateDefaultHistRange=False):
+        if not isinstance(imageData, np.ndarray):
+            return False
+        index, self.labelIDs = compactLabels(imageData)
+        self.buildLut()
+        return super(labelstack, self).changeData(index, imageAbsPath, recalculateDefaultHistRange)
+
+    def save(self, path=None):
+        if path is None:
+            path = QtWidgets.QFileDialog.getSaveFileName(
+                self.parent, "File to save {}".format(self.objectName)
+            )
+        if not path:
+            return
+        save_stack(path, self.labelData())
+        print(("%s saved as %s" % (self.objectName, path)))
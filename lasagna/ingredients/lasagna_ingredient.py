@@ -11,7 +11,22 @@ import os
 from PyQt5 import QtGui, QtCore
 
 
+# Colours given in turn to point and line ingredients: matplotlib's jet colour map sampled at six
+# evenly spaced points, as 0-255 RGB. Written out so that matplotlib is not imported for them.
+SERIES_COLORS = (
+    (0.0, 0.0, 127.5),
+    (0.0, 76.5, 255.0),
+    (41.129, 255.0, 205.645),
+    (205.645, 255.0, 41.129),
+    (255.0, 103.889, 0.0),
+    (127.5, 0.0, 0.0),
+)
+
+
 class lasagna_ingredient(object):
+    # Attributes holding the display settings that session files keep (see sessionState)
+    sessionAttributes = ()
+
     def __init__(
         self,
         parent,
@@ -59,6 +74,48 @@ class lasagna_ingredient(object):
         """
         return self._data
 
+    def cacheNbytes(self):
+        """
+        Return the number of bytes held in derived data that can be thrown away and recomputed.
+        Ingredients that cache anything should override this and clearCaches.
+        """
+        return 0
+
+    def clearCaches(self):
+        """
+        Discard derived data that can be recomputed (see cacheNbytes)
+        """
+        pass
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Sessions (see lasagna.session)
+    def sessionState(self):
+        """
+        Return a dictionary of the display settings to save in a session file
+        """
+        return dict((name, getattr(self, name)) for name in self.sessionAttributes)
+
+    def restoreSessionState(self, state):
+        """
+        Apply display settings returned by sessionState
+        """
+        for name in self.sessionAttributes:
+            if name in state:
+                setattr(self, name, state[name])
+
+    def sessionArguments(self):
+        """
+        Return the constructor arguments, other than the data, needed to create this ingredient again
+        """
+        return dict()
+
+    def sessionData(self):
+        """
+        Return the data to write to the session cache, or None if the ingredient must be
+        restored from its file (or, like a derived stack, holds no data of its own)
+        """
+        return self.raw_data()
+
     def addToPlots(self):
         """
         Show ingredient on plots by adding the plot item to all 2D axes so that it becomes available for plotting
@@ -4,14 +4,14 @@ This class overlays points on top of the image stacks.
 
 import numpy as np
 from PyQt5 import QtGui, QtCore
-from matplotlib import cm
-from numpy import linspace
 
-from lasagna.ingredients.lasagna_ingredient import lasagna_ingredient
+from lasagna.ingredients.lasagna_ingredient import lasagna_ingredient, SERIES_COLORS
 from lasagna.utils import preferences
 
 
 class sparsepoints(lasagna_ingredient):
+    sessionAttributes = ("color", "symbol", "symbolSize", "alpha", "lineWidth")
+
     def __init__(
         self, parent=None, data=None, fnameAbsPath="", enable=True, objectName=""
     ):
@@ -31,14 +31,10 @@ class sparsepoints(lasagna_ingredient):
 
         # Set the colour of the object based on how many items are already present
         # TODO: duplicate code with lines.py
-        number_of_colors = 6
         this_number = (
             self.parent.points_Model.rowCount() - 1
-        ) % number_of_colors  # FIXME: rename
-        cm_subsection = linspace(0, 1, number_of_colors)
-        colors = [cm.jet(x) for x in cm_subsection]
-        color = colors[this_number]
-        self.color = [color[0] * 255, color[1] * 255, color[2] * 255]
+        ) % len(SERIES_COLORS)  # FIXME: rename
+        self.color = list(SERIES_COLORS[this_number])
 
     def data(self, axisToPlot=0):
         """
@@ -0,0 +1,163 @@
+"""
+This class defines a 4-D image stack: a series of volumes (timepoints or channels) of the same shape,
+stored as one T x Z x X x Y array.
+
+Only one timepoint is displayed at a time. It behaves exactly like an imagestack holding that
+volume, so projections, resampling, filters and derived stacks all work on the current timepoint.
+The series itself may be a memory map (e.g. a .npy file or an uncompressed TIFF), in which case
+nothing is read until it is displayed.
+
+To keep playback at a fixed frame rate the slices shown by the three views at the next few
+timepoints are read ahead of time on a background thread (see io_libs.slice_prefetcher).
+"""
+
+import numpy as np
+
+from lasagna.ingredients.imagestack import imagestack
+from lasagna.io_libs.slice_prefetcher import slicePrefetcher
+from lasagna.utils import preferences
+
+
+class timeseriesstack(imagestack):
+    def __init__(
+        self,
+        parent=None,
+        data=None,
+        fnameAbsPath="",
+        enable=True,
+        objectName="",
+        minMax=None,
+        lut="gray",
+        timepoint=0,
+    ):
+        """
+        data - 4-D array-like (timepoints x Z x X x Y). A memory map is not read into RAM.
+        timepoint - the timepoint displayed first
+        """
+        if data is None or np.ndim(data) != 4:
+            raise ValueError("timeseriesstack - data must be 4-D (timepoints x Z x X x Y)")
+
+        self.series = data
+        self.timepoint = min(max(int(timepoint), 0), data.shape[0] - 1)
+        self.loop = True  # playback continues from the first timepoint after the last
+        self.prefetcher = slicePrefetcher(
+            self._readSlice, depth=preferences.readPreference("timeseriesPrefetchDepth")
+        )
+
+        super(timeseriesstack, self).__init__(
+            parent,
+            data[self.timepoint],
+            fnameAbsPath,
+            enable,
+            objectName,
+            minMax=minMax,
+            lut=lut,
+        )
+        self._seriesGeneration = self._dataGeneration
+
+    def raw_data(self):
+        """
+        Return the whole series
+        """
+        return self.series
+
+    def _setData(self, data):
+        self.series = data
+        self._data = data[self.timepoint]
+        self._seriesGeneration = self._dataGeneration  # changing timepoint does not change the series
+        self.prefetcher.invalidate()
+
+    def nTimepoints(self):
+        return self.series.shape[0]
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Timepoints
+    def setTimepoint(self, timepoint):
+        """
+        Display timepoint. Starts reading ahead the slices the views will show next.
+        """
+        timepoint = min(max(int(timepoint), 0), self.nTimepoints() - 1)
+        if timepoint != self.timepoint:
+            self.timepoint = timepoint
+            self._data = self.series[timepoint]
+        self.prefetchUpcoming()
+
+    def prefetchUpcoming(self):
+        """
+        Read the slices currently shown by the views at the following timepoints
+        """
+        slices = [axis.currentSlice for axis in self.parent.axes2D]
+        self.prefetcher.prefetch(self.timepoint, self.nTimepoints(), slices, loop=self.loop)
+
+    def _readSlice(self, timepoint, axisToPlot, sliceToPlot):
+        """
+        Called by the prefetcher thread
+        """
+        return self.series[timepoint].swapaxes(0, axisToPlot)[sliceToPlot]
+
+    def gridSlice(self, axisToPlot=0, sliceToPlot=0):
+        """
+        As imagestack.gridSlice but slices that are not resampled come from the read-ahead buffer
+        """
+        if self.gridResampler() is not None:
+            return super(timeseriesstack, self).gridSlice(axisToPlot, sliceToPlot)
+        return self.prefetcher.get(self.timepoint, axisToPlot, sliceToPlot)
+
+    def _filterSourceKey(self):
+        return (self._seriesGeneration, self.timepoint), self.gridKey()
+
+    def sessionArguments(self):
+        return dict(timepoint=self.timepoint)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Housekeeping
+    def cacheNbytes(self):
+        return super(timeseriesstack, self).cacheNbytes() + self.prefetcher.buffer.nbytes()
+
+    def clearCaches(self):
+        super(timeseriesstack, self).clearCaches()
+        self.prefetcher.clear()
+
+    def changeData(self, imageData, imageAbsPath, recalculateDefaultHistRange=False):
+        if not isinstance(imageData, np.ndarray) or imageData.ndim != 4:
+            print("timeseriesstack - the new data must be a 4-D array")
+            return False
+        self.fnameAbsPath = imageAbsPath
+        self.timepoint = min(self.timepoint, imageData.shape[0] - 1)
+        self._setData(imageData)
+        self.clearCaches()
+        if recalculateDefaultHistRange:
+            self.defaultHistRange()
+        return True
+
+    # The 3-D operations are applied to every timepoint. Axes of the series are one higher.
+    def flipAlongAxis(self, axisToFlip):
+        if axisToFlip not in range(3):
+            print("Can not flip axis %s" % str(axisToFlip))
+            return
+        self._setData(np.flip(self.series, axisToFlip + 1))
+        self.clearCaches()
+
+    def rotateAlongDimension(self, axisToRotate):
+        if axisToRotate > 2 or axisToRotate < 0:
+            print("timeseriesstack.rotateAlongDimension can not rotate along axis %d" % axisToRotate)
+            return
+        series = np.swapaxes(self.series, 3, axisToRotate + 1)
+        series = np.rot90(series, axes=(1, 2))
+        self._setData(np.swapaxes(series, 3, axisToRotate + 1))
+        self.clearCaches()
+
+    def swapAxes(self, ax1, ax2):
+        if ax1 not in range(3) or ax2 not in range(3):
+            print("Axes to swap out of range. ")
+            return
+        self._setData(np.swapaxes(self.series, ax1 + 1, ax2 + 1))
+        self.clearCaches()
+
+    def removeFromList(self):
+        """
+        Called when the stack is removed from Lasagna. Stop reading ahead and let go of the series.
+        """
+        self.prefetcher.stop()
+        super(timeseriesstack, self).removeFromList()
+        self.series = None
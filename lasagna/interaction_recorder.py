@@ -0,0 +1,127 @@
+"""
+Record what the user does with the mouse on the three views (View > Record interactions, or the
+--record command-line option) so that it can be replayed by benchmarks/replay_benchmark.py.
+
+Mouse moves, button presses and releases and wheel events are recorded with the time since the
+recording started, the view they happened in, the buttons and keyboard modifiers held (so
+Ctrl-wheel and Ctrl-drag replay as such) and the position in data coordinates. Data coordinates
+rather than pixels mean a recording replays over the same voxels whatever the window size.
+The state of the views when recording started (see SessionManager.viewState) and the loaded
+ingredients are saved with the events so the replay can start from the same place.
+
+Recordings are JSON files.
+"""
+
+import json
+import os
+import time
+
+from PyQt5 import QtCore
+
+RECORDING_VERSION = 1
+RECORDING_FILTER = "Lasagna interaction recordings (*.json)"
+
+# Event types recorded and the names used for them in the file
+EVENT_NAMES = {
+    QtCore.QEvent.MouseMove: "move",
+    QtCore.QEvent.MouseButtonPress: "press",
+    QtCore.QEvent.MouseButtonRelease: "release",
+    QtCore.QEvent.MouseButtonDblClick: "press",  # Qt sends this instead of the second press of a double click
+    QtCore.QEvent.Wheel: "wheel",
+}
+
+
+def readRecording(fname):
+    """
+    Return the recording in the file fname as a dictionary. Raises ValueError if the file is not
+    a recording.
+    """
+    with open(fname, "r") as stream:
+        recording = json.load(stream)
+    if not isinstance(recording, dict) or "events" not in recording:
+        raise ValueError("{} is not a Lasagna interaction recording".format(fname))
+    return recording
+
+
+class InteractionRecorder(QtCore.QObject):
+    def __init__(self, lasagna_serving):
+        super(InteractionRecorder, self).__init__()
+        self.lasagna = lasagna_serving
+        self.events = []
+        self.header = dict()
+        self.fname = None  # where stop() saves the recording, if set
+        self._viewports = []
+        self._start = None
+
+    def isRecording(self):
+        return self._start is not None
+
+    def start(self, fname=None):
+        """
+        Start recording. Any previous recording is discarded. If fname is given the recording is
+        saved there by stop(), which also runs when Lasagna quits.
+        """
+        if self.isRecording():
+            self.stop(save=False)
+        self.fname = fname
+        self.events = []
+        self.header = dict(
+            version=RECORDING_VERSION,
+            windowSize=[self.lasagna.width(), self.lasagna.height()],
+            ingredients=[
+                dict(kind=type(ingredient).__name__, objectName=ingredient.objectName,
+                     fname=ingredient.fnameAbsPath or "")
+                for ingredient in self.lasagna.ingredientList
+            ],
+            views=self.lasagna.sessions.viewState(),
+            zSpread=[spin_box.value() for spin_box in self.lasagna.viewZ_spinBoxes],
+        )
+        self._viewports = [axis.view.viewport() for axis in self.lasagna.axes2D]
+        for viewport in self._viewports:
+            viewport.installEventFilter(self)
+        self._start = time.perf_counter()
+        self.lasagna.statusBar.showMessage("Recording interactions")
+
+    def stop(self, save=True):
+        """
+        Stop recording and, if save is True and a file name was given to start(), save the recording
+        """
+        if not self.isRecording():
+            return
+        for viewport in self._viewports:
+            viewport.removeEventFilter(self)
+        self._viewports = []
+        self._start = None
+        self.lasagna.statusBar.showMessage("Recorded %d events" % len(self.events))
+        if save and self.fname:
+            self.save(self.fname)
+
+    def save(self, fname):
+        recording = dict(self.header, events=self.events)
+        with open(fname, "w") as stream:
+            json.dump(recording, stream, separators=(",", ":"))
+        print("Saved %d interaction events to %s" % (len(self.events), os.path.abspath(fname)))
+
+    def eventFilter(self, obj, event):
+        name = EVENT_NAMES.get(event.type())
+        if name is not None and self.isRecording() and obj in self._viewports:
+            self.events.append(self._eventEntry(self._viewports.index(obj), name, event))
+        return False  # never consume the event
+
+    def _eventEntry(self, view_index, name, event):
+        view = self.lasagna.axes2D[view_index].view
+        pos = view.getViewBox().mapSceneToView(view.mapToScene(event.pos()))
+        entry = dict(
+            t=round(time.perf_counter() - self._start, 6),
+            view=view_index,
+            type=name,
+            x=pos.x(),
+            y=pos.y(),
+            buttons=int(event.buttons()),
+            modifiers=int(event.modifiers()),
+        )
+        if name == "wheel":
+            entry["delta"] = event.angleDelta().y()
+        else:
+            entry["button"] = int(event.button())
+        return entry
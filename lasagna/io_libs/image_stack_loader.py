@@ -4,7 +4,7 @@ Read MHD stacks (using the vtk library) or TIFF stacks
 https://github.com/sainsburywellcomecentre/lasagna
 """
 
-import imp  # to look for the presence of a module. Python 3 will require importlib
+import importlib.util  # to look for the presence of a module without importing it
 import os
 import re
 import struct
@@ -14,9 +14,19 @@ import numpy as np
 
 from lasagna.utils import preferences, path_utils
 
-with warnings.catch_warnings():
-    warnings.simplefilter("ignore")
-    import nibabel as nib
+
+def _nibabel():
+    """
+    Import nibabel on first use, as it is slow to import and only needed for NII files
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        import nibabel
+    return nibabel
+
+
+def _has_vtk():
+    return importlib.util.find_spec("vtk") is not None
 
 # -------------------------------------------------------------------------------------------
 #   *General methods*
@@ -42,6 +52,7 @@ def load_stack(fname):
     """
     load_stack determines the data type from the file extension determines what data are to be
     loaded and chooses the approproate function to return the data.
+    Most formats return a 3-D array. Time series return a 4-D array whose first dimension is time.
     """
     if fname.lower().endswith(".tif") or fname.lower().endswith(".tiff"):
         return load_tiff_stack(fname)
@@ -51,6 +62,8 @@ def load_stack(fname):
         return nrrd_read(fname)
     elif fname.lower().endswith(".nii"):
         return load_nii_stack(fname)
+    elif fname.lower().endswith(".npy"):
+        return load_npy_stack(fname)
     else:
         print("\n\n*{} NOT LOADED. DATA TYPE NOT KNOWN\n\n".format(fname))
 
@@ -72,7 +85,7 @@ def image_filter():
     As image formats are added (or removed) from this module, this
     string should be manually modified accordingly.
     """
-    return "Images (*.mhd *.tiff *.tif *.nrrd *.nrd *.nii)"
+    return "Images (*.mhd *.tiff *.tif *.nrrd *.nrd *.nii *.npy)"
 
 
 def get_voxel_spacing(fname, fall_back_mode=False):
@@ -89,6 +102,68 @@ def get_voxel_spacing(fname, fall_back_mode=False):
         return preferences.readPreference("defaultAxisRatios")  # defaults
 
 
+def get_voxel_size(fname):
+    """
+    Return the voxel size along each dimension of the array returned by load_stack, or None if
+    the file format does not record it. Units are those of the file (usually microns or mm).
+    Note that the loaders re-order the file's dimensions, so this is not the order in the header.
+    """
+    geometry = _get_geometry(fname)
+    return None if geometry is None else geometry[0]
+
+
+def get_origin(fname):
+    """
+    Return the world position of the first voxel in the same dimension order and units as
+    get_voxel_size, or None if the file does not record it.
+    """
+    geometry = _get_geometry(fname)
+    return None if geometry is None else geometry[1]
+
+
+def _get_geometry(fname):
+    """
+    Return (voxel size, origin) re-ordered to match the array returned by load_stack, or None
+    """
+    fname_lower = fname.lower()
+    try:
+        if fname_lower.endswith(".mhd"):
+            info = mhd_read_header_file(fname)
+            if "elementspacing" not in info:
+                return None
+            spacing = info["elementspacing"]
+            origin = info.get("offset", info.get("origin", [0, 0, 0]))
+            order = (2, 0, 1)  # header is x,y,z and the loaded array is z,x,y
+        elif fname_lower.endswith(".nrrd") or fname_lower.endswith(".nrd"):
+            header = nrrd_header_read(fname)
+            if "space directions" not in header:
+                return None
+            spacing = [header["space directions"][i][i] for i in range(3)]
+            origin = header.get("space origin", [0, 0, 0])
+            order = (0, 2, 1)  # header is x,y,z and the loaded array is x,z,y
+        elif fname_lower.endswith(".nii"):
+            header = _nibabel().load(fname).header
+            spacing = header.get_zooms()[:3]
+            origin = [header["qoffset_x"], header["qoffset_y"], header["qoffset_z"]]
+            order = (2, 0, 1)  # header is x,y,z and the loaded array is z,x,y
+        else:
+            return None
+    except (IOError, KeyError, IndexError, TypeError, ValueError) as err:
+        print("image_stack_loader could not read the voxel size of {}: {}".format(fname, err))
+        return None
+
+    if not isinstance(spacing, (list, tuple, np.ndarray)) or len(spacing) < 3:
+        return None
+    if not isinstance(origin, (list, tuple, np.ndarray)) or len(origin) < 3:
+        origin = [0, 0, 0]
+
+    spacing = tuple(abs(float(spacing[i])) for i in order)
+    origin = tuple(float(origin[i]) for i in order)
+    if not all(spacing):
+        return None
+    return spacing, origin
+
+
 def spacing_to_ratio(spacing):
     """
     Takes a vector of axis spacings and converts it to ratios
@@ -131,8 +206,24 @@ def load_tiff_stack(fname, use_lib_tiff=False):
         im = np.asarray(samples[0])
     else:
         print("Loading: " + fname + " with tifffile\n")
-        from tifffile import imread
-
+        from tifffile import imread, memmap
+
+        axes = tiff_series_axes(fname)
+        if is_tiff_series(axes):
+            # Time series are memory-mapped when the file allows it (uncompressed and contiguous)
+            # so that only the displayed timepoints are read
+            try:
+                im = memmap(fname, mode="r")
+            except ValueError:
+                im = imread(fname)
+            if axes[0] == "Z":  # e.g. an ImageJ ZCYX hyperstack: put the channels first
+                im = np.moveaxis(im, 1, 0)
+            im = im.swapaxes(-2, -1)
+            print(
+                "read image of size: cols: %d, rows: %d, layers: %d with %d timepoints"
+                % (im.shape[-2], im.shape[-1], im.shape[-3], im.shape[0])
+            )
+            return im
         im = imread(fname)
 
     im = im.swapaxes(1, 2)
@@ -143,6 +234,25 @@ def load_tiff_stack(fname, use_lib_tiff=False):
     return im
 
 
+def tiff_series_axes(fname):
+    """
+    Return the axes of the first image series in the TIFF file fname as tifffile names them,
+    e.g. 'ZYX', 'TZYX' or 'ZYXS' (S being the samples of an RGB image)
+    """
+    from tifffile import TiffFile
+
+    with TiffFile(fname) as tif:
+        return tif.series[0].axes
+
+
+def is_tiff_series(axes):
+    """
+    True if a TIFF whose first series has axes (see tiff_series_axes) holds a 4-D time or
+    channel series of volumes. RGB and other multi-sample stacks are not series.
+    """
+    return len(axes) == 4 and axes.endswith("YX") and "S" not in axes
+
+
 def save_tiff_stack(fname, data, use_lib_tiff=False):
     """Save data in file fname
     """
@@ -150,7 +260,7 @@ def save_tiff_stack(fname, data, use_lib_tiff=False):
         raise NotImplementedError
     from tifffile import imsave
 
-    imsave(str(fname), data.swapaxes(1, 2))
+    imsave(str(fname), data.swapaxes(-2, -1))
 
 
 # -------------------------------------------------------------------------------------------
@@ -161,14 +271,31 @@ def load_nii_stack(fname):
     """
     if not check_file_exists(fname, "load_nii_stack"):
         return
-    nii_img = nib.load(fname)
+    nii_img = _nibabel().load(fname)
     im = nii_img.get_data()
     print(
         "read image of size: cols: %d, rows: %d, layers: %d"
         % (im.shape[1], im.shape[2], im.shape[0])
     )
-    im = im.swapaxes(0, 2)
-    im = im.swapaxes(1, 2)
+    if im.ndim == 4:  # x,y,z,t: make time the first dimension then treat each volume as below
+        im = np.moveaxis(im, 3, 0)
+    im = im.swapaxes(-3, -1)
+    im = im.swapaxes(-2, -1)
+    return im
+
+
+# -------------------------------------------------------------------------------------------
+#   *NPY handling methods*
+def load_npy_stack(fname):
+    """
+    Read a stack saved with numpy.save. The array is memory-mapped rather than read so that
+    large volumes and time series are only read as they are displayed. It is used in the
+    order it was saved (Z, X, Y or T, Z, X, Y).
+    """
+    if not check_file_exists(fname, "load_npy_stack"):
+        return
+    im = np.load(fname, mmap_mode="r")
+    print("memory-mapped array of size %s" % str(im.shape))
     return im
 
 # -------------------------------------------------------------------------------------------
@@ -183,7 +310,8 @@ def mhd_read(fname, fall_back_mode=False):
     if not fall_back_mode:
         # Attempt to load vtk
         try:
-            imp.find_module("vtk")
+            if not _has_vtk():
+                raise ImportError("No module named 'vtk'")
             import vtk  # Seems not exist currently for Python 3 (Jan 2017)
             from vtk.util.numpy_support import vtk_to_numpy
         except ImportError:
@@ -475,7 +603,8 @@ def mhd_get_ratios(fname):
 
     try:
         # Attempt to use the vtk module to read the element spacing
-        imp.find_module("vtk")
+        if not _has_vtk():
+            raise ImportError("No module named 'vtk'")
         import vtk
 
         imr = vtk.vtkMetaImageReader()
@@ -0,0 +1,157 @@
+"""
+Read and write Lasagna session files and the array caches that go with them.
+
+A session file is YAML. It lists the ingredients in the order they were loaded, each with the
+file it came from and its display state, and the state of the three views (axis ratios, slices,
+flips and ranges). See lasagna.session for how sessions are saved and restored.
+
+Stacks that are not an unaltered memory map of their own file (e.g. compressed TIFF or NRRD,
+or any stack that was flipped, rotated or reordered) and ingredients with no file are also
+written to .npy files in a cache directory next to the session file (session.yml ->
+session.cache/). They are memory-mapped on restore so only the slices that are displayed are
+read. A stack's cache file is named after a digest of its data (see array_digest), so an
+unchanged stack is not written again by later saves and a changed one always is.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+import numpy as np
+import yaml
+
+SESSION_VERSION = 1
+SESSION_FILTER = "Lasagna sessions (*.yml *.yaml)"
+
+
+def file_stamp(fname):
+    """
+    Return [modification time in ns, size in bytes] of fname, or None if it does not exist
+    """
+    if not fname or not os.path.isfile(fname):
+        return None
+    stat = os.stat(fname)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def cache_dir(session_fname):
+    """
+    The directory holding the array caches of session file session_fname
+    """
+    return os.path.splitext(os.path.abspath(session_fname))[0] + ".cache"
+
+
+def cache_file_name(object_name, digest=None):
+    """
+    Return the name of the cache file of the ingredient object_name. With the digest of the
+    data (see array_digest) the name changes when the data change.
+    """
+    name = re.sub(r"[^\w.-]", "_", object_name)
+    if digest is None:
+        return name + ".npy"
+    return "%s_%s.npy" % (name, digest)
+
+
+def array_digest(data, chunk_bytes=64 * 1024 ** 2):
+    """
+    Return a short hex digest of the shape, type and values of the array data. Read in slabs
+    along the first axis of about chunk_bytes, so memory maps and views are not copied whole.
+    """
+    data = np.asanyarray(data)
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(("%s %s" % (data.dtype.str, data.shape)).encode())
+    if data.ndim == 0 or data.shape[0] == 0:
+        digest.update(np.ascontiguousarray(data).tobytes())
+        return digest.hexdigest()
+    step = max(1, chunk_bytes // max(data[0].nbytes, 1))
+    for start in range(0, data.shape[0], step):
+        digest.update(np.ascontiguousarray(data[start:start + step]).data)
+    return digest.hexdigest()
+
+
+def write_array_cache(fname, data):
+    """
+    Save data to the .npy file fname. Written to a temporary file first so that an interrupted
+    save does not leave a truncated cache behind. Returns True on success.
+    """
+    directory = os.path.dirname(fname)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp_name = None
+    try:
+        fd, tmp_name = tempfile.mkstemp(prefix=".cache_", suffix=".npy", dir=directory)
+        with os.fdopen(fd, "wb") as stream:
+            np.save(stream, data)
+        os.replace(tmp_name, fname)
+    except (IOError, OSError) as err:
+        print("Could not write session cache {}: {}".format(fname, err))
+        if tmp_name is not None and os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        return False
+    return True
+
+
+def open_array_cache(fname):
+    """
+    Return the array in the .npy file fname as a read-only memory map, or None if it can not be read
+    """
+    if not os.path.isfile(fname):
+        return None
+    try:
+        return np.load(fname, mmap_mode="r")
+    except (IOError, OSError, ValueError) as err:
+        print("Could not read session cache {}: {}".format(fname, err))
+        return None
+
+
+def plain_value(value):
+    """
+    Return value with numpy arrays and scalars (also inside lists, tuples and dictionaries)
+    replaced by Python lists and numbers so that it can be written with yaml.safe_dump
+    """
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [plain_value(v) for v in value]
+    if isinstance(value, set):
+        return sorted(plain_value(v) for v in value)
+    if isinstance(value, dict):
+        return dict((plain_value(k), plain_value(v)) for k, v in value.items())
+    return value
+
+
+def write_session(fname, session):
+    """
+    Write the session dictionary to the YAML file fname, atomically
+    """
+    session = dict(session, version=SESSION_VERSION)
+    directory = os.path.dirname(os.path.abspath(fname))
+    fd, tmp_name = tempfile.mkstemp(prefix=".session_", suffix=".yml", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as stream:
+            yaml.safe_dump(plain_value(session), stream, default_flow_style=None, sort_keys=False)
+        os.replace(tmp_name, fname)
+    except (IOError, OSError):
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+
+def read_session(fname):
+    """
+    Return the session dictionary in the YAML file fname. Relative paths in it are made absolute.
+    Raises ValueError if the file is not a session file.
+    """
+    with open(fname, "r") as stream:
+        session = yaml.safe_load(stream)
+    if not isinstance(session, dict) or "ingredients" not in session:
+        raise ValueError("{} is not a Lasagna session file".format(fname))
+    if session.get("version", SESSION_VERSION) > SESSION_VERSION:
+        print("Session {} was saved by a newer version of Lasagna. Some settings may be ignored".format(fname))
+
+    directory = cache_dir(fname)
+    for entry in session["ingredients"]:
+        if entry.get("cache"):
+            entry["cache"] = os.path.join(directory, entry["cache"])
+    return session
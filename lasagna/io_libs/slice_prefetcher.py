@@ -0,0 +1,178 @@
+"""
+Read the slices that will be displayed at upcoming timepoints of a time series before they are needed.
+
+During playback every frame shows one slice per view at the next timepoint. If the series is
+memory-mapped or read from disk, fetching those slices can take longer than a frame. A
+background thread therefore reads the displayed slices of the next few timepoints into a
+fixed-size ring buffer. The GUI thread takes slices from the buffer and only reads from the
+volume itself on a miss.
+
+When the series is replaced (e.g. flipped or rotated) the prefetcher's generation is bumped.
+Slices are keyed by generation, so a read the worker started on the old series can not be
+returned for the new one.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class sliceRingBuffer(object):
+    """
+    A fixed number of slots holding 2-D slices keyed by (timepoint, axis, slice, generation).
+    When full, the oldest slice is overwritten. The prefetcher frees the slots of past timepoints
+    as playback moves on so that the buffer only holds the current and upcoming timepoints.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._slots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._slots.get(key)
+
+    def put(self, key, image):
+        with self._lock:
+            self._slots[key] = image
+            self._slots.move_to_end(key)
+            while len(self._slots) > self.capacity:
+                self._slots.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._slots
+
+    def keepOnly(self, timepoints, generation):
+        """
+        Free the slots of slices that are not at one of timepoints or are from another generation
+        """
+        with self._lock:
+            for key in [k for k in self._slots if k[0] not in timepoints or k[3] != generation]:
+                del self._slots[key]
+
+    def nbytes(self):
+        with self._lock:
+            return sum(image.nbytes for image in self._slots.values())
+
+    def clear(self):
+        with self._lock:
+            self._slots.clear()
+
+
+class slicePrefetcher(object):
+    def __init__(self, readSlice, depth=8):
+        """
+        readSlice - function (timepoint, axis, slice) -> 2-D array. Called on the worker thread.
+        depth - the number of timepoints to read ahead
+        """
+        self.readSlice = readSlice
+        self.depth = depth
+        self.buffer = sliceRingBuffer(capacity=3 * (depth + 1))
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0  # bumped by invalidate when the series changes
+
+        self._request = None  # (timepoints, slices per axis, generation) - only the latest request matters
+        self._wake = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._work, name="slicePrefetcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def prefetch(self, timepoint, nTimepoints, slices, loop=True):
+        """
+        Ask for the slices in slices (one per axis) at the timepoints after timepoint to be read.
+        Replaces any earlier request that has not been completed.
+        """
+        upcoming = []
+        for step in range(1, self.depth + 1):
+            t = timepoint + step
+            if t >= nTimepoints:
+                if not loop:
+                    break
+                t = t % nTimepoints
+            upcoming.append(t)
+
+        # Slices from timepoints that have been shown are not needed again
+        self.buffer.keepOnly(set(upcoming) | {timepoint}, self.generation)
+        with self._wake:
+            self._request = (upcoming, tuple(slices), self.generation)
+            self._wake.notify()
+
+    def clear(self):
+        """
+        Drop the request that has not been completed and empty the buffer
+        """
+        with self._wake:
+            self._request = None
+        self.buffer.clear()
+
+    def invalidate(self):
+        """
+        Call when the series has changed. Slices read from the previous series are discarded,
+        including any the worker is reading now.
+        """
+        with self._wake:
+            self.generation += 1
+        self.clear()
+
+    def get(self, timepoint, axis, sliceToPlot):
+        """
+        Return the slice from the buffer or read it now if it is not there
+        """
+        key = (timepoint, axis, sliceToPlot, self.generation)
+        image = self.buffer.get(key)
+        if image is not None:
+            self.hits += 1
+            return image
+        self.misses += 1
+        image = self._copy(self.readSlice(timepoint, axis, sliceToPlot))
+        self.buffer.put(key, image)
+        return image
+
+    @staticmethod
+    def _copy(image):
+        """
+        A contiguous in-RAM copy of image. Slicing a memory map only creates a view, so this
+        is where the data are actually read.
+        """
+        return np.array(image, order="C", copy=True)
+
+    def _work(self):
+        while True:
+            with self._wake:
+                while self._request is None and not self._stop:
+                    self._wake.wait()
+                if self._stop:
+                    return
+                upcoming, slices, generation = self._request
+                self._request = None
+
+            keys = [(t, axis, slice_to_plot, generation)
+                    for t in upcoming for axis, slice_to_plot in enumerate(slices)]
+            for key in keys:
+                if self._request is not None or self._stop or generation != self.generation:
+                    break  # a newer request supersedes this one or the series has changed
+                if key in self.buffer:
+                    continue
+                try:
+                    image = self._copy(self.readSlice(*key[:3]))
+                except (IndexError, ValueError, IOError):
+                    continue
+                # The series may have changed during the read. A stale slice is keyed by its old
+                # generation so it is never returned by get, but it need not take up a slot.
+                if generation == self.generation:
+                    self.buffer.put(key, image)
+
+    def stop(self):
+        """
+        End the worker thread. Waits briefly for a read in progress to finish.
+        """
+        with self._wake:
+            self._stop = True
+            self._wake.notify()
+        self._thread.join(timeout=1)
+        self.buffer.clear()
@@ -205,3 +205,35 @@ def read_lasagna_pts(fname):
             continue
         data.append([float(x) for x in as_list[i].split(",")])
     return data
+
+
+def read_lasagna_lines(fname):
+    """ Read a lasagna lines file
+
+    Each line of the file is "lineseries_id,z,x,y". Points with the same lineseries_id are
+    linked. Consecutive series are separated by a row of NaNs in the output.
+
+    :param str fname: path to file (usually .csv or .txt)
+    :return data: a list of (z, x, y) coordinates, or None if the file is not a lines file
+    """
+    with open(str(fname), "r") as fid:
+        contents = fid.read()
+
+    data = []
+    last_line_series = None
+    for line in contents.split("\n"):
+        if not line:
+            continue
+
+        line_as_floats = [float(x) for x in line.split(",")]
+        if len(line_as_floats) != 4:
+            # All rows need a length of 4, since this is what a line series needs
+            print("Lines data file {} appears corrupt".format(fname))
+            return None
+
+        if last_line_series is not None and last_line_series != line_as_floats[0]:
+            data.append([float("nan")] * 3)
+
+        last_line_series = line_as_floats[0]
+        data.append(line_as_floats[1:])
+    return data
@@ -2,14 +2,19 @@
 this file describes a class that handles the axis behavior for the lasagna viewer
 """
 
+import numpy as np
 import pyqtgraph as pg
 
 
 from lasagna.ingredients.imagestack import imagestack as lasagna_imagestack
-from lasagna.utils.lasagna_qt_helper_functions import find_pyqt_graph_object_name_in_plot_widget
 from lasagna.utils import preferences
 
 
+# Pens of the cross hairs drawn under the mouse: normal and highlighted (Ctrl-drag)
+CROSSHAIR_PEN = (220, 200, 0, 180)
+CROSSHAIR_HIGHLIGHT_PEN = (240, 0, 0, 200)
+
+
 class projection2D():
 
     def __init__(self, thisPlotWidget, lasagna_serving, axisName='', minMax=(0, 1500), axisRatio=1, axisToPlot=0):
@@ -42,14 +47,30 @@ class projection2D():
         # Loop through the ingredients list and add them to the ViewBox
         self.lasagna = lasagna_serving
         self.items = []  # a list of added plot items TODO: check if we really need this
+        # The same items indexed by objectName and by pyqtgraph class name (e.g. 'ImageItem')
+        # so that they can be found without walking the items of the PlotWidget
+        self._itemsByName = {}
+        self._itemsByKind = {}
         self.addItemsToPlotWidget(self.lasagna.ingredientList)
 
         # The currently plotted slice
         self.currentSlice = None
 
+        # Vertical and horizontal cross hair lines. Added to the view once (see showCrossHairs)
+        # and afterwards only moved, shown and hidden.
+        self.crossHairs = None
+        self._crossHairsHighlighted = False
+
+        # If not None, image stacks are sampled on this oblique plane instead of the axis-aligned slice
+        # (see lasagna.image_processing.oblique_slice and setObliquePlane)
+        self.obliquePlane = None
+
         # Link the progressLayer signal to a slot that will move through image layers as the wheel is turned
         self.view.getViewBox().progressLayer.connect(self.wheel_layer_slot)
 
+        # Oblique planes are sampled only where they are visible so must be re-sampled on pan and zoom
+        self.view.getViewBox().sigRangeChanged.connect(self.viewRangeChanged_slot)
+
     def addItemToPlotWidget(self, ingredient):
         """
         Adds an ingredient to the PlotWidget as an item (i.e. the ingredient manages the process of 
@@ -65,6 +86,8 @@ class projection2D():
 
         self.view.addItem(_item)
         self.items.append(_item)
+        self._itemsByName[_item.objectName] = _item
+        self._itemsByKind.setdefault(ingredient.pgObject, []).append(_item)
 
     def removeItemFromPlotWidget(self, item):
         """
@@ -74,33 +97,36 @@ class projection2D():
         make something invisible
 
         "item" is either a string defining an objectName or the object itself
+        Returns True if the item was in the PlotWidget.
         """
-        items = list(self.view.items())
-        n_items_before = len(items)  # to determine if an item was removed
         if isinstance(item, str):
-            removed = False
-            for this_item in items:
-                if hasattr(this_item, 'objectName') and this_item.objectName == item:
-                        self.view.removeItem(this_item)
-                        removed = True
-            if not removed:
-                print("lasagna_axis.removeItemFromPlotWidget failed to remove item defined by string " + item)
-        else:  # it should be an image item
-            self.view.removeItem(item)
-
-        # Optionally return True of False depending on whether the removal was successful
-        n_items_after = len(list(self.view.items()))
-
-        if n_items_after < n_items_before:
-            return True
-        elif n_items_after == n_items_before:
-            return False
-        else:
-            print('** removeItemFromPlotWidget: %d items before removal and %d after removal **' % (n_items_before,
-                                                                                                    n_items_after))
-            return False
+            name = item
+            item = self._itemsByName.get(name)
+            if item is None:
+                print("lasagna_axis.removeItemFromPlotWidget failed to remove item defined by string " + name)
+                return False
 
-        print("%d items after remove call" % len(list(self.view.items())))  # FIXME: unreachable code
+        removed = item in self.view.getPlotItem().items
+        self._releasePlotItem(item)
+        return removed
+
+    def _releasePlotItem(self, item):
+        """
+        Remove item from the view and drop every reference we hold to it so that the
+        image buffers it holds can be freed
+        """
+        self.view.removeItem(item)
+        if item in self.items:
+            self.items.remove(item)
+        name = getattr(item, 'objectName', None)
+        if isinstance(name, str) and self._itemsByName.get(name) is item:
+            del self._itemsByName[name]
+        for same_kind in self._itemsByKind.values():
+            if item in same_kind:
+                same_kind.remove(item)
+        if isinstance(item, pg.ImageItem):
+            item.clear()
+            item.dataImage = None
 
     def addItemsToPlotWidget(self, ingredients):
         """
@@ -132,27 +158,19 @@ class projection2D():
 
     def getPlotItemByName(self, objName):
         """
-        returns the first plot item in the list bearing the objectName 'objName'
-        because of the way we generally add objects, there *should* never be 
-        multiple objects with the same name
+        returns the plot item of the ingredient with objectName 'objName' or None.
+        Only items added with addItemToPlotWidget are found.
         """
-        for item in list(self.view.items()):
-            if hasattr(item, 'objectName') and isinstance(item.objectName, str):
-                if item.objectName == objName:
-                    return item
+        return self._itemsByName.get(objName)
 
     def getPlotItemByType(self, itemType):
         """
-        returns all plot items of the defined type. 
+        returns all plot items of the defined type, topmost (most recently added) first.
         itemType should be a string that defines a pyqtgraph item type. 
-        Examples include: ImageItem, ViewBox, PlotItem, AxisItem and LabelItem
+        Examples include: ImageItem, ScatterPlotItem and PlotCurveItem
+        Only items added with addItemToPlotWidget are found.
         """
-        item_list = []
-        for item in list(self.view.items()):
-            if item.__module__.endswith(itemType):
-                item_list.append(item)
-
-        return item_list
+        return self._itemsByKind.get(itemType, [])[::-1]
 
     def hideItem(self, item):
         """
@@ -162,13 +180,19 @@ class projection2D():
         print("NEED TO WRITE lasagna.axis.hideItem()")
         return
 
-    def updatePlotItems_2D(self, ingredientsList, sliceToPlot=None, resetToMiddleLayer=False):
+    def updatePlotItems_2D(self, ingredientsList, sliceToPlot=None, resetToMiddleLayer=False, rendered=None):
         """
         Update all plot items on axis, redrawing so everything associated with a specified 
         slice (sliceToPlot) is shown. This is done based upon a list of ingredients
+        rendered - optional dictionary of image stack name -> result of its renderSlice for this
+                   axis and slice (see RedrawScheduler). Those stacks are only applied to their
+                   plot items here.
         """
         verbose = False
 
+        if any(isinstance(ingredient, lasagna_imagestack) for ingredient in ingredientsList):
+            self.setCurrentSlice(sliceToPlot, resetToMiddleLayer)
+
         # loop through all plot items searching for imagestack items (these need to be plotted first)
         for ingredient in ingredientsList:
             if isinstance(ingredient, lasagna_imagestack):
@@ -178,26 +202,17 @@ class projection2D():
                 #      plot items. So I can't assign a single plot item to the ingredient. Options?
                 #      a list of items and axes in the ingredient? I don't like that.
 
-                # Got to the middle of the stack
-                if sliceToPlot is None or resetToMiddleLayer:
-                    stacks = self.lasagna.returnIngredientByType('imagestack')
-                    num_slices = []
-                    [num_slices.append(stack.data(self.axisToPlot).shape[0]) for stack in stacks]
-                    num_slices = max(num_slices)
-                    sliceToPlot = num_slices // 2
-
-                self.currentSlice = sliceToPlot
-
                 if verbose:
                     print("lasagna_axis.updatePlotItems_2D - plotting ingredient " + ingredient.objectName)
 
-                ingredient.plotIngredient(
-                    pyqtObject=find_pyqt_graph_object_name_in_plot_widget(self.view,
-                                                                          ingredient.objectName,
-                                                                          verbose=verbose),
-                    axisToPlot=self.axisToPlot,
-                    sliceToPlot=self.currentSlice
-                )
+                pyqt_object = self.getPlotItemByName(ingredient.objectName)
+                if rendered is not None and ingredient.objectName in rendered:
+                    ingredient.applyRenderedSlice(pyqt_object, rendered[ingredient.objectName],
+                                                  axisToPlot=self.axisToPlot, sliceToPlot=self.currentSlice)
+                else:
+                    ingredient.plotIngredient(pyqtObject=pyqt_object,
+                                              axisToPlot=self.axisToPlot,
+                                              sliceToPlot=self.currentSlice)
                 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
         # the image is now displayed
@@ -209,23 +224,77 @@ class projection2D():
                     print("lasagna_axis.updatePlotItems_2D - plotting ingredient " + ingredient.objectName)
 
                 ingredient.plotIngredient(
-                    pyqtObject=find_pyqt_graph_object_name_in_plot_widget(self.view,
-                                                                          ingredient.objectName,
-                                                                          verbose=verbose),
+                    pyqtObject=self.getPlotItemByName(ingredient.objectName),
                     axisToPlot=self.axisToPlot,
                     sliceToPlot=self.currentSlice
                 )
 
+        self.lasagna.requestRegionHistogram(self)
+
+    def setCurrentSlice(self, sliceToPlot=None, resetToMiddleLayer=False):
+        """
+        Set the slice shown by this axis without redrawing anything.
+        If sliceToPlot is None or resetToMiddleLayer is True we go to the middle of the largest stack.
+        """
+        if sliceToPlot is None or resetToMiddleLayer:
+            stacks = self.lasagna.returnIngredientByType('imagestack')
+            if not stacks:
+                return
+            num_slices = []
+            [num_slices.append(stack.displayShape(self.axisToPlot)[0]) for stack in stacks]
+            num_slices = max(num_slices)
+            sliceToPlot = num_slices // 2
+
+        self.currentSlice = sliceToPlot
+
     def updateDisplayedSlices_2D(self, ingredients, slicesToPlot):
         """
         Update the image planes shown in each of the axes
         ingredients - lasagna.ingredients
         slicesToPlot - a tuple of length 2 that defines which slices to plot for the Y and X linked axes
+
+        The redraws are handed to the redraw scheduler so they are coalesced with any other
+        redraws requested during the same event.
         """
         # self.updatePlotItems_2D(ingredients)  # TODO: Not have this here. This should be set when the mouse enters the axis and then not changed.
                                                # Like this it doesn't work if we are to change the displayed slice in the current axis using the mouse wheel.
-        self.linkedYprojection.updatePlotItems_2D(ingredients, slicesToPlot[0])
-        self.linkedXprojection.updatePlotItems_2D(ingredients, slicesToPlot[1])
+        self.lasagna.redrawScheduler.requestRedraw(self.linkedYprojection, slicesToPlot[0])
+        self.lasagna.redrawScheduler.requestRedraw(self.linkedXprojection, slicesToPlot[1])
+
+    def setObliquePlane(self, plane=None):
+        """
+        Sample image stacks in this axis on an oblique plane (an obliquePlane instance).
+        Set plane to None to return to axis-aligned slices.
+        Points and lines are still drawn relative to the axis-aligned slice.
+        """
+        self.obliquePlane = plane
+        self.lasagna.redrawScheduler.requestRedraw(self, self.currentSlice)
+
+    def obliqueSamplingRegion(self, imageShape):
+        """
+        Return the region of the view to sample when drawing an oblique plane and the
+        resolution to sample it at. The region is the visible part of an image of shape
+        imageShape (x, y), rounded out to whole voxels. The resolution is the smaller of
+        the voxel count and the number of screen pixels covering the region.
+
+        Returns (x0, y0, width, height), (rows, cols) or None if nothing is visible.
+        """
+        view_box = self.view.getViewBox()
+        (x_min, x_max), (y_min, y_max) = view_box.viewRange()
+
+        x0 = max(0, int(np.floor(x_min)))
+        y0 = max(0, int(np.floor(y_min)))
+        x1 = min(imageShape[0], int(np.ceil(x_max)))
+        y1 = min(imageShape[1], int(np.ceil(y_max)))
+        if x1 <= x0 or y1 <= y0:
+            return None
+
+        pixels_per_voxel_x = view_box.width() / max(x_max - x_min, 1e-6)
+        pixels_per_voxel_y = view_box.height() / max(y_max - y_min, 1e-6)
+        rows = int(np.clip(np.ceil((x1 - x0) * pixels_per_voxel_x), 1, x1 - x0))
+        cols = int(np.clip(np.ceil((y1 - y0) * pixels_per_voxel_y), 1, y1 - y0))
+
+        return (x0, y0, x1 - x0, y1 - y0), (rows, cols)
 
     def getMousePositionInCurrentView(self, pos):
         # TODO: figure out what pos is and where best to put it. Then can integrate this call into updateDisplayedSlices
@@ -241,11 +310,58 @@ class projection2D():
         """
         self.view.autoRange()
 
+    # ------------------------------------------------------
+    # Cross hairs
+    def _makeCrossHairs(self):
+        if self.crossHairs is None:
+            self.crossHairs = (
+                pg.InfiniteLine(pen=CROSSHAIR_PEN, angle=90, movable=False),
+                pg.InfiniteLine(pen=CROSSHAIR_PEN, angle=0, movable=False),
+            )
+            for line, name in zip(self.crossHairs, ("crossHairVLine", "crossHairHLine")):
+                line.objectName = name
+                line.setVisible(False)
+                line.setZValue(1000)  # above all ingredients
+                self.view.addItem(line, ignoreBounds=True)
+            self._crossHairsHighlighted = False
+        return self.crossHairs
+
+    def showCrossHairs(self, x, y, highlight=False):
+        """
+        Show the cross hairs at position (x, y) of the view, in red if highlight is True
+        """
+        v_line, h_line = self._makeCrossHairs()
+        if highlight != self._crossHairsHighlighted:
+            pen = CROSSHAIR_HIGHLIGHT_PEN if highlight else CROSSHAIR_PEN
+            v_line.setPen(pen)
+            h_line.setPen(pen)
+            self._crossHairsHighlighted = highlight
+        v_line.setPos(x)
+        h_line.setPos(y)
+        if not v_line.isVisible():
+            v_line.setVisible(True)
+            h_line.setVisible(True)
+
+    def hideCrossHairs(self):
+        if self.crossHairs is None or not self.crossHairs[0].isVisible():
+            return
+        for line in self.crossHairs:
+            line.setVisible(False)
+
     # ------------------------------------------------------
     # slots
+    def viewRangeChanged_slot(self):
+        """
+        Re-sample oblique planes and the visible region histogram when the user pans or zooms
+        """
+        if self.obliquePlane is not None and self.currentSlice is not None:
+            self.lasagna.redrawScheduler.requestRedraw(self, self.currentSlice)
+        else:
+            self.lasagna.requestRegionHistogram(self)
+
     def wheel_layer_slot(self):
         """
         Handle the wheel action that allows the user to move through stack layers
         """
-        self.updatePlotItems_2D(self.lasagna.ingredientList,
-                                sliceToPlot=round(self.currentSlice + self.view.getViewBox().progressBy))  # round creates an int that supresses a warning in p3
+        self.lasagna.redrawScheduler.requestRedraw(
+            self, sliceToPlot=round(self.currentSlice + self.view.getViewBox().progressBy))  # round creates an int that supresses a warning in p3
@@ -1,5 +1,8 @@
 import os
+import re
+import string
 import sys
+import time
 
 import numpy as np
 import pyqtgraph as pg
@@ -14,12 +17,26 @@ from PyQt5.QtWidgets import qApp, QMainWindow
 # import nrrd
 
 from lasagna import lasagna_mainWindow, lasagna_axis, ingredients
-from lasagna.io_libs import image_stack_loader
+from lasagna.redraw_scheduler import RedrawScheduler
+from lasagna.filter_worker import FilterWorkerPool
+from lasagna.async_hooks import AsyncHookPool
+from lasagna.hook_profiler import HookProfiler
+from lasagna.hook_profiler_dialog import HookProfilerDialog
+from lasagna.ingredient_registry import IngredientRegistry
+from lasagna.memory_manager import MemoryManager
+from lasagna.memory_usage_dialog import MemoryUsageDialog
+from lasagna.image_processing import display_filters, oblique_slice, region_histogram, slab_projection, stack_expression
+from lasagna.image_processing.voxel_query import formatVoxelValue
+from lasagna.interaction_recorder import InteractionRecorder, RECORDING_FILTER
+from lasagna.oblique_dialog import ObliquePlaneDialog
+from lasagna.session import SessionManager
+from lasagna.timeseries_controls import TimeSeriesControls
+from lasagna.io_libs import image_stack_loader, session_io
 from lasagna.plugins import plugin_handler
-from lasagna.utils import preferences, path_utils
-from lasagna.utils.lasagna_qt_helper_functions import (
-    find_pyqt_graph_object_name_in_plot_widget,
-)
+from lasagna.plugins.io.io_plugin_base import LazyIoPlugin
+from lasagna.utils import preferences, path_utils, startup_profile
+from lasagna.utils.pref_utils import get_lasagna_pref_dir, get_lasagna_pref_file
+from lasagna.utils.timing_stats import durationStats
 
 
 class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
@@ -33,6 +50,7 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         self.win = QMainWindow()
         self.setupUi(self)
         self.show()
+        startup_profile.mark("main window")
         self.app = None  # The QApplication handle kept here
         self.embed_console = embed_console
 
@@ -43,6 +61,8 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
 
         # We will maintain a list of classes of loaded items that can be added to plots
         self.ingredientList = []
+        # The same ingredients indexed by name and type (see returnIngredientByName/ByType)
+        self.ingredientRegistry = IngredientRegistry()
 
         # Set up GUI based on preferences
         self.view1Z_spinBox.setValue(
@@ -73,6 +93,14 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             preferences.readPreference("defaultSymbolOpacity")
         )
 
+        # Optionally plot the histogram of only the visible part of the slice. Created before the
+        # axes as their pan and zoom signals check it.
+        self.regionHistogramCheckBox = QtWidgets.QCheckBox("Visible region", self.imageSettingsTab)
+        self.regionHistogramCheckBox.setToolTip(
+            "Show the histogram of the part of the slice visible in the view under the mouse"
+        )
+        self.horizontalLayout_13.insertWidget(1, self.regionHistogramCheckBox)
+
         # Set up axes
         # Turn axisRatioLineEdit_x elements into a list to allow functions to iterate across them
         self.axisRatioLineEdits = [
@@ -152,10 +180,31 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         self.axes2D[1].linkedXprojection = self.axes2D[2]
         self.axes2D[1].linkedYprojection = self.axes2D[0]
 
-        # UI elements updated during mouse moves over an axis
-        self.crossHairVLine = None
-        self.crossHairHLine = None
+        startup_profile.mark("axes")
+
+        # Redraw requests are collected here and executed at most once per axis per frame
+        self.redrawScheduler = RedrawScheduler(
+            self,
+            frameInterval=preferences.readPreference("redrawFrameInterval"),
+            renderThreads=preferences.readPreference("renderThreads"),
+        )
+
+        # Display filters run on these threads so that scrolling stays responsive
+        self.filterWorkers = FilterWorkerPool(self)
+
+        # Keeps track of the RAM used by each ingredient and, optionally, holds it under a budget
+        self.memoryManager = MemoryManager(self, budgetMB=preferences.readPreference("memoryBudget_MB"))
+        self.memoryCheckTimer = QtCore.QTimer(self)
+        self.memoryCheckTimer.setInterval(5000)  # caches grow as the user scrolls, so re-check periodically
+        self.memoryCheckTimer.timeout.connect(self.memoryManager.enforceBudget)
+        if self.memoryManager.budgetMB:
+            self.memoryCheckTimer.start()
+
+        # UI elements updated during mouse moves over an axis (the cross hairs belong to the axes)
         self.showCrossHairs = preferences.readPreference("showCrossHairs")
+        # Time taken to handle each mouse move (see mouseMoved and benchmarks/hover_benchmark.py)
+        self.hoverStats = durationStats(budget_ms=preferences.readPreference("hoverBudget_ms"))
+
         self.mouseX = None
         self.mouseY = None
         self.inAxis = 0  # The axis the mouse is currently in [see mouseMoved()]
@@ -192,6 +241,25 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             "axisClicked": [],
         }
 
+        # Optionally times every hook function run by runHook (see View > Plugin hook timings)
+        self.hookProfiler = HookProfiler(
+            self.hooks,
+            budget_ms=preferences.readPreference("hookBudget_ms"),
+            enabled=preferences.readPreference("profileHooks"),
+        )
+        self.hookProfilerDialog = None
+
+        # Plugin hooks declared with @asyncHook run here rather than in the mouse-move handler
+        self.asyncHooks = AsyncHookPool()
+
+        # Saves and restores sessions. Restored stacks that must be read whole load in the background.
+        self.sessions = SessionManager(self)
+
+        # Records mouse use on the views for benchmarks/replay_benchmark.py (View > Record interactions)
+        self.interactionRecorder = InteractionRecorder(self)
+
+        startup_profile.mark("workers and hooks")
+
         # Handle IO plugins. For instance these are the loaders that handle different data types
         # and different loading actions.
 
@@ -206,7 +274,9 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         io_paths = list(set(io_paths))  # remove duplicate paths
 
         print("Adding IO module paths to Python path")
-        io_plugins, io_plugin_paths = plugin_handler.find_plugins(io_paths)
+        io_manifest = plugin_handler.plugin_manifest(
+            io_paths, cache_file=get_lasagna_pref_dir() + "io_plugin_manifest.yml"
+        )
         for p in io_paths:
             sys.path.append(p)  # append to system path
             print(p)
@@ -216,9 +286,15 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         self.loadActions = (
             {}
         )  # actions must be attached to the lasagna object or they won't function
-        for io_module in io_plugins:
+        for io_entry in io_manifest:
+            if "objectName" in io_entry and not io_entry["has_hooks"]:
+                # Imported when first used. See LazyIoPlugin.
+                self.loadActions[io_entry["objectName"]] = LazyIoPlugin(self, io_entry)
+                continue
+
+            # The manifest can not tell how to show this plugin in the menu, or it has hooks to attach
             io_class, io_name = plugin_handler.get_plugin_instance_from_file_name(
-                io_module, attribute_to_import="loaderClass"
+                io_entry["file_name"], attribute_to_import="loaderClass"
             )
             if io_class is None:
                 continue
@@ -227,11 +303,47 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             print(
                 (
                     "Added %s to load menu as object name %s"
-                    % (io_module, this_instance.objectName)
+                    % (io_entry["file_name"], this_instance.objectName)
                 )
             )
         print("")
 
+        startup_profile.mark("IO plugins")
+
+        # View menu. Created here rather than in the designer file.
+        self.menuView = QtWidgets.QMenu("&View", self.menuBar)
+        self.menuBar.insertMenu(self.menuHelp.menuAction(), self.menuView)
+        self.actionObliquePlanes = QtWidgets.QAction("Oblique planes...", self)
+        self.actionObliquePlanes.triggered.connect(self.showObliquePlaneDialog)
+        self.menuView.addAction(self.actionObliquePlanes)
+        self.obliquePlaneDialog = None
+        self.actionMemoryUsage = QtWidgets.QAction("Memory usage...", self)
+        self.actionMemoryUsage.triggered.connect(self.showMemoryUsageDialog)
+        self.menuView.addAction(self.actionMemoryUsage)
+        self.memoryUsageDialog = None
+
+        self.actionHookProfiler = QtWidgets.QAction("Plugin hook timings...", self)
+        self.actionHookProfiler.triggered.connect(self.showHookProfilerDialog)
+        self.menuView.addAction(self.actionHookProfiler)
+
+        self.actionRecordInteractions = QtWidgets.QAction("Record interactions", self)
+        self.actionRecordInteractions.setCheckable(True)
+        self.actionRecordInteractions.triggered.connect(self.recordInteractions_Slot)
+        self.menuView.addAction(self.actionRecordInteractions)
+
+        # Timepoint slider and play button. Only shown while a time series stack is loaded.
+        self.timeSeriesControls = TimeSeriesControls(self, parent=self)
+        self.addToolBar(QtCore.Qt.BottomToolBarArea, self.timeSeriesControls)
+
+        # Session actions in the File menu
+        self.actionOpenSession = QtWidgets.QAction("Open session...", self)
+        self.actionOpenSession.triggered.connect(self.showSessionLoadDialog)
+        self.actionSaveSession = QtWidgets.QAction("Save session...", self)
+        self.actionSaveSession.triggered.connect(self.showSessionSaveDialog)
+        self.menuFile.insertAction(self.actionQuit, self.actionOpenSession)
+        self.menuFile.insertAction(self.actionQuit, self.actionSaveSession)
+        self.menuFile.insertSeparator(self.actionQuit)
+
         # Link other menu signals to slots
         self.actionOpen.triggered.connect(self.showStackLoadDialog)
         self.actionQuit.triggered.connect(self.quitLasagna)
@@ -245,6 +357,7 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         # Image tab stuff
         # ImageStack QTreeView (see lasagna_ingredient.addToList for where the model is updated on ingredient addition)
         self.logYcheckBox.clicked.connect(self.plotImageStackHistogram)
+        self.regionHistogramCheckBox.clicked.connect(self.plotImageStackHistogram)
         self.imageAlpha_horizontalSlider.valueChanged.connect(
             self.imageAlpha_horizontalSlider_slot
         )
@@ -313,44 +426,37 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         # 1. Get a list of all plugins in the plugins path and add their directories to the Python path
         plugin_paths = preferences.readPreference("pluginPaths")
 
-        plugins, plugin_paths = plugin_handler.find_plugins(plugin_paths)
+        plugins = plugin_handler.plugin_manifest(
+            plugin_paths, cache_file=get_lasagna_pref_dir() + "plugin_manifest.yml"
+        )
         print("Adding plugin paths to Python path:")
         self.pluginSubMenus = {}
-        for (
-            p
-        ) in (
-            plugin_paths
-        ):  # print plugin paths to screen, add to path, add as sub-dir names in Plugins menu
+        for plugin in plugins:  # print plugin paths to screen, add to path, add as sub-dir names in Plugins menu
+            p = plugin["directory"]
+            dir_name = plugin["menu_dir"]
+            if dir_name in self.pluginSubMenus:
+                continue
             print(p)
             sys.path.append(p)
-            dir_name = p.split(os.path.sep)[-1]
             self.pluginSubMenus[dir_name] = QtWidgets.QMenu(self.menuPlugins)
             self.pluginSubMenus[dir_name].setObjectName(dir_name)
             self.pluginSubMenus[dir_name].setTitle(dir_name)
             self.menuPlugins.addAction(self.pluginSubMenus[dir_name].menuAction())
 
         # 2. Add each plugin to a dictionary where the keys are plugin name and values are instances of the plugin.
+        # Plugin modules are not imported here but when the plugin is first started (see startPlugin)
         print("")
         self.plugins = (
             {}
-        )  # A dictionary where keys are plugin names and values are plugin classes or plugin instances
+        )  # A dictionary where keys are plugin names and values are plugin classes, plugin instances or None if not yet imported
         self.pluginActions = (
             {}
         )  # A dictionary where keys are plugin names and values are QActions associated with a plugin
         for plugin in plugins:
-            # Get the module name and class
-            plugin_class, plugin_name = plugin_handler.get_plugin_instance_from_file_name(
-                plugin, None
-            )
-            if plugin_class is None:
-                continue
-
-            # Get the name of the directory in which the plugin resides so we can add it to the right sub-menu
-            dir_name = os.path.dirname(plugin_class.__file__).split(os.path.sep)[-1]
-
-            # create instance of the plugin object and add to the self.plugins dictionary
-            print(("Creating reference to class " + plugin_name + ".plugin"))
-            self.plugins[plugin_name] = plugin_class.plugin
+            plugin_name = plugin["module_name"]
+            if plugin_name in self.plugins:
+                continue  # a plugin of the same name earlier in the path hides this one
+            self.plugins[plugin_name] = None
 
             # create an action associated with the plugin and add to the self.pluginActions dictionary
             print(("Creating menu QAction for " + plugin_name))
@@ -359,8 +465,11 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             self.pluginActions[plugin_name].setCheckable(
                 True
             )  # so we have a checkbox next to the menu entry
+            if "pluginLongName" in plugin:
+                self.pluginActions[plugin_name].setToolTip(plugin["pluginLongName"])
+                self.pluginActions[plugin_name].setStatusTip(plugin["pluginLongName"])
 
-            self.pluginSubMenus[dir_name].addAction(
+            self.pluginSubMenus[plugin["menu_dir"]].addAction(
                 self.pluginActions[plugin_name]
             )  # add action to the correct plugins sub-menu
             self.pluginActions[plugin_name].triggered.connect(
@@ -368,7 +477,15 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             )  # Connect this action's signal to the slot
         print("")
 
+        startup_profile.mark("plugins menu")
+
+        # Apply preferences that change while Lasagna is running, including edits to the file
+        preferences.addPreferenceListener(self.preferenceChanged)
+        self.preferencesWatcher = QtCore.QFileSystemWatcher([get_lasagna_pref_file()], self)
+        self.preferencesWatcher.fileChanged.connect(self.preferencesFileChanged)
+
         self.statusBar.showMessage("Initialised")
+        startup_profile.mark("remaining set-up")
 
     # -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
     def about_slot(self):
@@ -390,8 +507,25 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         else:
             self.stopPlugin(plugin_name)
 
+    def pluginClass(self, pluginName):
+        """
+        Return the plugin class of pluginName, importing its module if needed. None on failure.
+        """
+        plugin_module, _ = plugin_handler.get_plugin_instance_from_file_name(
+            pluginName + ".py", None
+        )
+        if plugin_module is None:
+            return None
+        return plugin_module.plugin
+
     def startPlugin(self, pluginName):
         print(("Starting " + pluginName))
+        if self.plugins[pluginName] is None:  # first start: import the module
+            self.plugins[pluginName] = self.pluginClass(pluginName)
+            if self.plugins[pluginName] is None:
+                self.pluginActions[pluginName].setChecked(False)
+                self.statusBar.showMessage("Could not load plugin %s" % pluginName)
+                return
         self.plugins[pluginName] = self.plugins[pluginName](
             self
         )  # Create an instance of the plugin object
@@ -410,13 +544,7 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         # delete the plugin instance and replace it in the dictionary with a reference (that what it is?) to the class
         # NOTE: plugins with a window do not run the following code when the window is closed. They should, however,
         # detach hooks (unless the plugin author forgot to do this)
-        del self.plugins[pluginName]
-        plugin_class, pluginName = plugin_handler.get_plugin_instance_from_file_name(
-            pluginName + ".py", None
-        )
-        if plugin_class is None:
-            return
-        self.plugins[pluginName] = plugin_class.plugin
+        self.plugins[pluginName] = self.pluginClass(pluginName)
 
     def runHook(self, hookArray, *args):
         """
@@ -425,22 +553,27 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         if len(hookArray) == 0:
             return
 
+        profiler = self.hookProfiler if self.hookProfiler.enabled else None
         for hook in hookArray:
             try:
                 if hook is None:
                     print("Skipping empty hook in hook list")
                     continue
-                else:
+                elif profiler is None:
                     hook(*args)
+                else:
+                    profiler.timeHook(hookArray, hook, args)
             except Exception as err:
                 print("Error running plugin method {}; main error {}".format(hook, err))
                 raise
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     # File menu and methods associated with loading the base image stack.
-    def loadImageStack(self, fnameToLoad):
+    def loadImageStack(self, fnameToLoad, kind="imagestack", **ingredientArgs):
         """
         Loads an image image stack.
+        kind - the ingredient that will hold the stack. e.g. 'labelstack' for an atlas annotation volume
+        ingredientArgs - extra arguments for the ingredient constructor (e.g. labelColors)
         """
         self.runHook(self.hooks["loadImageStack_Start"])
 
@@ -458,21 +591,33 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         if len(loaded_image_stack) == 0 and not loaded_image_stack:
             return False
 
-        # Set up default values in tabs
-        # It's ok to load images of different sizes but their voxel sizes need to be the same
-        ax_ratio = image_stack_loader.get_voxel_spacing(fnameToLoad)
-        for i in range(len(ax_ratio)):
-            self.axisRatioLineEdits[i].setText(str(ax_ratio[i]))
+        if kind == "imagestack" and loaded_image_stack.ndim == 4:
+            kind = "timeseriesstack"
 
         # Add to the ingredients list
         obj_name = fnameToLoad.split(os.path.sep)[-1]
         self.addIngredient(
             objectName=obj_name,
-            kind="imagestack",
+            kind=kind,
             data=loaded_image_stack,
             fname=fnameToLoad,
+            **ingredientArgs
+        )
+
+        # Stacks whose voxel size is known are resampled onto the grid of the reference stack
+        # as they are displayed (see imagestack.gridResampler), so they may differ in voxel size.
+        new_stack = self.returnIngredientByName(obj_name)
+        new_stack.setWorldTransform(
+            image_stack_loader.get_voxel_size(fnameToLoad),
+            image_stack_loader.get_origin(fnameToLoad),
         )
 
+        # Set up default values in tabs. The axis ratios are those of the grid we display.
+        if new_stack is self.referenceStack() or new_stack.voxelSize is None:
+            ax_ratio = image_stack_loader.get_voxel_spacing(fnameToLoad)
+            for i in range(len(ax_ratio)):
+                self.axisRatioLineEdits[i].setText(str(ax_ratio[i]))
+
         # Add item to all three 2D plots
         self.returnIngredientByName(obj_name).addToPlots()
 
@@ -599,6 +744,55 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         self.loadImageStack(fname)
         self.initialiseAxes()
 
+    # -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+    # Sessions (see lasagna.session)
+    def loadSession(self, fname):
+        """
+        Replace the current ingredients and view settings with those saved in the session file fname
+        """
+        return self.sessions.restore(fname)
+
+    def saveSession(self, fname):
+        self.sessions.save(fname)
+        self.statusBar.showMessage("Saved session " + fname)
+
+    def showSessionLoadDialog(self):
+        fname = QtWidgets.QFileDialog.getOpenFileName(
+            self, "Open session", preferences.readPreference("lastLoadDir"), session_io.SESSION_FILTER
+        )[0]
+        if fname:
+            preferences.preferenceWriter("lastLoadDir", path_utils.stripTrailingFileFromPath(str(fname)))
+            self.loadSession(str(fname))
+
+    def showSessionSaveDialog(self):
+        start = self.sessions.fname or preferences.readPreference("lastLoadDir")
+        fname = QtWidgets.QFileDialog.getSaveFileName(self, "Save session", start, session_io.SESSION_FILTER)[0]
+        if not fname:
+            return
+        fname = str(fname)
+        if not os.path.splitext(fname)[1]:
+            fname += ".yml"
+        self.saveSession(fname)
+
+    # -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+    # Interaction recording (see lasagna.interaction_recorder)
+    def recordInteractions_Slot(self, checked):
+        """
+        Start recording when the menu item is checked. When it is unchecked stop and ask where to save.
+        """
+        if checked:
+            self.interactionRecorder.start()
+            return
+        self.interactionRecorder.stop(save=False)
+        fname = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Save interaction recording", preferences.readPreference("lastLoadDir"), RECORDING_FILTER
+        )[0]
+        if fname:
+            fname = str(fname)
+            if not os.path.splitext(fname)[1]:
+                fname += ".json"
+            self.interactionRecorder.save(fname)
+
     def quitLasagna(self):
         """
         Neatly shut down the GUI
@@ -611,6 +805,13 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
                 ].confirmOnClose:  # TODO: handle cases where plugins want confirmation to close
                     self.stopPlugin(thisPlugin)
 
+        self.interactionRecorder.stop()  # saves a recording started with --record
+        preferences.removePreferenceListener(self.preferenceChanged)
+        self.memoryManager.cleanUp()
+        self.filterWorkers.shutdown()
+        self.asyncHooks.shutdown()
+        self.sessions.shutdown()
+        self.redrawScheduler.shutdown()
         qApp.quit()
         if self.embed_console:
             from prompt_toolkit.application.current import get_app
@@ -620,9 +821,35 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
     def closeEvent(self, event):
         self.quitLasagna()
 
+    def preferencesFileChanged(self, path):
+        """
+        Called by the file system watcher when the preferences file is edited
+        """
+        # Editors (and preferences.writeAllPreferences) replace the file, which stops it being watched
+        if path not in self.preferencesWatcher.files() and os.path.exists(path):
+            self.preferencesWatcher.addPath(path)
+        preferences.checkForChanges()
+
+    def preferenceChanged(self, preferenceName, value):
+        """
+        Apply a preference that was changed while Lasagna is running
+        """
+        if preferenceName == "redrawFrameInterval":
+            self.redrawScheduler.frameInterval = value
+        elif preferenceName == "memoryBudget_MB":
+            self.setMemoryBudget(value)
+        elif preferenceName == "hookBudget_ms":
+            self.hookProfiler.budget_ms = value
+        elif preferenceName == "hoverBudget_ms":
+            self.hoverStats.budget_ms = value
+        elif preferenceName == "showCrossHairs":
+            self.showCrossHairs = value
+            if not value:
+                self.removeCrossHairs()
+
     # ------------------------------------------------------------------------
     # Ingredient handling methods
-    def addIngredient(self, kind="", objectName="", data=None, fname=""):
+    def addIngredient(self, kind="", objectName="", data=None, fname="", **ingredientArgs):
         """
         Adds an ingredient to the list of ingredients.
         Scans the list of ingredients to see if an ingredient is already present.
@@ -650,11 +877,13 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         ingredient_class_obj = getattr(
             getattr(ingredients, kind), kind
         )  # make an ingredient of type "kind"
-        self.ingredientList.append(
-            ingredient_class_obj(
-                parent=self, fnameAbsPath=fname, data=data, objectName=objectName
-            )
+        ingredient = ingredient_class_obj(
+            parent=self, fnameAbsPath=fname, data=data, objectName=objectName, **ingredientArgs
         )
+        self.ingredientList.append(ingredient)
+        self.ingredientRegistry.add(ingredient)
+        self.memoryManager.enforceBudget()
+        self.updateTimeSeriesControls()
 
     def removeIngredient(self, ingredientInstance):
         """
@@ -662,17 +891,25 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         This method is called by the two following methods that remove based on
         ingredient name or type
         """
-        ingredientInstance.removePlotItem()  # remove from axes
+        # Check that nothing else (e.g. a plugin) is still holding on to the data once control
+        # returns to the event loop, so that a batch of removals shares one garbage collection
+        if self.memoryManager.watchRelease(ingredientInstance):
+            QtCore.QTimer.singleShot(0, self.reportUnreleasedData)
+        ingredientInstance.clearCaches()
+        ingredientInstance.removePlotItem()  # remove from axes (this also empties the ImageItems)
         self.ingredientList.remove(
             ingredientInstance
         )  # Remove ingredient from the list of ingredients
+        self.ingredientRegistry.remove(ingredientInstance)
         ingredientInstance.removeFromList()  # remove ingredient from the list with which it is associated
         self.selectedStackName()  # Ensures something is highlighted
 
-        # TODO: The following two lines fail to clear the image data from RAM. Somehow there are other references to the object...
         ingredientInstance._data = None
+        if hasattr(ingredientInstance, "deleteSpillFile"):
+            ingredientInstance.deleteSpillFile()
         del ingredientInstance
 
+        self.updateTimeSeriesControls()
         self.initialiseAxes()
 
     def removeIngredientByName(self, objectName):
@@ -687,13 +924,13 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             return
 
         removed_ingredient = False
-        for thisIngredient in self.ingredientList[:]:
-            if thisIngredient.objectName == objectName:
-                if verbose:
-                    print(("Removing ingredient " + objectName))
-                self.removeIngredient(thisIngredient)
-                self.selectedStackName()  # Ensures something is highlighted
-                removed_ingredient = True
+        thisIngredient = self.ingredientRegistry.byName(objectName)
+        if thisIngredient is not None:
+            if verbose:
+                print(("Removing ingredient " + objectName))
+            self.removeIngredient(thisIngredient)
+            self.selectedStackName()  # Ensures something is highlighted
+            removed_ingredient = True
 
         if not removed_ingredient and verbose:
             print(("** Failed to remove ingredient %s **" % objectName))
@@ -710,14 +947,11 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
                 print("removeIngredientByType finds no ingredients in list!")
             return
 
-        for thisIngredient in self.ingredientList[:]:
-            if thisIngredient.__module__.endswith(
-                ingredientType
-            ):  # TODO: fix this so we look for it by instance not name
-                if verbose:
-                    print(("Removing ingredient " + thisIngredient.objectName))
-                self.selectedStackName()  # Ensures something is highlighted
-                self.removeIngredient(thisIngredient)
+        for thisIngredient in self.ingredientRegistry.byType(ingredientType):
+            if verbose:
+                print(("Removing ingredient " + thisIngredient.objectName))
+            self.selectedStackName()  # Ensures something is highlighted
+            self.removeIngredient(thisIngredient)
 
     def listIngredients(self):
         """
@@ -729,6 +963,17 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
 
         return ingredient_names
 
+    @staticmethod
+    def isIngredientOfType(ingredient, ingredientType):
+        """
+        True if ingredient is of type ingredientType (e.g. 'imagestack') or derives from it.
+        So a labelstack is also an imagestack. Works for ingredients that are not loaded. For
+        loaded ones self.ingredientRegistry.isOfType is quicker.
+        """
+        return any(
+            cls.__module__.endswith(ingredientType) for cls in type(ingredient).__mro__
+        )
+
     def returnIngredientByType(self, ingredientType):
         """
         Return a list of ingredients based upon their type. e.g. imagestack, sparsepoints, etc
@@ -739,12 +984,7 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
                 print("returnIngredientByType finds no ingredients in list!")
             return False
 
-        returned_ingredients = []
-        for thisIngredient in self.ingredientList:
-            if thisIngredient.__module__.endswith(
-                ingredientType
-            ):  # TODO: fix this so we look for it by instance not name
-                returned_ingredients.append(thisIngredient)
+        returned_ingredients = self.ingredientRegistry.byType(ingredientType)
 
         if verbose and not returned_ingredients:
             print(
@@ -757,6 +997,17 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         else:
             return returned_ingredients
 
+    def referenceStack(self):
+        """
+        Return the image stack whose voxel grid the views display: the first loaded stack that
+        holds data of its own. Other stacks with a known voxel size are resampled onto its grid.
+        Returns None if there are no such stacks.
+        """
+        for thisIngredient in self.ingredientRegistry.byType("imagestack"):
+            if isinstance(thisIngredient.raw_data(), np.ndarray):
+                return thisIngredient
+        return None
+
     def returnIngredientByName(self, objectName):
         """
         Return a specific ingredient object based upon its object name.
@@ -768,9 +1019,9 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
                 print("returnIngredientByName finds no ingredients in list!")
             return False
 
-        for ingredient in self.ingredientList:
-            if ingredient.objectName == objectName:
-                return ingredient
+        ingredient = self.ingredientRegistry.byName(objectName)
+        if ingredient is not None:
+            return ingredient
 
         if verbose:
             print(("returnIngredientByName finds no ingredient called " + objectName))
@@ -796,19 +1047,8 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             return
 
         self.update_2D_plot_ingredients_in_axes(resetAxes=resetAxes)
-
-        # initialize cross hair
-        if self.showCrossHairs:
-            if self.crossHairVLine is None:
-                self.crossHairVLine = pg.InfiniteLine(
-                    pen=(220, 200, 0, 180), angle=90, movable=False
-                )
-                self.crossHairVLine.objectName = "crossHairVLine"
-            if self.crossHairHLine is None:
-                self.crossHairHLine = pg.InfiniteLine(
-                    pen=(220, 200, 0, 180), angle=0, movable=False
-                )
-                self.crossHairHLine.objectName = "crossHairHLine"
+        if resetAxes:
+            self.redrawScheduler.flush()  # auto-ranging needs the images to be in place
 
         self.plotImageStackHistogram()
 
@@ -823,15 +1063,10 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
     def update_2D_plot_ingredients_in_axes(self, resetAxes=False):
         """
         Updates all 2D plot elements in an axis.
+        The redraw happens during the next frame (see RedrawScheduler). Call
+        self.redrawScheduler.flush() if the plot items must be updated right away.
         """
-        [
-            axis.updatePlotItems_2D(
-                self.ingredientList,
-                sliceToPlot=axis.currentSlice,
-                resetToMiddleLayer=resetAxes,
-            )
-            for axis in self.axes2D
-        ]
+        self.redrawScheduler.requestRedrawAllAxes(resetToMiddleLayer=resetAxes)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     # Slots for image stack tab
@@ -1038,26 +1273,108 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             self.axes2D[0].view.getViewBox().invertY(not(self.axes2D[0].view.getViewBox().yInverted()))
             self.axes2D[1].view.getViewBox().invertY(not(self.axes2D[1].view.getViewBox().yInverted()))
 
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Oblique planes
+    def setObliquePlane(self, axisIndex, tiltX=0, tiltY=0, interpolation="linear"):
+        """
+        Show image stacks in view axisIndex on a plane tilted by tiltX and tiltY degrees
+        about the view's x and y axes. interpolation is 'nearest' or 'linear'.
+        """
+        axis = self.axes2D[axisIndex]
+        plane = axis.obliquePlane
+        if plane is None:
+            plane = oblique_slice.obliquePlane(tiltX, tiltY, interpolation)
+        else:
+            if (plane.tiltX, plane.tiltY) != (tiltX, tiltY):
+                plane.setTilt(tiltX, tiltY)
+            plane.setInterpolation(interpolation)
+        axis.setObliquePlane(plane)
+
+    def clearObliquePlane(self, axisIndex):
+        """
+        Return view axisIndex to axis-aligned slices
+        """
+        self.axes2D[axisIndex].setObliquePlane(None)
+
+    def showObliquePlaneDialog(self):
+        if self.obliquePlaneDialog is None:
+            self.obliquePlaneDialog = ObliquePlaneDialog(self, parent=self)
+        self.obliquePlaneDialog.readViewState()
+        self.obliquePlaneDialog.show()
+        self.obliquePlaneDialog.raise_()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Time series
+    def setTimepoint(self, timepoint):
+        """
+        Show timepoint in all time series stacks and redraw
+        """
+        series = self.returnIngredientByType("timeseriesstack")
+        if not series:
+            return
+        for thisStack in series:
+            thisStack.setTimepoint(timepoint)
+        self.timeSeriesControls.setTimepoint(timepoint)
+        self.redrawScheduler.requestRedrawAllAxes()
+
+    def updateTimeSeriesControls(self):
+        """
+        Show the timepoint controls if a time series is loaded, with a range covering the longest one
+        """
+        series = self.returnIngredientByType("timeseriesstack") or []
+        self.timeSeriesControls.updateRange(max([s.nTimepoints() for s in series] + [0]))
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Memory
+    def memoryUsage(self):
+        """
+        Return a dictionary of the bytes used by each ingredient, split into 'data', 'mapped',
+        'caches', 'plotItems' and 'total'. The key 'TOTAL' holds the sum over all ingredients.
+        """
+        return self.memoryManager.report()
+
+    def reportUnreleasedData(self):
+        """
+        Warn about removed ingredients whose data are still referenced elsewhere
+        """
+        for objectName in self.memoryManager.checkReleases():
+            print("** lasagna.removeIngredient: data of %s are still referenced elsewhere and have not been freed **" % objectName)
+
+    def setMemoryBudget(self, budgetMB):
+        """
+        Keep the memory used by ingredients below budgetMB. 0 removes the limit.
+        """
+        self.memoryManager.setBudget(budgetMB)
+        if budgetMB:
+            self.memoryCheckTimer.start()
+        else:
+            self.memoryCheckTimer.stop()
+
+    def showHookProfilerDialog(self):
+        if self.hookProfilerDialog is None:
+            self.hookProfilerDialog = HookProfilerDialog(self, parent=self)
+        self.hookProfilerDialog.show()
+        self.hookProfilerDialog.raise_()
+
+    def showMemoryUsageDialog(self):
+        if self.memoryUsageDialog is None:
+            self.memoryUsageDialog = MemoryUsageDialog(self, parent=self)
+        self.memoryUsageDialog.refresh()
+        self.memoryUsageDialog.show()
+        self.memoryUsageDialog.raise_()
+
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     # Methods that are run during navigation
     def removeCrossHairs(self):
         """
-        Remove the cross hairs from all plots
+        Hide the cross hairs in all plots. The lines stay in the plots so they can be shown
+        again without changing the scene.
         """
-        # NOTE: I'm a little unhappy about this as I don't understand what's going on.
-        # I've noticed that removing the cross hairs from any one plot is sufficient to remove
-        # them from the other two. However, if all three axes are not explicitly removed I've
-        # seen peculiar behavior with plugins that query the PlotWidgets. RAAC 21/07/2015
-
         self.runHook(
             self.hooks["removeCrossHairs_Start"]
-        )  # This will be run each time a plot is updated
+        )  # This will be run each time the cross hairs are hidden
 
-        if not self.showCrossHairs:
-            return
-
-        [axis.removeItemFromPlotWidget(self.crossHairVLine) for axis in self.axes2D]
-        [axis.removeItemFromPlotWidget(self.crossHairHLine) for axis in self.axes2D]
+        [axis.hideCrossHairs() for axis in self.axes2D]
 
     def updateCrossHairs(self, highlightCrossHairs=False):
         """
@@ -1068,20 +1385,33 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             return
 
         # make cross hairs red if control key is pressed
-        if (
+        highlight = (
             QtWidgets.QApplication.keyboardModifiers() == QtCore.Qt.ControlModifier
             and highlightCrossHairs
-        ):
-            self.crossHairVLine.setPen(240, 0, 0, 200)
-            self.crossHairHLine.setPen(240, 0, 0, 200)
+        )
+        # Add 0.5 to add line to middle of pixel
+        self.axes2D[self.inAxis].showCrossHairs(self.mouseX + 0.5, self.mouseY + 0.5, highlight)
+
+    def voxelValues(self, names=None, position=None):
+        """
+        Return the values of one voxel in several image stacks, read from the stack data rather
+        than from the images shown in the views.
+        names - objectNames of the stacks. By default all image stacks in the order they were added.
+        position - voxel (a 3-element sequence on the displayed grid). By default the voxel under
+                   the mouse (mousePositionInStack).
+        Returns a list with one value per stack. The value is None if the stack does not
+        exist or does not cover position.
+        """
+        if position is None:
+            position = self.mousePositionInStack
+        position = tuple(int(p) for p in position)  # mapped once, then shared by all stacks
+
+        if names is None:
+            stacks = self.ingredientRegistry.byType("imagestack")
         else:
-            self.crossHairVLine.setPen(220, 200, 0, 180)
-            self.crossHairHLine.setPen(220, 200, 0, 180)
+            stacks = [self.ingredientRegistry.byName(name) for name in names]
 
-        self.crossHairVLine.setPos(
-            self.mouseX + 0.5
-        )  # Add 0.5 to add line to middle of pixel
-        self.crossHairHLine.setPos(self.mouseY + 0.5)
+        return [None if stack is None else stack.valueAt(position) for stack in stacks]
 
     def updateStatusBar(self):
         """
@@ -1091,28 +1421,11 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         x = self.mouseX
         y = self.mouseY
 
-        # get pixels under image
+        # Values of the image layers shown in this axis under the mouse, bottom layer first.
+        # They come from the stack data so they are right whatever the axis renders.
         image_items = self.axes2D[self.inAxis].getPlotItemByType("ImageItem")
-        pixel_values = []
-
-        # Get the pixel intensity of all displayed image layers under the mouse
-        # The following assumes that images have their origin at (0,0)
-        for thisImageItem in image_items:
-            im_shape = thisImageItem.image.shape
-
-            if x < 0 or y < 0:
-                pixel_values.append(0)
-            elif x >= im_shape[0] or y >= im_shape[1]:
-                pixel_values.append(0)
-            else:
-                pixel_values.append(thisImageItem.image[x, y])
-
-        # Build a text string to house these values
-        value_str = ""
-        while pixel_values:
-            value_str += "%d," % pixel_values.pop()
-
-        value_str = value_str[:-1]  # Chop off the last character
+        values = self.voxelValues([item.objectName for item in reversed(image_items)])
+        value_str = ",".join(formatVoxelValue(value) for value in values)
 
         self.statusBarText = "X=%d, Y=%d, val=[%s]" % (x, y, value_str)
 
@@ -1157,25 +1470,20 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         """
         Plot the image stack histogram in a PlotWidget to the left of the three image views.
         This function is called when the plot is first set up and also when the log Y
-        checkbox is checked or unchecked
+        or visible region checkboxes are checked or unchecked
 
-        also see: self.initialiseAxes
+        also see: self.initialiseAxes, self.updateRegionHistogram
         """
         ingredient = self.returnIngredientByName(self.selectedStackName())
         if (
             not ingredient
         ):  # TODO: when the last image stack is deleted there is an error that is caught by this if statement a more elegant solution would be nice
             self.intensityHistogram.clear()
+            self.histogramCurve = None
             return
 
         # Get the data for the intensity histogram
-        x = ingredient.histogram["x"]
-        y = ingredient.histogram["y"]
-
-        # Plot the histogram
-        if self.logYcheckBox.isChecked():
-            y = np.log10(y + 0.1)
-            y[y < 0] = 0
+        x, y = self.imageStackHistogramData(ingredient)
 
         self.intensityHistogram.clear()
         ingredient = self.returnIngredientByName(
@@ -1186,7 +1494,7 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         pen_color = ingredient.histPenColor()
 
         # Using stepMode=True causes the plot to draw two lines for each sample but it needs X to be longer than Y by 1
-        self.intensityHistogram.plot(
+        self.histogramCurve = self.intensityHistogram.plot(
             x,
             y,
             stepMode=False,
@@ -1222,6 +1530,73 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
             self.plottedIntensityRegionObj, ignoreBounds=True
         )
 
+    def imageStackHistogramData(self, ingredient):
+        """
+        Return the x and y values to plot in the intensity histogram of ingredient: either the
+        whole-volume histogram or, if the visible region checkbox is checked, the histogram of
+        the part of the current slice visible in the view under the mouse.
+        """
+        x = ingredient.histogram["x"]
+        y = ingredient.histogram["y"]
+
+        if self.regionHistogramCheckBox.isChecked():
+            region_y = self.visibleRegionHistogram(ingredient)
+            if region_y is not None:
+                y = region_y
+
+        if self.logYcheckBox.isChecked():
+            y = np.log10(y + 0.1)
+            y[y < 0] = 0
+        return x, y
+
+    def visibleRegionHistogram(self, ingredient, axisID=None):
+        """
+        Count the values of the slice of ingredient displayed in axis axisID (default: the axis
+        under the mouse) that lie within the view, using the bins of the whole-volume histogram.
+        Returns None if the stack is not displayed in that axis.
+        """
+        if axisID is None:
+            axisID = self.inAxis
+        axis = self.axes2D[axisID]
+        item = axis.getPlotItemByName(ingredient.objectName)
+        image = getattr(item, "dataImage", None)
+        if image is None or image.ndim != 2 or not item.isVisible():
+            return None
+
+        # The view rectangle in image pixels. This follows the item's transform so it also
+        # holds for oblique planes, which are drawn over only part of the view.
+        rect = item.mapRectFromView(axis.view.getViewBox().viewRect())
+        x0 = max(0, int(np.floor(min(rect.left(), rect.right()))))
+        x1 = min(image.shape[0], int(np.ceil(max(rect.left(), rect.right()))))
+        y0 = max(0, int(np.floor(min(rect.top(), rect.bottom()))))
+        y1 = min(image.shape[1], int(np.ceil(max(rect.top(), rect.bottom()))))
+        if x1 <= x0 or y1 <= y0:
+            return None
+
+        return region_histogram.histogramCounts(
+            image[x0:x1, y0:y1], region_histogram.binEdges(ingredient.histogram)
+        )
+
+    def requestRegionHistogram(self, axis):
+        """
+        Called when axis is redrawn, panned or zoomed. Recomputes the visible region histogram
+        once in the next frame if it describes that axis.
+        """
+        if not self.regionHistogramCheckBox.isChecked() or axis.axisToPlot != self.inAxis:
+            return
+        self.redrawScheduler.requestTask("regionHistogram", self.updateRegionHistogram)
+
+    def updateRegionHistogram(self):
+        """
+        Replace the values of the plotted histogram curve without rebuilding the plot
+        """
+        ingredient = self.returnIngredientByName(self.selectedStackName())
+        if not ingredient or getattr(self, "histogramCurve", None) is None:
+            return
+        x, y = self.imageStackHistogramData(ingredient)
+        self.histogramCurve.setData(x, y)
+        self.intensityHistogram.setLimits(yMin=min(y), yMax=max(y))
+
     def setIntensityRange(self, intRange=(0, 2 ** 12)):
         """
         Set the intensity range of the images and update the axis labels.
@@ -1263,6 +1638,64 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
 
         menu.addAction(change_color_menu.menuAction())
 
+        # Per-view slab projection. The action data hold the (axis, mode) pair
+        ingredient = self.returnIngredientByName(self.selectedStackName())
+        projection_menu = QtWidgets.QMenu("Slab projection", self)
+        for axis_index in range(len(self.axes2D)):
+            view_menu = QtWidgets.QMenu("View %d" % (axis_index + 1), projection_menu)
+            for mode in (None,) + slab_projection.PROJECTION_MODES:
+                action = QtWidgets.QAction("slice" if mode is None else mode, view_menu)
+                action.setCheckable(True)
+                action.setChecked(
+                    hasattr(ingredient, "projectionModes")
+                    and ingredient.projectionModes[axis_index] == mode
+                )
+                action.setData((axis_index, mode))
+                action.triggered.connect(self.changeSlabProjection_Slot)
+                view_menu.addAction(action)
+            projection_menu.addAction(view_menu.menuAction())
+        menu.addAction(projection_menu.menuAction())
+
+        # Filters applied to the displayed slices only. The action data hold the filter name.
+        filter_menu = QtWidgets.QMenu("Display filter", self)
+        for name in (None,) + tuple(display_filters.FILTERS):
+            action = QtWidgets.QAction("none" if name is None else name, filter_menu)
+            action.setCheckable(True)
+            current_filter = getattr(ingredient, "displayFilter", None)
+            action.setChecked(
+                (current_filter is None and name is None)
+                or (current_filter is not None and current_filter.name == name)
+            )
+            action.setData(name)
+            action.triggered.connect(self.changeDisplayFilter_Slot)
+            filter_menu.addAction(action)
+        menu.addAction(filter_menu.menuAction())
+
+        auto_levels_action = QtWidgets.QAction("Auto-contrast per slice", self)
+        auto_levels_action.setCheckable(True)
+        auto_levels_action.setChecked(getattr(ingredient, "autoLevels", False))
+        auto_levels_action.setEnabled(getattr(ingredient, "levelsAdjustable", False))
+        auto_levels_action.triggered.connect(self.changeAutoLevels_Slot)
+        menu.addAction(auto_levels_action)
+
+        # Label volumes can instead be drawn filled, as outlines or only the selected labels
+        if isinstance(ingredient, ingredients.labelstack.labelstack):
+            change_color_menu.setEnabled(False)
+            projection_menu.setEnabled(False)
+            filter_menu.setEnabled(False)
+            render_menu = QtWidgets.QMenu("Label display", self)
+            for mode in ingredients.labelstack.RENDER_MODES:
+                action = QtWidgets.QAction(mode, render_menu)
+                action.setCheckable(True)
+                action.setChecked(ingredient.renderMode == mode)
+                action.triggered.connect(self.changeLabelRenderMode_Slot)
+                render_menu.addAction(action)
+            menu.addAction(render_menu.menuAction())
+
+        action = QtWidgets.QAction("New derived stack...", self)
+        action.triggered.connect(self.newDerivedStack_Slot)
+        menu.addAction(action)
+
         action = QtWidgets.QAction("Delete", self)
         action.triggered.connect(self.deleteLayerStack_Slot)
         menu.addAction(action)
@@ -1281,6 +1714,136 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         self.initialiseAxes()
         self.runHook(self.hooks["changeImageStackColorMap_Slot_End"])
 
+    def changeSlabProjection_Slot(self):
+        """
+        Show the selected image stack as single slices or as a slab projection in one view
+        """
+        axis_index, mode = self.sender().data()
+        ingredient = self.returnIngredientByName(self.selectedStackName())
+        if not hasattr(ingredient, "setProjectionMode"):
+            return
+        ingredient.setProjectionMode(axis_index, mode)
+        self.redrawScheduler.requestRedraw(self.axes2D[axis_index], self.axes2D[axis_index].currentSlice)
+
+    def changeDisplayFilter_Slot(self):
+        """
+        Set the display filter of the selected image stack, asking for its parameters
+        """
+        ingredient = self.returnIngredientByName(self.selectedStackName())
+        if not hasattr(ingredient, "setDisplayFilter"):
+            return
+
+        name = self.sender().data()
+        params = dict()
+        if name is not None:
+            current = ingredient.displayFilter
+            for param, default in display_filters.FILTERS[name].items():
+                if current is not None and current.name == name:
+                    default = current.params[param]
+                value, ok = QtWidgets.QInputDialog.getDouble(
+                    self, "Display filter", "%s %s" % (name, param), default, 0, 1000, 2
+                )
+                if not ok:
+                    return
+                params[param] = value
+
+        ingredient.setDisplayFilter(name, **params)
+        self.update_2D_plot_ingredients_in_axes()
+
+    def changeAutoLevels_Slot(self, enabled):
+        """
+        Show each slice of the selected image stack with levels taken from its own percentiles
+        """
+        ingredient = self.returnIngredientByName(self.selectedStackName())
+        if not hasattr(ingredient, "setAutoLevels"):
+            return
+        ingredient.setAutoLevels(enabled)
+        self.update_2D_plot_ingredients_in_axes()
+
+    def changeLabelRenderMode_Slot(self):
+        """
+        Draw the selected label stack filled, as outlines or only the selected labels
+        """
+        ingredient = self.returnIngredientByName(self.selectedStackName())
+        if not hasattr(ingredient, "setRenderMode"):
+            return
+        ingredient.setRenderMode(str(self.sender().text()))
+        self.update_2D_plot_ingredients_in_axes()
+
+    def newDerivedStack_Slot(self):
+        """
+        Ask for an expression over the loaded stacks and add it as a derived stack.
+        The stacks are referred to as a, b, c, ... in the order of the layers list.
+        """
+        stacks = self.stacksInTreeList()
+        if not stacks:
+            return
+        stackByLetter = dict(zip(string.ascii_lowercase, stacks))
+        legend = "\n".join("%s = %s" % (letter, name) for letter, name in sorted(stackByLetter.items()))
+
+        expression, ok = QtWidgets.QInputDialog.getItem(
+            self,
+            "New derived stack",
+            "Expression (e.g. a - b)\n" + legend,
+            list(stack_expression.PRESETS.values()),
+            0,
+            True,
+        )
+        if not ok or not expression:
+            return
+
+        try:
+            names = stack_expression.stackExpression(str(expression)).names
+        except ValueError as err:
+            self.statusBar.showMessage(str(err))
+            print(err)
+            return
+
+        sources = dict()
+        constants = dict()
+        for name in names:
+            if name in stackByLetter:
+                sources[name] = stackByLetter[name]
+                continue
+            value, ok = QtWidgets.QInputDialog.getDouble(
+                self, "New derived stack", "Value of %s" % name, 0, -1e12, 1e12, 3
+            )
+            if not ok:
+                return
+            constants[name] = value
+
+        self.addDerivedStack(str(expression), sources, constants)
+
+    def addDerivedStack(self, expression, sources, constants=None, objectName=None):
+        """
+        Add a derived stack: expression evaluated on the displayed slices of the stacks in sources.
+        sources is a dictionary of expression variable -> stack name. e.g.
+        lasagna.addDerivedStack("a - b", {"a": "result.mhd", "b": "fixed.mhd"})
+        Returns the new ingredient or False if the expression is invalid.
+        """
+        if objectName is None:
+            objectName = re.sub(
+                r"\b[A-Za-z_]\w*\b", lambda m: sources.get(m.group(0), m.group(0)), expression
+            )
+
+        try:
+            self.addIngredient(
+                kind="derivedstack",
+                objectName=objectName,
+                expression=expression,
+                sources=sources,
+                constants=constants,
+            )
+        except ValueError as err:
+            print(err)
+            self.statusBar.showMessage(str(err))
+            return False
+
+        derived = self.returnIngredientByName(objectName)
+        derived.addToPlots()
+        self.initialiseAxes()
+        return derived
+
     def deleteLayerStack_Slot(self):
         """
         Remove an imagestack ingredient and list item
@@ -1352,7 +1915,6 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     # Slots relating to updating of the axes, etc
     def updateAxisLevels(self):
-        # TODO: Decide what to do with minMax. Setting it here by directly manipulating the item seems wrong
         min_x, max_x = self.plottedIntensityRegionObj.getRegion()
 
         # Get all imagestacks
@@ -1366,16 +1928,13 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
 
             if object_name != self.selectedStackName():  # TODO: LAYERS
                 continue
+            if not img_stack.levelsAdjustable:
+                continue
 
-            for thisAxis in self.axes2D:
-                img = find_pyqt_graph_object_name_in_plot_widget(
-                    thisAxis.view, object_name
-                )
-                img.setLevels([min_x, max_x])  # Sets levels immediately
-                img_stack.minMax = [
-                    min_x,
-                    max_x,
-                ]  # ensures levels stay set during all plot updates that follow
+            # The levels are applied when the slices are quantised (see imagestack.showImage)
+            # so the views are redrawn rather than the levels of the image items changed
+            img_stack.minMax = [min_x, max_x]
+            self.redrawScheduler.requestRedrawAllAxes()
 
     def mouseMoved(self, evt):
         """
@@ -1384,27 +1943,26 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
         if not self.stacksInTreeList():
             return
 
+        start = time.perf_counter()
         axis_id = self.sender().axisID
 
         pos = evt[0]
-        self.removeCrossHairs()
         if not (QtWidgets.QApplication.keyboardModifiers() == QtCore.Qt.ControlModifier):
             self.axes2D[axis_id].view.getViewBox().controlDrag = False
 
-        if self.axes2D[axis_id].view.sceneBoundingRect().contains(pos):
-            if self.showCrossHairs:
-                self.axes2D[axis_id].view.addItem(
-                    self.crossHairVLine, ignoreBounds=True
-                )
-                self.axes2D[axis_id].view.addItem(
-                    self.crossHairHLine, ignoreBounds=True
-                )
+        if axis_id != self.inAxis:
+            self.axes2D[self.inAxis].hideCrossHairs()
 
+        if not self.axes2D[axis_id].view.sceneBoundingRect().contains(pos):
+            self.axes2D[axis_id].hideCrossHairs()
+        else:
             self.mouseX, self.mouseY = self.axes2D[
                 axis_id
             ].getMousePositionInCurrentView(pos)
             # Record the current axis in which the mouse is in and the position of the mouse in the stack
-            self.inAxis = axis_id
+            if axis_id != self.inAxis:
+                self.inAxis = axis_id
+                self.requestRegionHistogram(self.axes2D[axis_id])
             voxel_position = [
                 self.axes2D[axis_id].currentSlice,
                 self.mouseX,
@@ -1433,3 +1991,5 @@ class Lasagna(QMainWindow, lasagna_mainWindow.Ui_lasagna_mainWindow):
                     self.ingredientList, (self.mouseX, self.mouseY)
                 )
             self.updateMainWindowOnMouseMove(self.axes2D[axis_id])
+
+        self.hoverStats.record(time.perf_counter() - start)
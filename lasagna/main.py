@@ -23,9 +23,8 @@ __maintainer__ = "Sainsbury Wellcome Centre"
 import os
 import sys
 import argparse
-from PyQt5.QtWidgets import QApplication
-import pyqtgraph as pg
-from lasagna.lasagna_object import Lasagna
+
+from lasagna.utils import startup_profile
 
 
 def get_parser():
@@ -46,13 +45,21 @@ def get_parser():
     parser.add_argument('-T', '--tree', type=str, nargs='+',
                         help='File names of tree file(s) to load')
 
+    parser.add_argument('--session', type=str,
+                        help='Session file to restore (see File > Save session). Other files are loaded after it')
     parser.add_argument('-P', '--plugin', type=str,
                         help="Start plugin of this name. Use string from plugins menu as the argument")
 
+    parser.add_argument('--record', type=str, metavar='FILE',
+                        help='Record mouse moves, clicks and wheel events on the views to FILE until Lasagna quits. '
+                             'Replay them with python -m lasagna.benchmarks.replay_benchmark')
+
     parser.add_argument('-C', '--console', action='store_true',  # Store true makes it False by default
                         help='Start a ipython console')
     parser.add_argument('-D', '--demo', action='store_true',
                         help='Load demo images')
+    parser.add_argument('--profile-startup', dest='profile_startup', action='store_true',
+                        help='Print how long each stage of start-up took and what it imported')
     return parser
 
 
@@ -74,16 +81,48 @@ def download_sample_stacks():
     return img_stacks_filenames
 
 
+def connect_view_signals(tasty):
+    """
+    Connect mouse moves and clicks on the three views to Lasagna's mouseMoved and axisClicked slots.
+    Also used by benchmarks/replay_benchmark.py so that replayed events take the same path.
+
+    :return: list of the pyqtgraph.SignalProxy objects. Keep a reference or the connections are lost.
+    """
+    import pyqtgraph as pg
+    sigProxies = []
+    for i in range(3):
+        thisProxy = pg.SignalProxy(tasty.axes2D[i].view.scene().sigMouseMoved, rateLimit=30, slot=tasty.mouseMoved)
+        thisProxy.axisID = i  # this is picked up the mouseMoved slot
+        sigProxies.append(thisProxy)
+
+        thisProxy = pg.SignalProxy(tasty.axes2D[i].view.getViewBox().mouseClicked, rateLimit=30, slot=tasty.axisClicked)
+        thisProxy.axisID = i  # this is picked up the mouseMoved slot
+        sigProxies.append(thisProxy)
+    return sigProxies
+
+
 # Set up the figure window
 def main(im_stack_fnames_to_load=None, sparse_points_to_load=None, lines_to_load=None, trees_to_load=None,
-         plugin_to_start=None, embed_console=False):
+         plugin_to_start=None, embed_console=False, session_to_load=None, record_to=None):
+
+    # Imported here so that --profile-startup can time them
+    from PyQt5.QtWidgets import QApplication
+    import pyqtgraph as pg
+    startup_profile.mark("import PyQt5 and pyqtgraph")
+    from lasagna.lasagna_object import Lasagna
+    startup_profile.mark("import lasagna")
 
     app = QApplication([])
+    startup_profile.mark("QApplication")
 
     tasty = Lasagna(embed_console=embed_console)
     tasty.app = app
 
     # Data from command line input if the user specified this
+    if session_to_load is not None:
+        print("Restoring session {}".format(session_to_load))
+        tasty.loadSession(session_to_load)
+
     if im_stack_fnames_to_load is not None:
         for fname in im_stack_fnames_to_load:
             print("Loading stack {}".format(fname))
@@ -103,6 +142,7 @@ def main(im_stack_fnames_to_load=None, sparse_points_to_load=None, lines_to_load
         for fname in trees_to_load:
             print("Loading tree {}".format(fname))
             tasty.loadActions['tree_reader'].showLoadDialog(fname)
+    startup_profile.mark("load data")
 
     tasty.initialiseAxes()
 
@@ -114,16 +154,15 @@ def main(im_stack_fnames_to_load=None, sparse_points_to_load=None, lines_to_load
             print("No plugin {}: not starting".format(plugin_to_start))
 
     # Link slots to signals
-    # connect views to the mouseMoved slot. After connection this runs in the background.
-    sigProxies = []  # This list will be populated this with pyqtgraph.SignalProxy objects for linking signals and slots
-    for i in range(3):
-        thisProxy = pg.SignalProxy(tasty.axes2D[i].view.scene().sigMouseMoved, rateLimit=30, slot=tasty.mouseMoved)
-        thisProxy.axisID = i  # this is picked up the mouseMoved slot
-        sigProxies.append(thisProxy)
+    sigProxies = connect_view_signals(tasty)  # kept so that the proxies are not garbage collected
 
-        thisProxy = pg.SignalProxy(tasty.axes2D[i].view.getViewBox().mouseClicked, rateLimit=30, slot=tasty.axisClicked)
-        thisProxy.axisID = i  # this is picked up the mouseMoved slot
-        sigProxies.append(thisProxy)
+    if record_to is not None:
+        tasty.interactionRecorder.start(fname=record_to)
+        tasty.actionRecordInteractions.setChecked(True)
+
+    if startup_profile.isEnabled():
+        startup_profile.mark("draw and start plugin")
+        print("\n" + startup_profile.report() + "\n")
 
     if embed_console:
         from traitlets.config import Config
@@ -139,6 +178,8 @@ def run():
     print('Starting')
     sys.path.append(os.path.abspath('.'))
     args = get_parser().parse_args()
+    if args.profile_startup:
+        startup_profile.enable()
 
     # Either load the demo stacks or a user-specified stacks
     if args.demo:
@@ -148,7 +189,8 @@ def run():
 
     main(im_stack_fnames_to_load=img_stack_fnames_to_load, sparse_points_to_load=args.sparse_points,
          lines_to_load=args.lines, trees_to_load=args.tree,
-         plugin_to_start=args.plugin, embed_console=args.console)
+         plugin_to_start=args.plugin, embed_console=args.console, session_to_load=args.session,
+         record_to=args.record)
 
 
 # Start Qt event loop unless running in interactive mode.
@@ -0,0 +1,241 @@
+"""
+Track how much memory each ingredient uses and optionally keep the total under a budget.
+
+Memory is counted in three categories for each ingredient:
+data      - the ingredient's raw data held in RAM. Memory-mapped data are reported
+            separately as "mapped" because the OS can page them out at will.
+caches    - derived data the ingredient keeps to speed up drawing (see
+            lasagna_ingredient.cacheNbytes). These can be thrown away at any time.
+plotItems - images held by the pyqtgraph items that display the ingredient in each axis.
+            Images that are views onto the raw data are not counted twice.
+
+If a budget is set (memoryBudget_MB preference, 0 means no limit) and the total goes over
+it, caches are cleared first, largest first. If that is not enough, the largest in-RAM
+image stacks are moved to memory-mapped files in a temporary directory.
+"""
+
+import gc
+import mmap
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+
+
+def baseArray(array):
+    """
+    Follow the .base chain of a numpy view to the array that owns the memory
+    """
+    while isinstance(getattr(array, "base", None), np.ndarray):
+        array = array.base
+    return array
+
+
+def isMemoryMapped(array):
+    """
+    True if array is, or is a view onto, a memory-mapped file
+    """
+    if isinstance(array, np.memmap):
+        return True
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap) or isinstance(array.base, mmap.mmap):
+            return True
+        array = array.base
+    return False
+
+
+class MemoryManager(object):
+    def __init__(self, lasagna_serving, budgetMB=0):
+        self.lasagna = lasagna_serving
+        self.budgetMB = budgetMB
+        self._spillDir = None  # created the first time a stack is moved to disk
+        self._removed = []  # (name, weak reference to data) of removed ingredients not yet checked
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Accounting
+    def ingredientMemory(self, ingredient):
+        """
+        Return a dictionary with the number of bytes used by ingredient in each category
+        """
+        data = ingredient.raw_data()
+        data_bytes = 0
+        mapped_bytes = 0
+        if isinstance(data, np.ndarray):
+            if isMemoryMapped(data):
+                mapped_bytes = data.nbytes
+            else:
+                data_bytes = baseArray(data).nbytes
+
+        plot_item_bytes = 0
+        for axis in self.lasagna.axes2D:
+            item = axis.getPlotItemByName(ingredient.objectName)
+            if item is not None:
+                plot_item_bytes += self.plotItemNbytes(item, data)
+
+        return {
+            "data": data_bytes,
+            "mapped": mapped_bytes,
+            "caches": ingredient.cacheNbytes(),
+            "plotItems": plot_item_bytes,
+        }
+
+    @staticmethod
+    def plotItemNbytes(item, data=None):
+        """
+        Bytes held by a pyqtgraph item. Only ImageItems hold anything substantial.
+        """
+        n_bytes = 0
+        image = getattr(item, "image", None)
+        if isinstance(image, np.ndarray):
+            if not (isinstance(data, np.ndarray) and np.shares_memory(image, data)):
+                n_bytes += image.nbytes
+
+        data_image = getattr(item, "dataImage", None)  # the slice behind a quantised image (see imagestack.showImage)
+        if isinstance(data_image, np.ndarray) and data_image is not image:
+            if not (isinstance(data, np.ndarray) and np.shares_memory(data_image, data)):
+                n_bytes += data_image.nbytes
+
+        qimage = getattr(item, "qimage", None)
+        if qimage is not None:
+            n_bytes += qimage.sizeInBytes()
+
+        for buffer_name in ("_processingBuffer", "_displayBuffer"):
+            buffer = getattr(item, buffer_name, None)
+            if isinstance(buffer, np.ndarray):
+                n_bytes += buffer.nbytes
+        return n_bytes
+
+    def report(self):
+        """
+        Return a dictionary keyed by ingredient name. Each value is the dictionary returned by
+        ingredientMemory with an extra 'total' key. The key 'TOTAL' sums all ingredients.
+        """
+        totals = dict(data=0, mapped=0, caches=0, plotItems=0)
+        report = {}
+        for ingredient in self.lasagna.ingredientList:
+            usage = self.ingredientMemory(ingredient)
+            for key in totals:
+                totals[key] += usage[key]
+            usage["total"] = usage["data"] + usage["caches"] + usage["plotItems"]
+            report[ingredient.objectName] = usage
+
+        totals["total"] = totals["data"] + totals["caches"] + totals["plotItems"]
+        report["TOTAL"] = totals
+        return report
+
+    def totalBytes(self):
+        """
+        Bytes held in RAM (memory-mapped data are not included)
+        """
+        return self.report()["TOTAL"]["total"]
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Budget
+    def setBudget(self, budgetMB):
+        self.budgetMB = budgetMB
+        self.enforceBudget()
+
+    def enforceBudget(self):
+        """
+        Free memory until we are within budget. Returns True if we are within budget at the end.
+        """
+        if not self.budgetMB:
+            return True
+        budget = self.budgetMB * 1024 ** 2
+
+        report = self.report()
+        total = report["TOTAL"]["total"]
+        if total <= budget:
+            return True
+
+        ingredients = [i for i in self.lasagna.ingredientList if i.objectName in report]
+
+        # 1. Throw away caches, largest first
+        for ingredient in sorted(ingredients, key=lambda i: report[i.objectName]["caches"], reverse=True):
+            if total <= budget:
+                break
+            if report[ingredient.objectName]["caches"]:
+                total -= report[ingredient.objectName]["caches"]
+                ingredient.clearCaches()
+
+        # 2. Move the largest in-RAM stacks to memory-mapped files
+        for ingredient in sorted(ingredients, key=lambda i: report[i.objectName]["data"], reverse=True):
+            if total <= budget:
+                break
+            if report[ingredient.objectName]["data"] and hasattr(ingredient, "moveDataToDisk"):
+                print("MemoryManager moving %s to disk to stay within the %d MB budget"
+                      % (ingredient.objectName, self.budgetMB))
+                if ingredient.moveDataToDisk(self.spillDir()):
+                    total -= report[ingredient.objectName]["data"]
+
+        if total > budget:
+            print("MemoryManager could not get below the %d MB memory budget" % self.budgetMB)
+            return False
+
+        self.lasagna.update_2D_plot_ingredients_in_axes()  # drop plot item references to the old buffers
+        return True
+
+    def spillDir(self):
+        """
+        Directory holding memory-mapped copies of stacks that were moved out of RAM
+        """
+        if self._spillDir is None:
+            self._spillDir = tempfile.mkdtemp(prefix="lasagna_")
+        return self._spillDir
+
+    def cleanUp(self):
+        """
+        Delete the spill directory. Call on exit.
+        """
+        if self._spillDir is not None:
+            shutil.rmtree(self._spillDir, ignore_errors=True)
+            self._spillDir = None
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Release checks
+    @staticmethod
+    def watchIngredient(ingredient):
+        """
+        Return a weak reference to the buffer behind ingredient's data, or None if the data
+        are not a numpy array
+        """
+        data = ingredient.raw_data()
+        if not isinstance(data, np.ndarray):
+            return None
+        return weakref.ref(baseArray(data))
+
+    def watchRelease(self, ingredient):
+        """
+        Call when ingredient is being removed. Its data are checked by the next checkReleases.
+        Returns True if no other removal is waiting to be checked, i.e. a check should be scheduled.
+        """
+        first = not self._removed
+        reference = self.watchIngredient(ingredient)
+        if reference is not None:
+            self._removed.append((ingredient.objectName, reference))
+        return first and bool(self._removed)
+
+    def checkReleases(self):
+        """
+        Return the names of the ingredients removed since the last check whose data have not
+        been freed. One garbage collection is run for all of them, so call this once after a
+        batch of removals (e.g. restoring a session) rather than after each one.
+        """
+        if not self._removed:
+            return []
+        gc.collect()
+        held = [name for name, reference in self._removed if reference() is not None]
+        self._removed = []
+        return held
+
+    @staticmethod
+    def spillFileOf(ingredient):
+        """
+        The memory-mapped file created by moveDataToDisk, if any
+        """
+        fname = getattr(ingredient, "spillFile", None)
+        if fname and os.path.exists(fname):
+            return fname
+        return None
@@ -0,0 +1,72 @@
+"""
+A small non-modal dialog listing the memory used by each ingredient (see lasagna.memory_manager)
+and allowing the memory budget to be changed.
+"""
+
+from PyQt5 import QtWidgets
+
+from lasagna.utils import preferences
+
+
+COLUMNS = ("data", "mapped", "caches", "plotItems", "total")
+
+
+class MemoryUsageDialog(QtWidgets.QDialog):
+    def __init__(self, lasagna_serving, parent=None):
+        super(MemoryUsageDialog, self).__init__(parent)
+        self.lasagna = lasagna_serving
+        self.setWindowTitle("Memory usage")
+
+        self.table = QtWidgets.QTableWidget(0, len(COLUMNS), self)
+        self.table.setHorizontalHeaderLabels(["%s (MB)" % c for c in COLUMNS])
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+
+        self.budget_spinBox = QtWidgets.QSpinBox(self)
+        self.budget_spinBox.setRange(0, 1024 ** 2)
+        self.budget_spinBox.setSuffix(" MB")
+        self.budget_spinBox.setSpecialValueText("no limit")
+        self.budget_spinBox.setValue(self.lasagna.memoryManager.budgetMB)
+
+        self.refresh_button = QtWidgets.QPushButton("Refresh", self)
+        self.clearCaches_button = QtWidgets.QPushButton("Clear caches", self)
+
+        budget_layout = QtWidgets.QHBoxLayout()
+        budget_layout.addWidget(QtWidgets.QLabel("Budget", self))
+        budget_layout.addWidget(self.budget_spinBox)
+        budget_layout.addStretch()
+        budget_layout.addWidget(self.clearCaches_button)
+        budget_layout.addWidget(self.refresh_button)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(self.table)
+        layout.addLayout(budget_layout)
+        self.resize(600, 300)
+
+        self.refresh_button.clicked.connect(self.refresh)
+        self.clearCaches_button.clicked.connect(self.clearCaches)
+        self.budget_spinBox.editingFinished.connect(self.changeBudget)
+
+    def refresh(self):
+        """
+        Re-measure and fill the table
+        """
+        report = self.lasagna.memoryUsage()
+        names = [n for n in report if n != "TOTAL"] + ["TOTAL"]
+
+        self.table.setRowCount(len(names))
+        self.table.setVerticalHeaderLabels(names)
+        for row, name in enumerate(names):
+            for col, key in enumerate(COLUMNS):
+                item = QtWidgets.QTableWidgetItem("%0.1f" % (report[name][key] / 1024.0 ** 2))
+                self.table.setItem(row, col, item)
+
+    def clearCaches(self):
+        [ingredient.clearCaches() for ingredient in self.lasagna.ingredientList]
+        self.refresh()
+
+    def changeBudget(self):
+        budget = self.budget_spinBox.value()
+        if budget == self.lasagna.memoryManager.budgetMB:
+            return
+        preferences.preferenceWriter("memoryBudget_MB", budget)  # Lasagna.preferenceChanged applies it
+        self.refresh()
@@ -0,0 +1,77 @@
+"""
+A small non-modal dialog for tilting the plane shown in one of the three views
+(see lasagna.image_processing.oblique_slice). Changes are applied as soon as they are made.
+"""
+
+from PyQt5 import QtWidgets
+
+from lasagna.image_processing.oblique_slice import INTERPOLATION_MODES
+
+
+class ObliquePlaneDialog(QtWidgets.QDialog):
+    def __init__(self, lasagna_serving, parent=None):
+        super(ObliquePlaneDialog, self).__init__(parent)
+        self.lasagna = lasagna_serving
+        self.setWindowTitle("Oblique planes")
+
+        self.view_comboBox = QtWidgets.QComboBox(self)
+        [self.view_comboBox.addItem("View %d" % (ii + 1)) for ii in range(len(self.lasagna.axes2D))]
+
+        self.enable_checkBox = QtWidgets.QCheckBox("Show oblique plane", self)
+
+        self.tiltX_spinBox = self._makeTiltSpinBox()
+        self.tiltY_spinBox = self._makeTiltSpinBox()
+
+        self.interpolation_comboBox = QtWidgets.QComboBox(self)
+        [self.interpolation_comboBox.addItem(mode) for mode in INTERPOLATION_MODES]
+        self.interpolation_comboBox.setCurrentText("linear")
+
+        layout = QtWidgets.QFormLayout(self)
+        layout.addRow("View", self.view_comboBox)
+        layout.addRow(self.enable_checkBox)
+        layout.addRow("Tilt about x (deg)", self.tiltX_spinBox)
+        layout.addRow("Tilt about y (deg)", self.tiltY_spinBox)
+        layout.addRow("Interpolation", self.interpolation_comboBox)
+
+        self.readViewState()
+
+        self.view_comboBox.currentIndexChanged.connect(self.readViewState)
+        self.enable_checkBox.toggled.connect(self.applyPlane)
+        self.tiltX_spinBox.valueChanged.connect(self.applyPlane)
+        self.tiltY_spinBox.valueChanged.connect(self.applyPlane)
+        self.interpolation_comboBox.currentIndexChanged.connect(self.applyPlane)
+
+    def _makeTiltSpinBox(self):
+        spin_box = QtWidgets.QDoubleSpinBox(self)
+        spin_box.setRange(-90, 90)
+        spin_box.setSingleStep(1)
+        spin_box.setDecimals(1)
+        return spin_box
+
+    def readViewState(self):
+        """
+        Set the widgets to reflect the plane of the currently selected view
+        """
+        plane = self.lasagna.axes2D[self.view_comboBox.currentIndex()].obliquePlane
+
+        widgets = (self.enable_checkBox, self.tiltX_spinBox, self.tiltY_spinBox, self.interpolation_comboBox)
+        [w.blockSignals(True) for w in widgets]
+        self.enable_checkBox.setChecked(plane is not None)
+        if plane is not None:
+            self.tiltX_spinBox.setValue(plane.tiltX)
+            self.tiltY_spinBox.setValue(plane.tiltY)
+            self.interpolation_comboBox.setCurrentText(plane.interpolation)
+        [w.blockSignals(False) for w in widgets]
+
+    def applyPlane(self):
+        axis_index = self.view_comboBox.currentIndex()
+        if not self.enable_checkBox.isChecked():
+            self.lasagna.clearObliquePlane(axis_index)
+            return
+
+        self.lasagna.setObliquePlane(
+            axis_index,
+            tiltX=self.tiltX_spinBox.value(),
+            tiltY=self.tiltY_spinBox.value(),
+            interpolation=self.interpolation_comboBox.currentText(),
+        )
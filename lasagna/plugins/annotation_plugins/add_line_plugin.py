@@ -15,7 +15,7 @@ import numpy as np
 from PyQt5 import QtGui, QtWidgets
 import scipy.linalg  # For the 3D line fit
 
-from lasagna.plugins.lasagna_plugin import LasagnaPlugin
+from lasagna.plugins.lasagna_plugin import LasagnaPlugin, asyncHook
 from lasagna.plugins.annotation_plugins import add_line_UI
 
 
@@ -182,6 +182,11 @@ class plugin(LasagnaPlugin, QtWidgets.QWidget, add_line_UI.Ui_addLine):
 
 
         elif self.removePoint_radioButton.isChecked():
+            # The index found on the last mouse move may predate a change to the table, so find it again
+            existingPoints = self.get_points_coord()
+            if len(existingPoints) == 0:
+                return
+            self.nearest_point_index, _ = self.find_nearest_point_in_array(existingPoints, np.array(pos))
             self.num_points -= 1
             self.tableWidget.removeRow(self.nearest_point_index)
             self.lasagna.returnIngredientByName(self.hPoint_name)._data = []
@@ -189,22 +194,35 @@ class plugin(LasagnaPlugin, QtWidgets.QWidget, add_line_UI.Ui_addLine):
         self.lasagna.update_2D_plot_ingredients_in_axes()
         self.update_current_line()
 
-    def hook_updateMainWindowOnMouseMove_End(self):
+    @asyncHook(prepare="_nearestPointArgs", apply="_showNearestPoint")
+    def hook_updateMainWindowOnMouseMove_End(self, existingPoints, currentMousePos):
         """ Runs continuously when the mouse travels over an axis.
 
-        NOTE: ** At the moment this method does nothing.  **
-              ** We keep it because likely we'll need it. **
-              e.g. we can run highlight point here
+        Finds the point nearest the mouse cursor. This runs on a worker thread so
+        the search does not hold up the cursor. The arguments are gathered by
+        _nearestPointArgs and the result is shown by _showNearestPoint. The points
+        searched are returned too so that a stale result can be recognised.
         """
+        return self.find_nearest_point_in_array(existingPoints, currentMousePos) + (existingPoints,)
 
+    def _nearestPointArgs(self):
+        """ Read the points and the mouse position for hook_updateMainWindowOnMouseMove_End
+        """
         currentMousePos = np.array(self.lasagna.mousePositionInStack)
         existingPoints = self.get_points_coord()
         if type(existingPoints) == list or existingPoints.size == 0:
-            return
+            return None
+        return existingPoints, currentMousePos
 
-        self.nearest_point_index, self.coords_of_nearest_point_to_cursor = self.find_nearest_point_in_array(
-            existingPoints, currentMousePos
-        )
+    def _showNearestPoint(self, nearest):
+        """ Store the point nearest the cursor and highlight it if we are removing points.
+        Results for points that have since been added, removed or edited are discarded.
+        """
+        nearest_point_index, coords, searchedPoints = nearest
+        currentPoints = self.get_points_coord()
+        if len(currentPoints) == 0 or not np.array_equal(searchedPoints, currentPoints):
+            return
+        self.nearest_point_index, self.coords_of_nearest_point_to_cursor = nearest_point_index, coords
 
         if self.removePoint_radioButton.isChecked():
             self.lasagna.returnIngredientByName(
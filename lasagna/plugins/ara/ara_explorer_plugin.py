@@ -152,7 +152,12 @@ class plugin(AraPluginBase, ara_explorer_UI.Ui_ara_explorer):
             self.brainArea_itemModel.invisibleRootItem(),
         )
 
-        self.lasagna.loadImageStack(paths["atlas"])
+        # The atlas is a label volume, coloured by the area colours in the labels file
+        self.lasagna.loadImageStack(
+            paths["atlas"],
+            kind="labelstack",
+            labelColors=self.labelColorsFromTree(self.data["labels"]),
+        )
 
         self.data["currentlyLoadedAtlasName"] = paths["atlas"].split(os.path.sep)[-1]
 
@@ -164,11 +169,6 @@ class plugin(AraPluginBase, ara_explorer_UI.Ui_ara_explorer):
         else:
             self.overlayTemplate_checkBox.setEnabled(False)
 
-        # self.setARAcolors()
-        # self.lasagna.initialiseAxes(resetAxes=True)
-        self.lasagna.returnIngredientByName(
-            self.data["currentlyLoadedAtlasName"]
-        ).minMax = [0, 1.2e3]
         self.lasagna.initialiseAxes(resetAxes=True)
 
     def addOverlay(self, fname):
@@ -247,6 +247,12 @@ class plugin(AraPluginBase, ara_explorer_UI.Ui_ara_explorer):
             area_name = index.data()
             tree_index = self.AreaName2NodeID(self.data["labels"], area_name)
 
+        # The atlas shows only the selected area if its label display is set to "selected"
+        atlas = self.lasagna.returnIngredientByName(self.data["currentlyLoadedAtlasName"])
+        if tree_index and hasattr(atlas, "setSelectedLabels"):
+            atlas.setSelectedLabels([tree_index])
+            self.lasagna.update_2D_plot_ingredients_in_axes()
+
         if tree_index is not None:
             # print("highlighting %d" % tree_index)
             self.drawAreaHighlight(
@@ -267,6 +273,8 @@ class plugin(AraPluginBase, ara_explorer_UI.Ui_ara_explorer):
                     )
                 )
             return None, None
+        elif hasattr(ingredient, "labelAt"):
+            return atlas_layer_name, ingredient  # labelstack: ARA_plotter looks up IDs through it
         else:
             image_stack = ingredient.raw_data()
             return atlas_layer_name, image_stack
@@ -12,6 +12,8 @@ from skimage import measure
 from lasagna.tree import tree_parser
 # For handling the labels files
 from lasagna.io_libs import ara_json
+from lasagna.ingredients.labelstack import labelstack
+from lasagna.image_processing.voxel_query import voxelAt
 
 
 class ARA_plotter(object):  # must inherit LasagnaPlugin first
@@ -48,6 +50,18 @@ class ARA_plotter(object):  # must inherit LasagnaPlugin first
             table = flattened.split('\n')
             return tree_parser.parse_file(table, col_sep='|', header_line=col_names)
 
+    def labelColorsFromTree(self, labels):
+        """
+        Return a dictionary of area ID -> hex colour string for all areas in the labels tree
+        that have a colour (the ARA JSON provides one as color_hex_triplet). Readers turn all-digit
+        triplets such as 009900 into ints, so these are zero-padded back to six characters.
+        """
+        colors = dict()
+        for node_id, node in labels.nodes.items():
+            if isinstance(node.data, dict) and node.data.get('color') not in (None, ''):
+                colors[node_id] = str(node.data['color']).lstrip('#').zfill(6)
+        return colors
+
     def guessFileSep(self, fname):
         """
         Guess the file separator in file fname. [MAY BE ORPHANED]
@@ -93,86 +107,89 @@ class ARA_plotter(object):  # must inherit LasagnaPlugin first
 
     def writeAreaNameInStatusBar(self, imageStack, displayAreaName=True):
         """
-        imageStack - the 3-D atlas stack
+        imageStack - the 3-D atlas stack or a labelstack ingredient
         displayAreaName - display area name in status bar if this True
         Write brain area name in the status bar (optional) return value of atlas pixel under mouse.
         Atlas need not be visible.
         """
-
-        if not imageStack.shape:
-            return -1
-
-        im_shape = imageStack.shape
         pos = self.lasagna.mousePositionInStack
-        
-        verbose = False
-        if verbose:
-            print("Mouse is in %d,%d,%d and image size is %d,%d,%d" %
-                  (pos[0], pos[1], pos[2], im_shape[0], im_shape[1], im_shape[2]))
-
-        # Detect if the mouse is outside of the atlas
-        value = 0
-        for i in range(len(im_shape)):
-            if pos[i] < 0 or pos[i] >= im_shape[i]:
-                if verbose:
-                    print("NOT IN RANGE: pos: %d shape %d" % (pos[i], im_shape[i]))
-                area = 'outside image area'
+        if isinstance(imageStack, labelstack):
+            value = imageStack.labelAt(pos)
+        else:
+            # Read the one voxel under the mouse. -1 if the mouse is outside the atlas.
+            value = voxelAt(imageStack, [int(p) for p in pos])
+            if value is None:
                 value = -1
-                break
-
-        # If value is still zero we're inside the atlas image area
-        if value == 0:
-            value = imageStack[pos[0], pos[1], pos[2]]
-            if value == 0:
-                area = 'outside brain'
-            elif value in self.data['labels'].nodes:
-                area = self.data['labels'][value].data['name']
-            else:
-                area = 'UNKNOWN'
+
+        return self._writeAreaName(value, displayAreaName)
+
+    def _writeAreaName(self, value, displayAreaName=True):
+        """
+        Append the name of area ID value to the status bar text. Returns value.
+        """
+        if value < 0:
+            area = 'outside image area'
+        elif value == 0:
+            area = 'outside brain'
+        elif value in self.data['labels'].nodes:
+            area = self.data['labels'][value].data['name']
+        else:
+            area = 'UNKNOWN'
 
         if displayAreaName:
             self.lasagna.statusBarText = self.lasagna.statusBarText + ", area: " + area
 
         return value
 
-    def getContoursFromAxis(self, imageStack, axisNumber=-1, value=-1):
+    def getContoursFromAxis(self, imageStack, axisNumber=-1, value=-1, sliceIndex=None):
         """
         Return a contours array from the axis indexed by integer axisNumber
         i.e. one of the three axes
+        sliceIndex - the slice to contour. By default the slice currently shown in that axis.
         """        
         if axisNumber == -1:
             return False
 
-        imageStack = np.swapaxes(imageStack, 0, axisNumber)
-        this_slice = self.lasagna.axes2D[axisNumber].currentSlice  # This is the current slice in this axis
-        tmp_image = np.array(imageStack[this_slice])  # So this is the image associated with that slice
+        if sliceIndex is None:
+            sliceIndex = self.lasagna.axes2D[axisNumber].currentSlice  # This is the current slice in this axis
+        this_slice = sliceIndex
+
+        if isinstance(imageStack, labelstack):
+            # The compact index preserves the order of the IDs so the same contouring works on it
+            value = imageStack.labelIndex(value)
+            if value <= 0 or this_slice >= imageStack.displayShape(axisNumber)[0]:
+                return False
+            tmp_image = np.array(imageStack.gridSlice(axisNumber, this_slice))  # on the displayed grid
+        else:
+            imageStack = np.swapaxes(imageStack, 0, axisNumber)
+            tmp_image = np.array(imageStack[this_slice])  # So this is the image associated with that slice
 
         # Make a copy of the image and set values lower than our value to a greater number
         # since the countour finder will draw around everything less than our value
         tmp_image[tmp_image < value] = value+10
         return measure.find_contours(tmp_image, value)
 
-    def drawAreaHighlight(self, imageStack, value, highlightOnlyCurrentAxis=False):
+    def areaHighlightContours(self, imageStack, value, slices, highlightAxis=None):
         """
-        if highlightOnlyCurrentAxis is True, we draw highlights only on the axis we are mousing over
+        Return the contours of area value in the slices (one index per axis) as an n by 3 array
+        of stack coordinates in which each contour is terminated by a row of NaNs.
+        If highlightAxis is not None, only the slice of that axis is contoured.
+        Does not touch the GUI so it can run on a worker thread (see hook_updateStatusBar_End).
         """
-        if value <= 0:
-            return
-
         nans = np.array([np.nan, np.nan, np.nan]).reshape(1, 3)
         all_contours = nans
 
-        for ax_num in range(len(self.lasagna.axes2D)):
-            contours = self.getContoursFromAxis(imageStack, axisNumber=ax_num, value=value)
-            if (highlightOnlyCurrentAxis and ax_num != self.lasagna.inAxis) or not contours:
+        for ax_num, this_slice in enumerate(slices):
+            contours = self.getContoursFromAxis(imageStack, axisNumber=ax_num, value=value, sliceIndex=this_slice)
+            if (highlightAxis is not None and ax_num != highlightAxis) or not contours:
                 tmp_nan = np.array([np.nan, np.nan, np.nan]).reshape(1, 3)
-                tmp_nan[0][ax_num] = self.lasagna.axes2D[ax_num].currentSlice  # ensure nothing is plotted in this layer
+                tmp_nan[0][ax_num] = this_slice  # ensure nothing is plotted in this layer
                 all_contours = np.append(all_contours, tmp_nan, axis=0)
                 continue
 
-            # print "Plotting area %d in plane %d" % (value,self.lasagna.axes2D[ax_num].currentSlice)
+            # print "Plotting area %d in plane %d" % (value, this_slice)
             for contour in contours:
-                tmp = np.ones(contour.shape[0]*3).reshape(contour.shape[0], 3)*self.lasagna.axes2D[ax_num].currentSlice
+                tmp = np.ones(contour.shape[0]*3).reshape(contour.shape[0], 3)*this_slice
 
                 if ax_num == 0:
                     tmp[:, 1:] = contour
@@ -186,13 +203,31 @@ class ARA_plotter(object):  # must inherit LasagnaPlugin first
                 tmp = np.append(tmp, nans, axis=0)  # Terminate each contour with nans so that they are not  linked
                 all_contours = np.append(all_contours, tmp, axis=0)
 
-            if highlightOnlyCurrentAxis:
-                self.lastValue = value
-            
-        # Replace the data in the ingredient so they are plotted
-        self.lasagna.returnIngredientByName(self.contourName)._data = all_contours
+        return all_contours
+
+    def showAreaHighlight(self, contours):
+        """
+        Replace the data in the contour ingredient so they are plotted
+        """
+        contour_ingredient = self.lasagna.returnIngredientByName(self.contourName)
+        if not contour_ingredient:  # the highlight was switched off in the meantime
+            return
+        contour_ingredient._data = contours
         self.lasagna.initialiseAxes()
 
+    def drawAreaHighlight(self, imageStack, value, highlightOnlyCurrentAxis=False):
+        """
+        if highlightOnlyCurrentAxis is True, we draw highlights only on the axis we are mousing over
+        """
+        if value <= 0:
+            return
+
+        slices = [axis.currentSlice for axis in self.lasagna.axes2D]
+        highlight_axis = self.lasagna.inAxis if highlightOnlyCurrentAxis else None
+        self.showAreaHighlight(self.areaHighlightContours(imageStack, value, slices, highlight_axis))
+        if highlightOnlyCurrentAxis:
+            self.lastValue = value
+
     def setARAcolors(self):
         # Make up a disjointed colormap
         pos = np.array([0.0, 0.001, 0.25, 0.35, 0.45, 0.65, 0.9])
@@ -5,7 +5,7 @@ import PyQt5
 
 from lasagna.alert import alert
 from lasagna.plugins.ara.ara_plotter import ARA_plotter
-from lasagna.plugins.lasagna_plugin import LasagnaPlugin
+from lasagna.plugins.lasagna_plugin import LasagnaPlugin, asyncHook
 
 from lasagna.utils.pref_utils import get_lasagna_pref_dir
 from lasagna.utils import preferences
@@ -153,22 +153,32 @@ class AraPluginBase(ARA_plotter, LasagnaPlugin, PyQt5.QtWidgets.QWidget):
     # HOOKS
     # all methods starting with hook_ are automatically registered as hooks with lasagna
     # when the plugin is started this happens in the LasagnaPlugin constructor
-    def hook_updateStatusBar_End(self):
+    @asyncHook(prepare="_prepareAreaHighlight", apply="showAreaHighlight")
+    def hook_updateStatusBar_End(self, imageStack, value, slices):
         """
         hooks into the status bar update function to show the brain area name in the status bar
-        as the user mouses over the images
+        as the user mouses over the images. The name is written by _prepareAreaHighlight. The
+        boundary of the area is found here, on a worker thread, and drawn by showAreaHighlight.
+        """
+        return self.areaHighlightContours(imageStack, value, slices)  # Inherited from ARA_plotter
+
+    def _prepareAreaHighlight(self):
+        """
+        Runs on the GUI thread when the status bar is updated. Returns the arguments of
+        hook_updateStatusBar_End or None if the area highlight need not be redrawn.
         """
         # Get the atlas volume and find in which voxel the mouse cursor is located
         atlas_layer_name, image_stack = self.get_atlas_image_stack('hook_updateStatusBar_End')
         if image_stack is None:
-            return
+            return None
 
         # Inherited from ARA_plotter
         value = self.writeAreaNameInStatusBar(image_stack, self.statusBarName_checkBox.isChecked())
 
         # Highlight the brain area we are mousing over by drawing a boundary around it
-        if self.lastValue != value and self.highlightArea_checkBox.isChecked():
-            self.drawAreaHighlight(image_stack, value)  # Inherited from ARA_plotter
+        if self.lastValue != value and self.highlightArea_checkBox.isChecked() and value > 0:
+            return image_stack, value, [axis.currentSlice for axis in self.lasagna.axes2D]
+        return None
 
     def hook_deleteLayerStack_Slot_End(self):
         """
@@ -1,5 +1,6 @@
 from PyQt5 import QtGui, QtWidgets
 
+from lasagna.plugins import plugin_handler
 from lasagna.plugins.lasagna_plugin import LasagnaPlugin
 
 
@@ -39,3 +40,61 @@ class IoBasePlugin(LasagnaPlugin):
         self.loadAction.setText(self.objectName.title().replace('_', ' ')[:-2])
 
         self.loadAction.triggered.connect(self.showLoadDialog)  # Link the action to the slot
+
+
+class LazyIoPlugin(object):
+    """
+    Stands in for an IO plugin in Lasagna.loadActions until it is first used, so that its module
+    (and the libraries it needs) is not imported at startup. Built from the plugin's entry in
+    the plugin manifest (see plugin_handler.plugin_manifest). The menu action is created straight
+    away. The plugin is imported and created when the action is triggered, when showLoadDialog
+    is called or when any other attribute of the plugin is asked for.
+    """
+
+    def __init__(self, lasagna_serving, manifestEntry):
+        self.lasagna = lasagna_serving
+        self.manifestEntry = manifestEntry
+        self.objectName = manifestEntry['objectName']
+        self.kind = manifestEntry.get('kind')
+        self.icon_name = manifestEntry.get('icon_name', '')
+        self._loader = None
+
+        self.loadAction = QtWidgets.QAction(self.lasagna)
+        IoBasePlugin.add_icon(self)
+        IoBasePlugin.insert_in_menu(self)
+
+    get_icon = IoBasePlugin.get_icon
+
+    def loader(self):
+        """
+        Return the IO plugin, importing and creating it the first time. None if it can not be imported.
+        """
+        if self._loader is None:
+            io_class, _ = plugin_handler.get_plugin_instance_from_file_name(
+                self.manifestEntry['file_name'], attribute_to_import='loaderClass'
+            )
+            if io_class is None:
+                return None
+            self._loader = io_class(self.lasagna)
+            # Our action stays in the menu and forwards to the plugin
+            self.lasagna.menuLoad_ingredient.removeAction(self._loader.loadAction)
+        return self._loader
+
+    def showLoadDialog(self, fname=None):
+        loader = self.loader()
+        if loader is None:
+            self.lasagna.statusBar.showMessage("Could not load the %s plugin" % self.manifestEntry['module_name'])
+            return
+        if fname is None or isinstance(fname, bool):  # a bool is the checked state sent by the menu action
+            # Not every loader takes a file name (e.g. lsm_reader_plugin)
+            return loader.showLoadDialog()
+        return loader.showLoadDialog(fname)
+
+    def __getattr__(self, name):
+        # Only called for attributes not set above
+        if name.startswith('__') or name in ('_loader', 'manifestEntry', 'lasagna'):
+            raise AttributeError(name)
+        loader = self.loader()
+        if loader is None:
+            raise AttributeError(name)
+        return getattr(loader, name)
@@ -17,6 +17,7 @@ import os
 
 import numpy as np
 
+from lasagna.io_libs.sparse_point_io import read_lasagna_lines
 from lasagna.plugins.io.io_plugin_base import IoBasePlugin
 
 
@@ -42,36 +43,9 @@ class loaderClass(IoBasePlugin):
             return
 
         if os.path.isfile(fname): 
-            with open(str(fname), 'r') as fid:
-                contents = fid.read()
-
-            # a list of strings with each string being one line from the file
-            # add nans between lineseries
-            as_list = contents.split('\n')
-
-            data = []
-            last_line_series = None
-            n = 0
-            expected_cols = 4
-            for i in range(len(as_list)):
-                if not as_list[i]:
-                    continue
-
-                line_as_floats = [float(x) for x in as_list[i].split(',')]
-                if len(line_as_floats) != expected_cols:
-                    # Check that all rows have a length of 4, since this is what a line series needs
-                    print("Lines data file {} appears corrupt".format(fname))
-                    return                     
-
-                if last_line_series is None:
-                    last_line_series = line_as_floats[0]
-
-                if last_line_series != line_as_floats[0]:
-                    n += 1
-                    data.append([np.nan, np.nan, np.nan])
-
-                last_line_series = line_as_floats[0]
-                data.append(line_as_floats[1:])
+            data = read_lasagna_lines(fname)
+            if data is None:
+                return
 
             obj_name = fname.split(os.path.sep)[-1]
             self.lasagna.addIngredient(objectName=obj_name,
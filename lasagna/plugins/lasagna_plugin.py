@@ -8,6 +8,8 @@ plugins are started. I prefer the latter.
 
 import re
 
+from lasagna.async_hooks import asyncHook, isAsyncHook  # asyncHook is imported by plugins from here
+
 
 class LasagnaPlugin(object):
     """
@@ -62,6 +64,7 @@ class LasagnaPlugin(object):
         hook_myFunction_End in the plugin will be linked to the hook myFunction_End
         in the lasagna.hooks dictionary
 
+        Hooks decorated with @asyncHook run on a worker thread (see lasagna.async_hooks)
         """
         regexp = re.compile("hook_(.*)")
 
@@ -71,7 +74,10 @@ class LasagnaPlugin(object):
                 print(hook_name)
                 if hook_name in self.lasagna.hooks:
                     # attach the hook by adding to dictionary
-                    self.lasagna.hooks[hook_name].append(getattr(self, this_property))
+                    hook = getattr(self, this_property)
+                    if isAsyncHook(hook):
+                        hook = self.lasagna.asyncHooks.wrap(hook)
+                    self.lasagna.hooks[hook_name].append(hook)
                     if self.verbose:
                         print("Linking " + this_property + " to " + hook_name)
                 else:
@@ -92,6 +98,7 @@ class LasagnaPlugin(object):
         regexp = re.compile(".*" + plugin_name + ".*")
         if self.verbose:
             print("Unlinking hooks for plugin '%s'" % plugin_name)
+        self.lasagna.asyncHooks.cancel(self)
         for hook_list in list(self.lasagna.hooks.keys()):
             if not hook_list:
                 continue
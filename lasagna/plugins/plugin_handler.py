@@ -1,8 +1,18 @@
 
 """
 Methods to handle finding of plugins, etc
+
+Plugins are listed without being imported. plugin_manifest reads what the menus need (the
+module name, its directory and the names the plugin gives itself) from the source of each
+plugin file and caches it in the preferences directory. A file is only read again when its
+modification time or size changes. Modules are imported when a plugin is started or a loader
+is first used (see get_plugin_instance_from_file_name).
 """
+import ast
 import os
+import tempfile
+
+import yaml
 
 
 def find_plugins(plugin_paths):
@@ -30,6 +40,115 @@ def find_plugins(plugin_paths):
     return plugins, plugin_directories
 
 
+# Attributes a plugin or loader sets to string constants in its constructor that are stored in the manifest
+MANIFEST_ATTRIBUTES = ('pluginShortName', 'pluginLongName', 'objectName', 'kind', 'icon_name', 'actionObjectName')
+PLUGIN_CLASS_NAMES = ('plugin', 'loaderClass')
+
+
+def read_plugin_info(file_name):
+    """
+    Return a dictionary with the MANIFEST_ATTRIBUTES that the plugin class in file_name sets to
+    string constants, and has_hooks: True if the class defines hook_ methods.
+    The file is parsed, not imported. Returns an empty dictionary if it can not be parsed.
+    """
+    try:
+        with open(file_name, 'r') as fid:
+            tree = ast.parse(fid.read(), filename=file_name)
+    except (IOError, OSError, SyntaxError, ValueError) as err:
+        print("Could not read plugin file {}: {}".format(file_name, err))
+        return {}
+
+    info = {'has_hooks': False}
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef) or node.name not in PLUGIN_CLASS_NAMES:
+            continue
+        for item in ast.walk(node):
+            if isinstance(item, ast.FunctionDef) and item.name.startswith('hook_'):
+                info['has_hooks'] = True
+            if not isinstance(item, ast.Assign) or len(item.targets) != 1:
+                continue
+            target = item.targets[0]
+            if (isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name)
+                    and target.value.id == 'self' and target.attr in MANIFEST_ATTRIBUTES
+                    and isinstance(item.value, ast.Constant) and isinstance(item.value.value, str)):
+                info.setdefault(target.attr, item.value.value)
+    return info
+
+
+def plugin_manifest(plugin_paths, cache_file=None):
+    """
+    As find_plugins, but returns one dictionary per plugin file with the keys file_name,
+    module_name, directory, menu_dir (the name of the directory, used for the sub-menu),
+    mtime, size and those of read_plugin_info. Nothing is imported.
+    cache_file - YAML file in which the entries are kept between sessions. Optional.
+    """
+    cache = _read_manifest_cache(cache_file)
+    manifest = []
+    changed = False
+    for plugin_folder in plugin_paths:
+        if not os.path.isdir(plugin_folder):
+            print("Plugin path {} is not a valid path. SKIPPING".format(plugin_folder))
+            continue
+
+        plugin_folder = plugin_folder.rstrip(os.sep)
+        for file_name in os.listdir(plugin_folder):
+            if not is_plugin_file(plugin_folder, file_name):
+                continue
+            path = os.path.join(plugin_folder, file_name)
+            stat = os.stat(path)
+            entry = cache.get(path)
+            if entry is None or entry.get('mtime') != stat.st_mtime_ns or entry.get('size') != stat.st_size:
+                entry = {
+                    'file_name': file_name,
+                    'module_name': os.path.splitext(file_name)[0],
+                    'directory': plugin_folder,
+                    'menu_dir': plugin_folder.split(os.path.sep)[-1],
+                    'mtime': stat.st_mtime_ns,
+                    'size': stat.st_size,
+                }
+                entry.update(read_plugin_info(path))
+                changed = True
+            manifest.append(entry)
+
+    # Entries of plugins that were removed or moved are dropped
+    cached_paths = set(cache.keys())
+    cache = {os.path.join(entry['directory'], entry['file_name']): entry for entry in manifest}
+    if changed or cached_paths != set(cache.keys()):
+        _write_manifest_cache(cache_file, cache)
+    return manifest
+
+
+def _read_manifest_cache(cache_file):
+    if cache_file is None or not os.path.isfile(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r') as stream:
+            cache = yaml.safe_load(stream)
+    except (IOError, OSError, yaml.YAMLError) as err:
+        print("Ignoring unreadable plugin manifest {}: {}".format(cache_file, err))
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _write_manifest_cache(cache_file, cache):
+    """
+    Write the manifest atomically so that two Lasagna instances starting together can not corrupt it
+    """
+    if cache_file is None:
+        return
+    directory = os.path.dirname(os.path.abspath(cache_file))
+    tmp_name = None
+    try:
+        fd, tmp_name = tempfile.mkstemp(prefix='.plugin_manifest_', suffix='.yml', dir=directory)
+        with os.fdopen(fd, 'w') as stream:
+            yaml.safe_dump(cache, stream)
+        os.replace(tmp_name, cache_file)
+    except (IOError, OSError) as err:
+        print("Could not write plugin manifest {}: {}".format(cache_file, err))
+        if tmp_name is not None and os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+
 def is_plugin_file(file_path, f):
     return os.path.isfile(os.path.join(file_path, f)) and f.endswith('_plugin.py')
 
@@ -95,8 +95,7 @@ class plugin(LasagnaPlugin, QtWidgets.QWidget, reorder_stack_UI.Ui_reorderStack)
             item = current
 
         for axis in self.lasagna.axes2D:
-            axis.updatePlotItems_2D(self.lasagna.ingredientList,
-                                    sliceToPlot=int(item.text().split(' ')[1]))
+            self.lasagna.redrawScheduler.requestRedraw(axis, sliceToPlot=int(item.text().split(' ')[1]))
 
     def doit(self):
         stk_list = [st.objectName for st in self.lasagna.returnIngredientByType('imagestack')]
@@ -65,9 +65,12 @@ class plugin(
 
         # Extract data from base image
         if image_item is not None:
-            if image_item.image.shape[1] <= y or y < 0:
+            image = getattr(image_item, "dataImage", None)  # the values behind the displayed (quantised) image
+            if image is None:
+                image = image_item.image
+            if image.shape[1] <= y or y < 0:
                 return
-            x_data = image_item.image[:, y]
+            x_data = image[:, y]
 
             self.graphicsView.clear()
             self.graphicsView.plot(x_data)
@@ -0,0 +1,201 @@
+"""
+Coalesces redraw requests so that each 2D axis is redrawn at most once per frame.
+
+A single mouse event can ask for the same axis to be redrawn several times: a Ctrl-drag
+updates the two linked projections, then plugin hooks (e.g. the ARA highlight) call
+initialiseAxes, which redraws all three. Rather than redrawing synchronously each time,
+callers register a request with the scheduler. The slice to show is recorded immediately
+(so code that reads axis.currentSlice straight afterwards still sees the right value) but
+the actual plotting is deferred to a single flush that runs from a QTimer.
+
+During a flush the image stacks' slices for all pending axes are extracted and quantised
+(imagestack.renderSlice) on a small thread pool. This work is memory-bound NumPy copying that
+releases the GIL, so e.g. the two views updated by a Ctrl-drag are prepared at the same time.
+Only the final setImage calls (imagestack.applyRenderedSlice) run on the GUI thread.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5 import QtCore
+
+from lasagna.ingredients.imagestack import imagestack
+
+
+class RedrawScheduler(QtCore.QObject):
+    def __init__(self, lasagna_serving, frameInterval=0, renderThreads=0, parent=None):
+        """
+        lasagna_serving - the Lasagna instance whose axes we redraw
+        frameInterval - minimum time in ms between two flushes. 0 means flush as soon as
+                        control returns to the event loop. A value of ~16 paces redraws at 60 Hz.
+        renderThreads - number of threads preparing slices during a flush. 0 or 1 prepares them
+                        on the GUI thread.
+        """
+        super(RedrawScheduler, self).__init__(parent)
+        self.lasagna = lasagna_serving
+        self.frameInterval = frameInterval
+        # Threads beyond the number of cores would only take turns
+        renderThreads = min(renderThreads, os.cpu_count() or 1)
+        self._renderPool = ThreadPoolExecutor(max_workers=renderThreads) if renderThreads > 1 else None
+
+        # If False, requests are executed immediately (handy for scripting and debugging)
+        self.enabled = True
+
+        # Axes waiting to be redrawn. Kept as a list to preserve the order of the requests.
+        self._pendingAxes = []
+
+        # Callables waiting to be run once per frame, keyed by a name so repeated requests coalesce
+        self._pendingTasks = {}
+
+        self._lastFlushTime = 0.0
+        self.lastFlushDuration = 0.0  # seconds spent in the most recent flush
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+        self.resetCounters()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Requesting redraws
+    def requestRedraw(self, axis, sliceToPlot=None, resetToMiddleLayer=False):
+        """
+        Ask for axis (a projection2D instance) to be redrawn at sliceToPlot during the next frame.
+        The axis' current slice is updated right away.
+        """
+        axis.setCurrentSlice(sliceToPlot, resetToMiddleLayer)
+        self.requestedRedraws += 1
+        self.requestedRedrawsPerAxis[axis.axisToPlot] += 1
+
+        if not self.enabled:
+            self._redrawAxis(axis)
+            return
+
+        if axis not in self._pendingAxes:
+            self._pendingAxes.append(axis)
+        self._scheduleFlush()
+
+    def requestRedrawAllAxes(self, resetToMiddleLayer=False):
+        """
+        Ask for all 2D axes to be redrawn at their current slice
+        """
+        for axis in self.lasagna.axes2D:
+            self.requestRedraw(axis, axis.currentSlice, resetToMiddleLayer)
+
+    def requestTask(self, name, callback):
+        """
+        Run callback once during the next frame. Repeated requests with the same name
+        before the flush replace each other, so only the latest callback runs.
+        """
+        if not self.enabled:
+            callback()
+            return
+        self._pendingTasks[name] = callback
+        self._scheduleFlush()
+
+    def hasPendingRedraws(self):
+        return bool(self._pendingAxes) or bool(self._pendingTasks)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Executing redraws
+    def flush(self):
+        """
+        Redraw every axis with a pending request, then run pending tasks.
+        May also be called directly to force pending redraws to happen now.
+        """
+        self._timer.stop()
+        if not self.hasPendingRedraws():
+            return
+
+        start = time.perf_counter()
+
+        pending_axes = self._pendingAxes
+        self._pendingAxes = []
+        rendered = self._renderSlices(pending_axes)
+        for axis in pending_axes:
+            self._redrawAxis(axis, rendered.get(axis))
+
+        pending_tasks = self._pendingTasks
+        self._pendingTasks = {}
+        for callback in pending_tasks.values():
+            callback()
+
+        self.nFlushes += 1
+        self._lastFlushTime = time.perf_counter()
+        self.lastFlushDuration = self._lastFlushTime - start
+
+        if self.frameInterval and self.lastFlushDuration * 1000 > self.frameInterval:
+            self.overBudgetFlushes += 1
+
+    def _renderSlices(self, axes):
+        """
+        Run renderSlice for every image stack shown in axes on the thread pool.
+        Returns a dictionary of axis -> {stack name: rendered slice}. Empty if there is no pool
+        or only one slice to prepare, in which case the axes render their slices themselves.
+        """
+        if self._renderPool is None:
+            return {}
+
+        jobs = []
+        for axis in axes:
+            for ingredient in self.lasagna.ingredientList:
+                if isinstance(ingredient, imagestack) and axis.getPlotItemByName(ingredient.objectName) is not None:
+                    jobs.append((axis, ingredient))
+        if len(jobs) < 2:
+            return {}
+
+        # Widgets may only be read on the GUI thread, so the z-spreads are read here
+        z_spreads = [spin_box.value() for spin_box in self.lasagna.viewZ_spinBoxes]
+        futures = [
+            self._renderPool.submit(ingredient.renderSlice, axis.axisToPlot, axis.currentSlice,
+                                    z_spreads[axis.axisToPlot])
+            for axis, ingredient in jobs
+        ]
+        rendered = {}
+        for (axis, ingredient), future in zip(jobs, futures):
+            rendered.setdefault(axis, {})[ingredient.objectName] = future.result()
+        return rendered
+
+    def _redrawAxis(self, axis, rendered=None):
+        axis.updatePlotItems_2D(self.lasagna.ingredientList, sliceToPlot=axis.currentSlice, rendered=rendered)
+        self.executedRedraws += 1
+        self.executedRedrawsPerAxis[axis.axisToPlot] += 1
+
+    def _scheduleFlush(self):
+        if self._timer.isActive():
+            return
+
+        delay = 0
+        if self.frameInterval:
+            elapsed_ms = (time.perf_counter() - self._lastFlushTime) * 1000
+            delay = max(0, int(self.frameInterval - elapsed_ms))
+        self._timer.start(delay)
+
+    def shutdown(self):
+        if self._renderPool is not None:
+            self._renderPool.shutdown(wait=False)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Counters
+    def resetCounters(self):
+        self.requestedRedraws = 0
+        self.executedRedraws = 0
+        self.requestedRedrawsPerAxis = [0, 0, 0]
+        self.executedRedrawsPerAxis = [0, 0, 0]
+        self.nFlushes = 0
+        self.overBudgetFlushes = 0
+
+    def stats(self):
+        """
+        Return a dictionary summarising how many redraws were requested and how many actually ran
+        """
+        return {
+            "requested": self.requestedRedraws,
+            "executed": self.executedRedraws,
+            "requestedPerAxis": list(self.requestedRedrawsPerAxis),
+            "executedPerAxis": list(self.executedRedrawsPerAxis),
+            "flushes": self.nFlushes,
+            "overBudgetFlushes": self.overBudgetFlushes,
+            "lastFlushDuration_ms": self.lastFlushDuration * 1000,
+        }
@@ -0,0 +1,185 @@
+"""
+Render thumbnails of image stacks without opening Lasagna (the lasagna-render command).
+
+For each volume a slice through each chosen axis is rendered as Lasagna shows it, with any
+overlay stacks (e.g. an atlas), points and lines drawn on top, and saved as PNG files. A montage
+of the slices of each volume is saved too, and optionally one contact sheet for all volumes.
+Volumes are rendered in parallel by a pool of processes. Qt is not imported.
+
+Example:
+    lasagna-render brains/*.tif --overlay atlas.tif --points cells.csv --size 256 -o thumbs
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from lasagna.image_processing.slice_render import (COLOR_NAMES, montage, overlayLayer, percentileLevels,
+                                                    renderSlice, resize, stackLayer, writePNG)
+from lasagna.io_libs.image_stack_loader import load_stack
+from lasagna.io_libs.sparse_point_io import read_lasagna_lines, read_lasagna_pts, read_pts_file
+from lasagna.utils.preferences import defaultPreferences
+
+# Overlays shared by all the volumes. Set in each worker process by _initWorker.
+_overlays = None
+
+
+def get_parser():
+    defaults = defaultPreferences()
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                     description=__doc__.strip().split("\n")[0])
+    parser.add_argument('stacks', nargs='+', help='Image stacks to render')
+    parser.add_argument('-o', '--outdir', default='.', help='Directory in which to save the PNG files')
+    parser.add_argument('--overlay', nargs='+', default=[],
+                        help='Image stacks shown over every volume. They must have the same shape as the volumes')
+    parser.add_argument('--points', nargs='+', default=[], help='Points files to draw over every volume')
+    parser.add_argument('--lines', nargs='+', default=[], help='Lines files to draw over every volume')
+    parser.add_argument('--axes', type=int, nargs='+', default=[0, 1, 2], choices=[0, 1, 2],
+                        help='Axes through which to slice')
+    parser.add_argument('--slices', type=float, nargs='+', default=[0.5],
+                        help='Position of the slices along each axis as a fraction of its length')
+    parser.add_argument('--size', type=int, default=256, help='Longest side of each thumbnail in pixels')
+    parser.add_argument('--lut', default='gray', choices=COLOR_NAMES, help='Colour map of the volumes')
+    parser.add_argument('--overlay-lut', dest='overlay_lut', nargs='+', default=defaults['colorOrder'],
+                        choices=COLOR_NAMES, help='Colour maps of the overlay stacks, in order')
+    parser.add_argument('--overlay-alpha', dest='overlay_alpha', type=int, default=100,
+                        help='Opacity (0-100) of the overlay stacks')
+    parser.add_argument('--percentiles', type=float, nargs=2, default=[0.5, 99.5],
+                        help='Percentiles of each stack shown as black and full colour')
+    parser.add_argument('--point-color', dest='point_color', type=int, nargs=3, default=[255, 0, 0],
+                        help='RGB colour of the points and lines')
+    parser.add_argument('--point-size', dest='point_size', type=int, default=defaults['defaultSymbolSize'],
+                        help='Diameter of the points in voxels')
+    parser.add_argument('--line-width', dest='line_width', type=int, default=defaults['defaultLineWidth'],
+                        help='Width of the lines in voxels')
+    parser.add_argument('--z-spread', dest='z_spread', type=int, nargs=3, default=defaults['defaultPointZSpread'],
+                        help='Points and lines within this many slices of each slice are shown, one value per axis')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of volumes rendered in parallel. Defaults to the number of CPUs')
+    parser.add_argument('--montage', default=None,
+                        help='Also save the thumbnails of all volumes to this PNG file, one row per volume')
+    return parser
+
+
+def read_points(fname):
+    """
+    Return the (Z, X, Y) coordinates in a points file as an n x 3 array
+    """
+    if fname.endswith('.pts'):
+        data, _ = read_pts_file(fname)
+    else:
+        data = read_lasagna_pts(fname)
+    data = np.asarray(data, dtype=np.float64)
+    return data.reshape(-1, data.shape[-1] if data.size else 3)[:, :3]
+
+
+def load_overlays(options):
+    """
+    Load the overlay stacks, points and lines named in the command-line options
+    """
+    stacks = []
+    for ii, fname in enumerate(options.overlay):
+        data = load_stack(fname)
+        if data is None:
+            continue
+        lut = options.overlay_lut[ii % len(options.overlay_lut)]
+        stacks.append(stackLayer(data, levels=percentileLevels(data, options.percentiles), lut=lut,
+                                 alpha=options.overlay_alpha))
+
+    drawn = []
+    for fname in options.points:
+        drawn.append(overlayLayer(read_points(fname), color=options.point_color, size=options.point_size,
+                                  alpha=defaultPreferences()['defaultSymbolOpacity'], zSpread=options.z_spread))
+    for fname in options.lines:
+        data = read_lasagna_lines(fname)
+        if data is not None:
+            drawn.append(overlayLayer(data, color=options.point_color, size=options.line_width,
+                                      zSpread=options.z_spread, connect=True))
+    return stacks, drawn
+
+
+def _initWorker(options):
+    global _overlays
+    _overlays = load_overlays(options)
+
+
+def render_volume(fname, options, overlays=None):
+    """
+    Render and save the thumbnails of the volume in fname. Returns its file name and the list of
+    thumbnails (RGBA arrays), or an empty list if the volume could not be rendered.
+    """
+    overlay_stacks, drawn = _overlays if overlays is None else overlays
+
+    data = load_stack(fname)
+    if data is None:
+        return fname, []
+    if data.ndim == 4:  # a time series: show the first time point
+        data = data[0]
+
+    stacks = [stackLayer(data, levels=percentileLevels(data, options.percentiles), lut=options.lut)]
+    for overlay in overlay_stacks:
+        if overlay.data.shape != data.shape:
+            print("Not overlaying a stack of shape %s on %s of shape %s" % (overlay.data.shape, fname, data.shape))
+            continue
+        stacks.append(overlay)
+
+    name = os.path.splitext(os.path.basename(fname))[0]
+    thumbnails = []
+    for axis in options.axes:
+        for position in options.slices:
+            slice_index = int(min(max(position, 0), 1) * (data.shape[axis] - 1))
+            rgba = resize(renderSlice(stacks, axis, slice_index, drawn), options.size)
+            writePNG(os.path.join(options.outdir, "%s_axis%d_slice%d.png" % (name, axis, slice_index)), rgba)
+            thumbnails.append(rgba)
+
+    writePNG(os.path.join(options.outdir, "%s_montage.png" % name), montage(thumbnails))
+    return fname, thumbnails
+
+
+def _renderInWorker(fname, options):
+    try:
+        return render_volume(fname, options)
+    except Exception as err:  # report it and carry on with the other volumes
+        print("Failed to render %s: %s" % (fname, err))
+        return fname, []
+
+
+def run(argv=None):
+    options = get_parser().parse_args(argv)
+    if not os.path.isdir(options.outdir):
+        os.makedirs(options.outdir)
+
+    processes = options.processes or multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(options.stacks)))
+    start = time.perf_counter()
+
+    if processes == 1:
+        _initWorker(options)
+        results = [_renderInWorker(fname, options) for fname in options.stacks]
+    else:
+        # Each worker loads the overlays once rather than once per volume
+        pool = multiprocessing.Pool(processes, initializer=_initWorker, initargs=(options,))
+        try:
+            results = pool.starmap(_renderInWorker, [(fname, options) for fname in options.stacks])
+        finally:
+            pool.close()
+            pool.join()
+
+    rendered = [thumbnails for _, thumbnails in results if thumbnails]
+    print("Rendered %d of %d volumes in %0.1f s using %d process(es)"
+          % (len(rendered), len(options.stacks), time.perf_counter() - start, processes))
+
+    if options.montage and rendered:
+        rows = [montage(thumbnails) for thumbnails in rendered]
+        writePNG(options.montage, montage(rows, columns=1))
+        print("Saved contact sheet to %s" % options.montage)
+
+    return 0 if len(rendered) == len(options.stacks) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(run())
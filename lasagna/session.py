@@ -0,0 +1,392 @@
+"""
+Save what Lasagna is showing to a session file and restore it (File > Save session / Open session,
+or the --session command-line option).
+
+A session holds the ingredients in the order they were loaded, with the file each came from, its
+display settings (see lasagna_ingredient.sessionState) and, where needed, the location of a cached
+copy of its data. It also holds the axis ratios, slices, flips and ranges of the three views.
+See lasagna.io_libs.session_io for the file format and the caches.
+
+The data restored are those that were shown when the session was saved. Only stacks that were an
+unaltered memory map of their own .npy file are opened from that file again. Everything else
+(stacks from other formats, stacks that were flipped, rotated or reordered, points and lines)
+comes from the session cache, even if its source file has changed since.
+
+Restoring is quick even for large stacks because nothing is read up front that the views do
+not need:
+1. Stacks that can be memory-mapped, either from their own file (.npy) or from their session
+   cache, are opened right away and the saved slices are drawn. Only those slices are read.
+2. Stacks that must be read whole (label volumes, stacks whose cache is missing) are loaded on
+   a worker thread and added to the views as each arrives. Derived stacks are added once their
+   source stacks are present. The ingredients are kept in the order of the session, so the
+   reference stack (see Lasagna.referenceStack) is the same as when the session was saved.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PyQt5 import QtCore
+
+from lasagna import ingredients
+from lasagna.ingredients.imagestack import imagestack
+from lasagna.ingredients.labelstack import labelstack
+from lasagna.io_libs import image_stack_loader, session_io
+from lasagna.memory_manager import baseArray
+
+
+def isImageKind(kind):
+    """
+    True if ingredients of this kind (e.g. 'labelstack') are image stacks
+    """
+    module = getattr(ingredients, kind, None)
+    return module is not None and issubclass(getattr(module, kind), imagestack)
+
+
+def isWholeReadKind(kind):
+    """
+    True if ingredients of this kind can not be displayed from a memory map and are read whole
+    """
+    module = getattr(ingredients, kind, None)
+    return module is not None and issubclass(getattr(module, kind), labelstack)
+
+
+def mappedFileName(data):
+    """
+    Return the name of the file that data are memory-mapped from, or None
+    """
+    return getattr(baseArray(data), "filename", None)
+
+
+def isFileMap(data, fname):
+    """
+    True if data are the whole of the .npy file fname, memory-mapped and unaltered: not a flipped,
+    rotated, transposed or cropped view of it
+    """
+    base = baseArray(data)
+    mapped = getattr(base, "filename", None)
+    if mapped is None or not fname or not os.path.isfile(fname) or not os.path.samefile(mapped, fname):
+        return False
+    return (data.shape == base.shape and data.strides == base.strides and data.dtype == base.dtype
+            and data.__array_interface__["data"][0] == base.__array_interface__["data"][0])
+
+
+class SessionManager(QtCore.QObject):
+    # Emitted from the loader thread. Qt queues it to the GUI thread because this object lives there.
+    stackLoaded = QtCore.pyqtSignal(object)
+
+    def __init__(self, lasagna_serving):
+        super(SessionManager, self).__init__()
+        self.lasagna = lasagna_serving
+        self._executor = ThreadPoolExecutor(max_workers=1)  # reading is limited by the disk, so one file at a time
+        self._generation = 0  # incremented when a session is restored so that stale loads are discarded
+        self._loading = []  # entries of stacks being read in the background
+        self._waiting = []  # entries of derived stacks whose sources are not all present yet
+        self._order = []  # names of the ingredients of the last restored session, in order
+        self.fname = None  # the session file last saved or restored
+        self.stackLoaded.connect(self._addLoadedStack)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Saving
+    def save(self, fname):
+        """
+        Save the current session to the YAML file fname, writing the session caches that are needed
+        """
+        directory = session_io.cache_dir(fname)
+        entries = [self._ingredientEntry(ingredient, directory) for ingredient in self.lasagna.ingredientList]
+        session = dict(
+            ingredients=entries,
+            views=self.viewState(),
+            zSpread=[spin_box.value() for spin_box in self.lasagna.viewZ_spinBoxes],
+        )
+        session_io.write_session(fname, session)
+        self._pruneCache(directory, entries, self._mappedFiles())
+        self.fname = fname
+        print("Saved session to %s" % fname)
+
+    def _ingredientEntry(self, ingredient, directory):
+        fname = os.path.abspath(ingredient.fnameAbsPath) if ingredient.fnameAbsPath else ""
+        entry = dict(
+            kind=type(ingredient).__name__,
+            objectName=ingredient.objectName,
+            fname=fname,
+            arguments=ingredient.sessionArguments(),
+            state=ingredient.sessionState(),
+        )
+        stamp = session_io.file_stamp(fname)
+        if stamp is not None:
+            entry["stamp"] = stamp
+
+        data = ingredient.sessionData()
+        if data is None:
+            return entry
+
+        # Stacks that are their own file, memory-mapped and unaltered, are opened the same way again
+        if stamp is not None and isFileMap(data, fname):
+            entry["lazy"] = True
+            return entry
+
+        if isImageKind(entry["kind"]):
+            # Named after the data, so an unchanged stack is not written again and a flipped,
+            # rotated or reordered one is
+            cache = self._mappedCacheName(data, directory)
+            if cache is None:
+                self.lasagna.statusBar.showMessage("Writing session cache for %s" % ingredient.objectName)
+                cache = session_io.cache_file_name(ingredient.objectName, session_io.array_digest(data))
+                if not os.path.isfile(os.path.join(directory, cache)):
+                    session_io.write_array_cache(os.path.join(directory, cache), data)
+        else:
+            # Points and lines are small and may have been edited
+            cache = session_io.cache_file_name(ingredient.objectName)
+            session_io.write_array_cache(os.path.join(directory, cache), data)
+        entry["cache"] = cache
+        return entry
+
+    @staticmethod
+    def _mappedCacheName(data, directory):
+        """
+        If data are an unaltered memory map of a cache file in directory (i.e. were restored from
+        this session) return the name of that file, so that it is not read to work out its digest
+        """
+        mapped = mappedFileName(data)
+        if mapped is None or os.path.dirname(os.path.abspath(mapped)) != directory:
+            return None
+        return os.path.basename(mapped) if isFileMap(data, mapped) else None
+
+    def _mappedFiles(self):
+        """
+        Return the absolute paths of the files that loaded ingredients memory-map, flipped or not
+        """
+        registry = self.lasagna.ingredientRegistry
+        mapped = set()
+        for ingredient in (registry.byName(name) for name in registry.names()):
+            for data in (ingredient.raw_data(), getattr(ingredient, "_data", None)):
+                mapped_name = mappedFileName(data)
+                if mapped_name is not None:
+                    mapped.add(os.path.abspath(mapped_name))
+        return mapped
+
+    @staticmethod
+    def _pruneCache(directory, entries, mapped=()):
+        """
+        Delete cache files that the session no longer uses (e.g. copies of files that have changed).
+        Files in mapped, which loaded ingredients still memory-map, are kept.
+        """
+        if not os.path.isdir(directory):
+            return
+        used = set(entry["cache"] for entry in entries if entry.get("cache"))
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not name.endswith(".npy") or name in used or os.path.abspath(path) in mapped:
+                continue
+            try:
+                os.remove(path)
+            except OSError as err:
+                print("Could not remove unused session cache {}: {}".format(path, err))
+
+    def viewState(self):
+        views = []
+        for axis, line_edit in zip(self.lasagna.axes2D, self.lasagna.axisRatioLineEdits):
+            view_box = axis.view.getViewBox()
+            views.append(
+                dict(
+                    axisRatio=float(line_edit.text()),
+                    slice=axis.currentSlice,
+                    xInverted=view_box.xInverted(),
+                    yInverted=view_box.yInverted(),
+                    range=view_box.viewRange(),
+                )
+            )
+        return views
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Restoring
+    def restore(self, fname):
+        """
+        Replace the current ingredients with those of the session file fname. Returns False if
+        the file can not be read.
+        """
+        try:
+            session = session_io.read_session(fname)
+        except (IOError, OSError, ValueError) as err:
+            print("Could not open session %s: %s" % (fname, err))
+            self.lasagna.statusBar.showMessage("Could not open session %s" % fname)
+            return False
+
+        self.cancel()
+        for ingredient in list(self.lasagna.ingredientList):
+            self.lasagna.removeIngredient(ingredient)
+
+        views = session.get("views") or []
+        for spin_box, value in zip(self.lasagna.viewZ_spinBoxes, session.get("zSpread", [])):
+            spin_box.setValue(value)
+        self.applyViewState(views)
+
+        # Add what can be opened without reading it, so that the saved slices are shown first
+        self._order = [entry["objectName"] for entry in session["ingredients"]]
+        background = []
+        for entry in session["ingredients"]:
+            if entry["kind"] == "derivedstack":
+                self._waiting.append(entry)
+                continue
+            if isWholeReadKind(entry["kind"]):
+                background.append(entry)
+                continue
+            data = self._openLazily(entry)
+            if data is None:
+                background.append(entry)
+            else:
+                self._addIngredient(entry, data)
+        self._addWaitingDerivedStacks()
+        self._restoreOrder()
+
+        self.lasagna.initialiseAxes()
+        self.lasagna.redrawScheduler.flush()
+        self.applyViewRanges(views)
+
+        for entry in background:
+            self._loadInBackground(entry)
+
+        self.fname = fname
+        self._showProgress()
+        return True
+
+    def _openLazily(self, entry):
+        """
+        Return the data of entry if they can be opened without reading them (memory-mapped),
+        otherwise None
+        """
+        stamp = session_io.file_stamp(entry["fname"])
+        if entry.get("lazy"):
+            if stamp is None:
+                return None
+            if entry.get("stamp") not in (None, stamp):
+                print("%s has changed since the session was saved. Showing the new file." % entry["fname"])
+            return image_stack_loader.load_stack(entry["fname"])
+
+        if not entry.get("cache"):
+            return None
+        data = session_io.open_array_cache(entry["cache"])
+        if data is None:
+            return None
+        if stamp is not None and entry.get("stamp") not in (None, stamp):
+            print("%s has changed since the session was saved. Restoring the saved copy." % entry["fname"])
+        if not isImageKind(entry["kind"]):
+            data = np.array(data)  # points and lines are small and may be edited
+        return data
+
+    def _addIngredient(self, entry, data):
+        """
+        Create the ingredient described by entry with data and add it to the views
+        """
+        self.lasagna.addIngredient(
+            kind=entry["kind"],
+            objectName=entry["objectName"],
+            data=data,
+            fname=entry["fname"],
+            **(entry.get("arguments") or dict())
+        )
+        ingredient = self.lasagna.returnIngredientByName(entry["objectName"])
+        if not ingredient:
+            return None
+        ingredient.restoreSessionState(entry.get("state") or dict())
+        ingredient.addToPlots()
+        return ingredient
+
+    def _restoreOrder(self):
+        """
+        Put the ingredients back in the order of the session. Stacks read in the background are
+        added after the others, and the first image stack is the reference grid.
+        """
+        position = dict((name, ii) for ii, name in enumerate(self._order))
+        current = self.lasagna.ingredientList
+        ordered = sorted(current, key=lambda ingredient: position.get(ingredient.objectName, len(position)))
+        moved = [ii for ii, (was, now) in enumerate(zip(current, ordered)) if was is not now]
+        if not moved:
+            return
+        current[:] = ordered
+        self.lasagna.ingredientRegistry.reorder(ordered)
+        # Plot items are drawn, and list rows shown, in the order they were added
+        for ingredient in ordered[moved[0]:]:
+            ingredient.removePlotItem()
+            ingredient.addToPlots()
+            items = ingredient.model.findItems(ingredient.objectName)
+            if items:
+                ingredient.model.appendRow(ingredient.model.takeRow(items[0].row()))
+
+    def _addWaitingDerivedStacks(self):
+        for entry in list(self._waiting):
+            sources = entry["arguments"].get("sources", dict()).values()
+            if all(self.lasagna.returnIngredientByName(name) for name in sources):
+                self._waiting.remove(entry)
+                self._addIngredient(entry, None)
+
+    def applyViewState(self, views):
+        for axis, line_edit, view in zip(self.lasagna.axes2D, self.lasagna.axisRatioLineEdits, views):
+            line_edit.setText(str(view.get("axisRatio", line_edit.text())))
+            view_box = axis.view.getViewBox()
+            view_box.invertX(bool(view.get("xInverted", False)))
+            view_box.invertY(bool(view.get("yInverted", True)))
+            if view.get("slice") is not None:
+                axis.setCurrentSlice(int(view["slice"]))
+
+    def applyViewRanges(self, views):
+        for axis, view in zip(self.lasagna.axes2D, views):
+            if view.get("range"):
+                x_range, y_range = view["range"]
+                axis.view.getViewBox().setRange(xRange=x_range, yRange=y_range, padding=0)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # Background loading
+    def _loadInBackground(self, entry):
+        has_cache = bool(entry.get("cache")) and os.path.isfile(entry["cache"])
+        if not has_cache and (not isImageKind(entry["kind"]) or not os.path.isfile(entry["fname"])):
+            print("Session - can not restore %s: no cached data and no file %s" % (entry["objectName"], entry["fname"]))
+            return
+        self._loading.append(entry)
+        self._executor.submit(self._load, self._generation, entry)
+
+    def _load(self, generation, entry):
+        fname = entry.get("cache") if entry.get("cache") and os.path.isfile(entry["cache"]) else entry["fname"]
+        try:
+            if fname == entry["fname"]:
+                data = image_stack_loader.load_stack(fname)
+            else:
+                data = np.load(fname)
+        except Exception as err:  # report it on the console rather than lose it in the thread
+            print("Session - failed to read %s: %s" % (fname, err))
+            data = None
+        self.stackLoaded.emit((generation, entry, data))
+
+    def _addLoadedStack(self, job):
+        generation, entry, data = job
+        if generation != self._generation:
+            return  # another session was restored meanwhile
+        self._loading.remove(entry)
+        if data is not None:
+            self._addIngredient(entry, data)
+            self._addWaitingDerivedStacks()
+            self._restoreOrder()
+            self.lasagna.initialiseAxes()
+        self._showProgress()
+
+    def _showProgress(self):
+        if self._loading:
+            message = "Session %s: loading %d more stack(s)" % (os.path.basename(self.fname), len(self._loading))
+        else:
+            message = "Session %s restored" % os.path.basename(self.fname)
+        self.lasagna.statusBar.showMessage(message)
+
+    def pending(self):
+        return len(self._loading)
+
+    def cancel(self):
+        """
+        Discard the stacks still being loaded for the last restored session
+        """
+        self._generation += 1
+        self._loading = []
+        self._waiting = []
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
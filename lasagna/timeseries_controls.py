@@ -0,0 +1,89 @@
+"""
+A toolbar for stepping through and playing the timepoints of time series stacks
+(see lasagna.ingredients.timeseriesstack). It is shown only while a time series is loaded.
+
+Playback advances one timepoint per tick of a timer running at the chosen frame rate. The
+views are redrawn through the redraw scheduler so a slow frame is dropped rather than queued.
+"""
+
+from PyQt5 import QtCore, QtWidgets
+
+from lasagna.utils import preferences
+
+
+class TimeSeriesControls(QtWidgets.QToolBar):
+    def __init__(self, lasagna_serving, parent=None):
+        super(TimeSeriesControls, self).__init__("Time series", parent)
+        self.lasagna = lasagna_serving
+        self.setObjectName("timeSeriesToolBar")
+
+        self.play_button = QtWidgets.QToolButton(self)
+        self.play_button.setText("Play")
+        self.play_button.setCheckable(True)
+
+        self.timepoint_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal, self)
+        self.timepoint_slider.setMinimumWidth(200)
+
+        self.timepoint_spinBox = QtWidgets.QSpinBox(self)
+        self.timepoint_spinBox.setPrefix("t = ")
+
+        self.frameRate_spinBox = QtWidgets.QSpinBox(self)
+        self.frameRate_spinBox.setRange(1, 100)
+        self.frameRate_spinBox.setSuffix(" fps")
+        self.frameRate_spinBox.setValue(preferences.readPreference("timeseriesFrameRate"))
+
+        self.addWidget(self.play_button)
+        self.addWidget(self.timepoint_slider)
+        self.addWidget(self.timepoint_spinBox)
+        self.addWidget(self.frameRate_spinBox)
+
+        self.playTimer = QtCore.QTimer(self)
+        self.playTimer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.playTimer.timeout.connect(self.nextTimepoint)
+
+        self.play_button.toggled.connect(self.play)
+        self.timepoint_slider.valueChanged.connect(self.timepoint_spinBox.setValue)
+        self.timepoint_spinBox.valueChanged.connect(self.timepoint_slider.setValue)
+        self.timepoint_slider.valueChanged.connect(self.lasagna.setTimepoint)
+        self.frameRate_spinBox.valueChanged.connect(self.setFrameRate)
+
+        self.setFrameRate(self.frameRate_spinBox.value())
+        self.setVisible(False)
+
+    def updateRange(self, nTimepoints):
+        """
+        Show the toolbar if there are timepoints to step through (nTimepoints > 0)
+        """
+        if nTimepoints < 1:
+            self.play_button.setChecked(False)
+            self.setVisible(False)
+            return
+        for widget in (self.timepoint_slider, self.timepoint_spinBox):
+            widget.setRange(0, nTimepoints - 1)
+        self.setVisible(True)
+
+    def setFrameRate(self, framesPerSecond):
+        self.playTimer.setInterval(int(round(1000.0 / framesPerSecond)))
+
+    def play(self, start=True):
+        if start:
+            self.play_button.setText("Pause")
+            self.playTimer.start()
+        else:
+            self.play_button.setText("Play")
+            self.playTimer.stop()
+
+    def nextTimepoint(self):
+        timepoint = self.timepoint_slider.value() + 1
+        if timepoint > self.timepoint_slider.maximum():
+            timepoint = 0
+        self.timepoint_slider.setValue(timepoint)
+
+    def setTimepoint(self, timepoint):
+        """
+        Move the slider without emitting signals (e.g. when the timepoint was set elsewhere)
+        """
+        for widget in (self.timepoint_slider, self.timepoint_spinBox):
+            widget.blockSignals(True)
+            widget.setValue(timepoint)
+            widget.blockSignals(False)
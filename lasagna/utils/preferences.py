@@ -2,9 +2,19 @@
 The following plugin functions by default expect the name and path of the preferences file to be the
 main lasagna preferences file. However, this can be over-ridden so that individual plugins can have
 their own preferences files and still use these functions.
+
+Each preferences file is parsed once and then served from memory by a preferenceStore. Before a
+read, the store checks the file's modification time and reloads it if it was edited outside
+Lasagna. Writes go to a temporary file that then replaces the preferences file, so a crash
+part-way through a write can not leave a truncated file. Functions registered with
+addPreferenceListener are called whenever a preference changes, whether it was written by
+Lasagna or edited on disk.
 """
 
+import copy
 import os
+import tempfile
+import threading
 
 import yaml
 
@@ -39,30 +49,184 @@ def defaultPreferences():
             'defaultSymbolSize': 8,
             'hideZoomResetButtonOnImageAxes': True,
             'hideAxes': True,
+            'redrawFrameInterval': 0,  # Minimum ms between redraws of the views. 0 redraws as soon as Qt is idle
+            'memoryBudget_MB': 0,  # Caches are dropped and stacks memory-mapped above this. 0 means no limit
+            'timeseriesFrameRate': 10,  # Frames per second when playing a time series
+            'timeseriesPrefetchDepth': 8,  # Number of upcoming timepoints whose displayed slices are read ahead
+            'autoLevelPercentiles': [0.5, 99.5],  # Percentiles of each slice used as its levels in per-slice auto-contrast
+            'hoverBudget_ms': 8,  # Mouse moves over a view taking longer than this are counted as over budget
+            'profileHooks': False,  # Time the plugin hooks from startup (see View > Plugin hook timings)
+            'hookBudget_ms': 16,  # Hook functions taking longer than this are reported when hooks are timed. 0 for no reports
+            'renderThreads': 3,  # Threads extracting the slices of the views in parallel. 0 does it all on the GUI thread
             }
 
 
+class preferenceStore(object):
+    """
+    The contents of one preferences file, kept in memory
+    """
+
+    def __init__(self, prefFName):
+        self.prefFName = prefFName
+        self._preferences = None
+        self._fileStamp = None  # (mtime, size) of the file when it was last read or written
+        self._listeners = []
+        self._lock = threading.RLock()
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.prefFName)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh(self, defaultPref=None):
+        """
+        Re-read the file if it changed since it was last read or written. Creates the file from
+        defaultPref (default: defaultPreferences()) if it is missing. Returns the names of
+        the preferences whose values changed.
+        """
+        with self._lock:
+            stamp = self._stamp()
+            if stamp is None:
+                print("PREF FILE: %s" % self.prefFName)
+                self._write(defaultPreferences() if defaultPref is None else defaultPref)
+                print("Created default preferences file in " + self.prefFName)
+                stamp = self._fileStamp
+            if stamp == self._fileStamp and self._preferences is not None:
+                return []
+
+            with open(self.prefFName, 'r') as stream:
+                loaded = yaml.load(stream, Loader=yaml.FullLoader) or dict()
+            previous = self._preferences
+            self._preferences = loaded
+            self._fileStamp = stamp
+
+        if previous is None:
+            return []
+        changed = [name for name in set(previous) | set(loaded) if previous.get(name) != loaded.get(name)]
+        for name in changed:
+            self._notify(name, loaded.get(name))
+        return changed
+
+    def all(self, defaultPref=None):
+        """
+        Return a copy of all preferences as a dictionary
+        """
+        with self._lock:
+            self.refresh(defaultPref)
+            return copy.deepcopy(self._preferences)
+
+    def contains(self, preferenceName):
+        with self._lock:
+            self.refresh()
+            return preferenceName in self._preferences
+
+    def get(self, preferenceName):
+        """
+        Return a copy of the value of preferenceName, so that callers can not change the stored value
+        """
+        with self._lock:
+            self.refresh()
+            return copy.deepcopy(self._preferences.get(preferenceName))
+
+    def set(self, preferenceName, newValue):
+        with self._lock:
+            self.refresh()
+            if self._preferences.get(preferenceName) == newValue and preferenceName in self._preferences:
+                return
+            preferences = dict(self._preferences)
+            preferences[preferenceName] = copy.deepcopy(newValue)
+            self._write(preferences)
+        self._notify(preferenceName, newValue)
+
+    def replace(self, preferences):
+        """
+        Replace all preferences with the dictionary preferences
+        """
+        with self._lock:
+            previous = self._preferences or dict()
+            self._write(copy.deepcopy(preferences))
+        for name in set(previous) | set(preferences):
+            if previous.get(name) != preferences.get(name):
+                self._notify(name, preferences.get(name))
+
+    def _write(self, preferences):
+        """
+        Write preferences atomically and remember them. Called with the lock held.
+        """
+        directory = os.path.dirname(os.path.abspath(self.prefFName))
+        fd, tmp_name = tempfile.mkstemp(prefix='.prefs_', suffix='.yml', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as stream:
+                yaml.dump(preferences, stream)
+            os.replace(tmp_name, self.prefFName)
+        except (IOError, OSError):
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
+        self._preferences = preferences
+        self._fileStamp = self._stamp()
+
+    def addListener(self, callback):
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def removeListener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, preferenceName, value):
+        for callback in list(self._listeners):
+            callback(preferenceName, copy.deepcopy(value))
+
+
+_stores = dict()  # absolute file name -> preferenceStore
+_storesLock = threading.Lock()
+
+
+def preferenceStoreFor(prefFName=get_lasagna_pref_file()):
+    """
+    Return the process-wide preferenceStore of file prefFName
+    """
+    key = os.path.abspath(prefFName)
+    with _storesLock:
+        if key not in _stores:
+            _stores[key] = preferenceStore(prefFName)
+        return _stores[key]
+
+
+def addPreferenceListener(callback, prefFName=get_lasagna_pref_file()):
+    """
+    Call callback(preferenceName, newValue) whenever a preference in prefFName changes
+    """
+    preferenceStoreFor(prefFName).addListener(callback)
+
+
+def removePreferenceListener(callback, prefFName=get_lasagna_pref_file()):
+    preferenceStoreFor(prefFName).removeListener(callback)
+
+
+def checkForChanges(prefFName=get_lasagna_pref_file()):
+    """
+    Re-read prefFName if it was edited outside Lasagna and notify listeners of the changes.
+    Returns the names of the preferences that changed.
+    """
+    return preferenceStoreFor(prefFName).refresh()
+
+
 def loadAllPreferences(prefFName=get_lasagna_pref_file(), defaultPref=defaultPreferences()):
     """
     Load the preferences YAML file. If the file is missing, we create it using the default
     preferences defined above. Preferences are returned as a dictionary.
     """
-    # print "loading from pref file %s" % prefFName
-    # Generate a default preferences file if no preferences file exists
-    if not os.path.exists(prefFName):
-        print("PREF FILE: %s" % prefFName)
-        writeAllPreferences(defaultPref, prefFName=prefFName)
-        print("Created default preferences file in " + prefFName)
-
-    # Load preferences YAML file as a dictionary
-    with open(prefFName, 'r') as stream:
-        return yaml.load(stream,Loader=yaml.FullLoader)
+    return preferenceStoreFor(prefFName).all(defaultPref)
 
 
 def readPreference(preferenceName, prefFName=get_lasagna_pref_file(), preferences=get_lasagna_pref_file()):
     """
-    Read preferences with key "preferenceName" from YAML file prefFName on disk.
-    If the key is abstent, call defaultPreferences and search for the key. If it
+    Read preferences with key "preferenceName" from YAML file prefFName (held in memory, see
+    preferenceStore). If the key is abstent, call defaultPreferences and search for the key. If it
     is present, add to preferences file and return the value. If absent, raise a
     warning and return None. The caller function needs to decide what to do with
     the None.
@@ -70,10 +234,10 @@ def readPreference(preferenceName, prefFName=get_lasagna_pref_file(), preference
 
     # TODO: need some sort of check as to whether the preference value is valid
 
-    # Check on disk
-    preferences = loadAllPreferences(prefFName)
-    if preferenceName in preferences:
-        return preferences[preferenceName]
+    # Check the preferences file
+    store = preferenceStoreFor(prefFName)
+    if store.contains(preferenceName):
+        return store.get(preferenceName)
     else:
         print("Did not find preference %s on disk. Looking in defaultPreferencesa" % preferenceName)
 
@@ -93,10 +257,7 @@ def writeAllPreferences(preferences, prefFName=get_lasagna_pref_file()):
     user's home directory.
     """
     assert isinstance(preferences, dict)
-
-    # TODO: check ability to write to the file before proceeding
-    with open(prefFName, 'w') as stream:
-        yaml.dump(preferences, stream)
+    preferenceStoreFor(prefFName).replace(preferences)
 
 
 def preferenceWriter(preferenceName, newValue, prefFName=get_lasagna_pref_file()):
@@ -105,11 +266,7 @@ def preferenceWriter(preferenceName, newValue, prefFName=get_lasagna_pref_file()
     Saves updates dictionary to the preferences file
     """
     print("Writing preference data for: %s\n" % preferenceName)
-    preferences = loadAllPreferences(prefFName)
-    if preferenceName in preferences:
-        preferences[preferenceName] = newValue
-    else:
+    store = preferenceStoreFor(prefFName)
+    if not store.contains(preferenceName):
         print("Adding missing preference %s to preferences file" % preferenceName)
-        preferences[preferenceName] = newValue
-
-    writeAllPreferences(preferences, prefFName)
+    store.set(preferenceName, newValue)
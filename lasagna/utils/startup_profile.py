@@ -0,0 +1,73 @@
+"""
+Time the stages of Lasagna's start-up (see the --profile-startup option of lasagna.main).
+
+Code marks the end of each stage with mark(name). When profiling is enabled the time since
+the previous mark is recorded together with the top-level packages first imported during
+that stage, so slow imports show up against the stage that triggered them. When it is not
+enabled mark does nothing.
+"""
+
+import sys
+import time
+
+_enabled = False
+_stages = []  # (stage name, seconds, names of top-level packages imported during the stage)
+_lastMark = None
+_lastModules = set()
+
+
+def enable():
+    """
+    Start profiling. The first stage is timed from here.
+    """
+    global _enabled, _lastMark, _lastModules
+    _enabled = True
+    del _stages[:]
+    _lastMark = time.perf_counter()
+    _lastModules = _topLevelModules()
+
+
+def isEnabled():
+    return _enabled
+
+
+def _topLevelModules():
+    return set(name.split(".", 1)[0] for name in list(sys.modules.keys()))
+
+
+def mark(stage):
+    """
+    Record the end of stage
+    """
+    global _lastMark, _lastModules
+    if not _enabled:
+        return
+    now = time.perf_counter()
+    modules = _topLevelModules()
+    _stages.append((stage, now - _lastMark, sorted(modules - _lastModules)))
+    _lastMark = time.perf_counter()  # so that listing the modules is not charged to the next stage
+    _lastModules = modules
+
+
+def stages():
+    return list(_stages)
+
+
+def report():
+    """
+    Return the recorded stages as text, one line per stage, with the packages each imported
+    """
+    if not _stages:
+        return "No start-up stages were recorded"
+    total = sum(duration for _, duration, _ in _stages)
+    width = max(len(stage) for stage, _, _ in _stages)
+    lines = ["Start-up time: %0.3f s" % total]
+    for stage, duration, modules in _stages:
+        line = "  %s  %7.1f ms  %4.1f%%" % (stage.ljust(width), duration * 1000, 100 * duration / max(total, 1e-9))
+        if modules:
+            # Third-party packages first as those are the ones worth deferring
+            stdlib = getattr(sys, "stdlib_module_names", ())
+            shown = sorted((m for m in modules if not m.startswith("_")), key=lambda m: (m in stdlib, m))
+            line += "  imported: " + ", ".join(shown[:12]) + (" ..." if len(shown) > 12 else "")
+        lines.append(line)
+    return "\n".join(lines)
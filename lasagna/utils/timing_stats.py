@@ -0,0 +1,65 @@
+"""
+Keep the durations of a repeated operation (e.g. handling a mouse move) and summarise them
+"""
+
+from collections import deque
+
+import numpy as np
+
+
+class durationStats(object):
+    def __init__(self, budget_ms=0, history=1000):
+        """
+        budget_ms - durations longer than this are counted as over budget. 0 means no budget.
+        history - number of most recent durations kept for the percentiles
+        """
+        self.budget_ms = budget_ms
+        self._durations = deque(maxlen=history)
+        self.reset()
+
+    def reset(self):
+        self._durations.clear()
+        self.count = 0
+        self.total = 0.0  # seconds, over all calls
+        self.longest = 0.0
+        self.overBudget = 0
+
+    def record(self, duration):
+        """
+        Add one duration in seconds
+        """
+        self._durations.append(duration)
+        self.count += 1
+        self.total += duration
+        if duration > self.longest:
+            self.longest = duration
+        if self.budget_ms and duration * 1000 > self.budget_ms:
+            self.overBudget += 1
+
+    def summary(self):
+        """
+        Return a dictionary with the number of calls, the median, 95th percentile and longest
+        duration in ms and the number of calls over budget
+        """
+        if self.count == 0:
+            p50 = p95 = 0.0
+        else:
+            p50, p95 = np.percentile(np.fromiter(self._durations, dtype=np.float64), [50, 95]) * 1000
+        return {
+            "count": self.count,
+            "mean_ms": self.total * 1000 / max(self.count, 1),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "max_ms": self.longest * 1000,
+            "budget_ms": self.budget_ms,
+            "overBudget": self.overBudget,
+        }
+
+    def histogram(self, edges_ms):
+        """
+        Return how many of the kept durations fall below edges_ms[0], between each pair of
+        consecutive edges and at or above edges_ms[-1] (so len(edges_ms) + 1 counts)
+        """
+        durations = np.fromiter(self._durations, dtype=np.float64) * 1000
+        bins = np.searchsorted(edges_ms, durations, side="right")
+        return np.bincount(bins, minlength=len(edges_ms) + 1).tolist()
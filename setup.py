@@ -20,6 +20,7 @@ setup(
     entry_points={
         "console_scripts": [
             'lasagna = lasagna.main:run',
+            'lasagna-render = lasagna.render_cli:run',
         ]
     },
 )
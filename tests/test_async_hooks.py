@@ -0,0 +1,126 @@
+"""
+Plugin hooks run on worker threads, with superseded calls dropped
+"""
+
+import threading
+import time
+
+import pytest
+from PyQt5 import QtCore
+
+from lasagna.async_hooks import AsyncHookPool, asyncHook, isAsyncHook
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+@pytest.fixture
+def pool(app):
+    pool = AsyncHookPool(maxWorkers=2)
+    yield pool
+    pool.shutdown()
+
+
+def processEventsUntil(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            raise AssertionError("timed out")
+        QtCore.QCoreApplication.processEvents()
+        time.sleep(0.002)
+
+
+class examplePlugin(object):
+    def __init__(self):
+        self.release = threading.Event()
+        self.release.set()
+        self.started = []
+        self.applied = []
+        self.applyThreads = []
+
+    def _args(self, value):
+        return None if value is None else (value,)
+
+    def _apply(self, result):
+        self.applied.append(result)
+        self.applyThreads.append(threading.current_thread())
+
+    @asyncHook(prepare="_args", apply="_apply")
+    def hook_updateStatusBar_End(self, value):
+        self.started.append(value)
+        self.release.wait(5)
+        if value == "fail":
+            raise ValueError("plugin bug")
+        return value * 2
+
+
+def test_decorator_marks_the_hook():
+    assert isAsyncHook(examplePlugin().hook_updateStatusBar_End)
+    assert not isAsyncHook(examplePlugin()._apply)
+
+
+def test_result_is_applied_on_the_gui_thread(pool):
+    plugin = examplePlugin()
+    hook = pool.wrap(plugin.hook_updateStatusBar_End)
+    hook(21)
+    processEventsUntil(lambda: plugin.applied)
+
+    assert plugin.applied == [42]
+    assert plugin.applyThreads == [threading.current_thread()]
+    assert pool.pending() == 0
+
+
+def test_prepare_can_skip_a_call(pool):
+    plugin = examplePlugin()
+    pool.wrap(plugin.hook_updateStatusBar_End)(None)
+    assert pool.pending() == 0 and plugin.started == []
+
+
+def test_calls_made_while_running_supersede_each_other(pool):
+    plugin = examplePlugin()
+    hook = pool.wrap(plugin.hook_updateStatusBar_End)
+    plugin.release.clear()
+    hook(1)
+    for value in (2, 3, 4):
+        hook(value)
+    assert pool.dropped == 2
+
+    plugin.release.set()
+    processEventsUntil(lambda: pool.pending() == 0)
+    assert plugin.started == [1, 4]
+    assert plugin.applied == [2, 8]
+
+
+def test_results_are_discarded_after_cancel(pool):
+    plugin = examplePlugin()
+    hook = pool.wrap(plugin.hook_updateStatusBar_End)
+    plugin.release.clear()
+    hook(1)
+    hook(2)
+
+    pool.cancel(plugin)
+    plugin.release.set()
+    processEventsUntil(lambda: pool.pending() == 0)
+    QtCore.QCoreApplication.processEvents()
+    assert plugin.started == [1]
+    assert plugin.applied == []
+
+    # The hook works again if it is called after being cancelled
+    hook(5)
+    processEventsUntil(lambda: plugin.applied)
+    assert plugin.applied == [10]
+
+
+def test_a_failing_hook_does_not_stop_later_calls(pool, capsys):
+    plugin = examplePlugin()
+    hook = pool.wrap(plugin.hook_updateStatusBar_End)
+    hook("fail")
+    processEventsUntil(lambda: pool.pending() == 0)
+    assert "plugin bug" in capsys.readouterr().out
+    assert plugin.applied == []
+
+    hook(3)
+    processEventsUntil(lambda: plugin.applied)
+    assert plugin.applied == [6]
@@ -0,0 +1,80 @@
+"""
+Filters applied to the displayed slice and the cache of filtered slices
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from lasagna.image_processing.display_filters import displayFilter, filterCache
+
+
+def test_cache_evicts_the_least_recently_used():
+    cache = filterCache(maxEntries=2)
+    cache.put("a", np.zeros(4))
+    cache.put("b", np.ones(4))
+    assert cache.get("a") is not None  # "a" is now the most recently used
+    cache.put("c", np.ones(4))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert len(cache) == 2
+    assert cache.nbytes() == 2 * np.zeros(4).nbytes
+
+
+def test_putting_an_existing_key_replaces_it():
+    cache = filterCache(maxEntries=2)
+    cache.put("a", np.zeros(4))
+    cache.put("b", np.zeros(4))
+    cache.put("a", np.ones(4))
+    cache.put("c", np.zeros(4))
+
+    assert cache.get("b") is None
+    np.testing.assert_array_equal(cache.get("a"), np.ones(4))
+    cache.clear()
+    assert len(cache) == 0 and cache.get("a") is None
+
+
+def test_cache_is_safe_to_share_between_threads():
+    cache = filterCache(maxEntries=8)
+
+    def work(offset):
+        for ii in range(500):
+            cache.put((offset, ii % 20), np.zeros(2))
+            cache.get((offset, (ii + 3) % 20))
+
+    threads = [threading.Thread(target=work, args=(offset,)) for offset in range(4)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    assert len(cache) == 8
+
+
+def test_filter_parameters_and_key():
+    smooth = displayFilter("unsharp", amount=0.5)
+    assert smooth.params == dict(sigma=2.0, amount=0.5)
+    assert smooth.key() == displayFilter("unsharp", sigma=2.0, amount=0.5).key()
+    assert smooth.key() != displayFilter("unsharp").key()
+    assert str(smooth) == "unsharp(sigma=2, amount=0.5)"
+
+    with pytest.raises(ValueError):
+        displayFilter("sharpen")
+    with pytest.raises(ValueError):
+        displayFilter("gaussian", size=3)
+
+
+def test_filters_match_scipy():
+    ndimage = pytest.importorskip("scipy.ndimage")
+    image = np.random.default_rng(0).integers(0, 1000, size=(40, 50)).astype(np.uint16)
+    as_float = image.astype(np.float32)
+
+    np.testing.assert_allclose(displayFilter("gaussian", sigma=1.5).apply(image),
+                               ndimage.gaussian_filter(as_float, 1.5), rtol=1e-6)
+    np.testing.assert_array_equal(displayFilter("median", size=5).apply(image), ndimage.median_filter(as_float, 5))
+
+    # A flat background is removed by the top-hat filter, a bright spot smaller than the disk is kept
+    background = np.full((40, 40), 100, dtype=np.float32)
+    background[20, 20] = 150
+    tophat = displayFilter("tophat", radius=3).apply(background)
+    assert tophat.dtype == np.float32
+    assert tophat[20, 20] == 50 and tophat.sum() == 50
@@ -0,0 +1,82 @@
+"""
+Resampling displayed slices onto the grid of a reference stack
+"""
+
+import numpy as np
+import pytest
+
+from lasagna.image_processing.grid_resampler import gridResampler
+
+
+def seenBy(volume, axisToPlot):
+    return volume.swapaxes(0, axisToPlot)
+
+
+@pytest.mark.parametrize("interpolation", ["nearest", "linear"])
+@pytest.mark.parametrize("axisToPlot", [0, 1, 2])
+def test_same_grid_returns_the_slice(interpolation, axisToPlot):
+    volume = np.random.default_rng(0).random((6, 7, 8)).astype(np.float32)
+    resampler = gridResampler(interpolation)
+    resampler.setGeometry(volume.shape, (1, 1, 1), (0, 0, 0), volume.shape, (1, 1, 1), (0, 0, 0))
+
+    for sliceToPlot in range(volume.shape[axisToPlot]):
+        np.testing.assert_allclose(
+            resampler.resampleSlice(seenBy(volume, axisToPlot), axisToPlot, sliceToPlot),
+            seenBy(volume, axisToPlot)[sliceToPlot],
+            rtol=1e-6,
+        )
+
+
+def test_nearest_picks_the_closest_source_voxel():
+    source = np.arange(4 * 5 * 6, dtype=np.uint16).reshape(4, 5, 6)
+    reference_shape = (8, 10, 12)
+    resampler = gridResampler("nearest")
+    resampler.setGeometry(source.shape, (2, 2, 2), (0, 0, 0), reference_shape, (1, 1, 1), (0, 0, 0))
+
+    # Reference voxels beyond the last source voxel (e.g. 7 -> 3.5 -> 4) are zero
+    padded = np.pad(source, ((0, 1), (0, 1), (0, 1)))
+    index = lambda n: np.rint(np.arange(n) / 2.0).astype(int)
+    expected = padded[index(8)][:, index(10)][:, :, index(12)]
+    for sliceToPlot in range(8):
+        np.testing.assert_array_equal(resampler.resampleSlice(source, 0, sliceToPlot), expected[sliceToPlot])
+
+
+def test_linear_interpolates_between_voxels():
+    # The value of each voxel is its world position along the last dimension
+    source = np.tile(np.arange(0, 12, 2, dtype=np.float32), (3, 4, 1))
+    resampler = gridResampler("linear")
+    resampler.setGeometry(source.shape, (1, 1, 2), (0, 0, 0), (3, 4, 11), (1, 1, 1), (0, 0, 0))
+
+    np.testing.assert_allclose(resampler.resampleSlice(source, 0, 1), np.tile(np.arange(11.0), (4, 1)))
+
+
+def test_outside_the_source_is_zero():
+    source = np.ones((4, 4, 4), dtype=np.uint8)
+    resampler = gridResampler("nearest")
+    resampler.setGeometry(source.shape, (1, 1, 1), (2, 0, 2), (8, 4, 8), (1, 1, 1), (0, 0, 0))
+
+    assert resampler.sourceSlice(0, 0) == -1
+    assert not resampler.resampleSlice(source, 0, 0).any()
+    assert resampler.sourceSlice(0, 3) == 1
+    np.testing.assert_array_equal(resampler.resampleSlice(source, 0, 3).any(axis=0), [0, 0, 1, 1, 1, 1, 0, 0])
+
+
+def test_maps_are_cached_until_the_geometry_changes():
+    resampler = gridResampler("nearest", maxCachedMaps=2)
+    geometry = ((4, 4, 4), (1, 1, 1), (0, 0, 0), (4, 4, 4), (1, 1, 1), (0, 0, 0))
+    resampler.setGeometry(*geometry)
+    maps = resampler.indexMaps(0, 1)
+    assert resampler.indexMaps(0, 1) is maps
+
+    resampler.setGeometry(*geometry)
+    assert resampler.indexMaps(0, 1) is maps
+    resampler.indexMaps(1, 1)
+    resampler.indexMaps(2, 1)
+    assert resampler.indexMaps(0, 1) is not maps  # evicted
+
+    maps = resampler.indexMaps(0, 1)
+    resampler.setGeometry((4, 4, 4), (2, 1, 1), (0, 0, 0), (4, 4, 4), (1, 1, 1), (0, 0, 0))
+    assert resampler.indexMaps(0, 1) is not maps
+    assert resampler.nbytes() > 0
+    resampler.clear()
+    assert resampler.nbytes() == 0
@@ -0,0 +1,73 @@
+"""
+Timing of plugin hook functions
+"""
+
+import pytest
+
+from lasagna.hook_profiler import HookProfiler, hookOrigin
+
+
+class examplePlugin(object):
+    def hook_updateStatusBar_End(self):
+        pass
+
+
+def slowHook():
+    pass
+
+
+def test_hookOrigin():
+    assert hookOrigin(examplePlugin().hook_updateStatusBar_End) == ("test_hook_profiler", "hook_updateStatusBar_End")
+    assert hookOrigin(slowHook) == ("test_hook_profiler", "slowHook")
+
+
+def test_durations_are_kept_per_hook_and_function():
+    plugin = examplePlugin()
+    hooks = dict(updateStatusBar_End=[plugin.hook_updateStatusBar_End], updateMainWindowOnMouseMove_End=[slowHook])
+    profiler = HookProfiler(hooks, enabled=True)
+
+    for duration in (0.001, 0.003, 0.002):
+        profiler.record("updateStatusBar_End", plugin.hook_updateStatusBar_End, duration)
+    profiler.record("updateMainWindowOnMouseMove_End", slowHook, 0.010)
+
+    slowest, other = profiler.report()
+    assert (slowest["hook"], slowest["function"], slowest["count"]) == ("updateMainWindowOnMouseMove_End", "slowHook", 1)
+    assert (other["hook"], other["plugin"], other["count"]) == ("updateStatusBar_End", "test_hook_profiler", 3)
+    assert other["total_ms"] == pytest.approx(6)
+    assert other["p50_ms"] == pytest.approx(2)
+    assert other["max_ms"] == pytest.approx(3)
+
+    profiler.reset()
+    assert profiler.report() == []
+
+
+def test_timeHook_finds_the_hook_name_and_records_failures_too():
+    calls = []
+    hooks = dict(updateStatusBar_End=[lambda *args: calls.append(args)], broken=[])
+
+    def failing():
+        raise RuntimeError("plugin bug")
+
+    hooks["broken"].append(failing)
+    profiler = HookProfiler(hooks, enabled=True)
+    profiler.timeHook(hooks["updateStatusBar_End"], hooks["updateStatusBar_End"][0], (1, 2))
+    with pytest.raises(RuntimeError):
+        profiler.timeHook(hooks["broken"], failing, ())
+
+    assert calls == [(1, 2)]
+    assert sorted(row["hook"] for row in profiler.report()) == ["broken", "updateStatusBar_End"]
+
+    # Hooks added later are found too
+    hooks["late"] = [slowHook]
+    profiler.timeHook(hooks["late"], slowHook, ())
+    assert "late" in [row["hook"] for row in profiler.report()]
+
+
+def test_slow_calls_are_reported_first_and_then_every_hundredth(capsys):
+    profiler = HookProfiler(dict(hook=[slowHook]), budget_ms=5, enabled=True)
+    profiler.record("hook", slowHook, 0.001)
+    for _ in range(150):
+        profiler.record("hook", slowHook, 0.010)
+
+    assert capsys.readouterr().out.count("over the 5 ms budget") == 2
+    assert profiler.report()[0]["overBudget"] == 150
@@ -0,0 +1,81 @@
+"""
+Look-up of loaded ingredients by name and by type
+"""
+
+from lasagna.ingredient_registry import IngredientRegistry, ingredientTypes
+
+
+# Stand-ins named after the ingredient modules, since the type of an ingredient is the name of
+# the module defining its class
+class imagestack(object):
+    def __init__(self, objectName):
+        self.objectName = objectName
+
+
+class labelstack(imagestack):
+    pass
+
+
+class sparsepoints(object):
+    def __init__(self, objectName):
+        self.objectName = objectName
+
+
+for cls, module in ((imagestack, "imagestack"), (labelstack, "labelstack"), (sparsepoints, "sparsepoints")):
+    cls.__module__ = "lasagna.ingredients." + module
+
+
+def test_types_include_base_classes():
+    assert ingredientTypes(labelstack("atlas")) == ["labelstack", "imagestack"]
+
+
+def test_byName_and_byType():
+    registry = IngredientRegistry()
+    brain, atlas, cells = imagestack("brain"), labelstack("atlas"), sparsepoints("cells")
+    [registry.add(ingredient) for ingredient in (brain, atlas, cells)]
+
+    assert registry.byName("atlas") is atlas
+    assert registry.byName("missing") is None
+    assert registry.byType("imagestack") == [brain, atlas]
+    assert registry.byType("labelstack") == [atlas]
+    assert registry.byType("lines") == []
+    assert registry.isOfType(atlas, "imagestack") and not registry.isOfType(cells, "imagestack")
+    assert registry.names() == ["brain", "atlas", "cells"]
+    assert len(registry) == 3 and cells in registry
+
+
+def test_adding_a_name_again_replaces_the_ingredient():
+    registry = IngredientRegistry()
+    registry.add(labelstack("stack"))
+    replacement = imagestack("stack")
+    registry.add(replacement)
+
+    assert registry.byName("stack") is replacement
+    assert registry.byType("labelstack") == []
+    assert len(registry) == 1
+
+
+def test_remove():
+    registry = IngredientRegistry()
+    brain, atlas = imagestack("brain"), labelstack("atlas")
+    registry.add(brain)
+    registry.add(atlas)
+
+    registry.remove(imagestack("brain"))  # same name, different ingredient: ignored
+    assert registry.byName("brain") is brain
+
+    registry.remove(atlas)
+    assert atlas not in registry
+    assert registry.byType("imagestack") == [brain]
+    assert registry.byType("labelstack") == []
+    registry.remove(atlas)  # removing twice is harmless
+
+
+def test_reorder():
+    registry = IngredientRegistry()
+    brain, atlas, cells = imagestack("brain"), labelstack("atlas"), sparsepoints("cells")
+    [registry.add(ingredient) for ingredient in (brain, atlas, cells)]
+
+    registry.reorder([cells, atlas, sparsepoints("not registered"), brain])
+    assert registry.names() == ["cells", "atlas", "brain"]
+    assert registry.byType("imagestack") == [atlas, brain]
@@ -0,0 +1,20 @@
+"""
+Label colours come from atlas files as hex triplets, which YAML and JSON readers turn into ints
+when they are all digits
+"""
+
+import pytest
+
+from lasagna.ingredients.labelstack import hexToRGB
+
+
+@pytest.mark.parametrize("triplet, rgb", [
+    ("FF7080", (255, 112, 128)),
+    ("#ff7080", (255, 112, 128)),
+    ("009900", (0, 153, 0)),
+    (9900, (0, 153, 0)),
+    (990000, (153, 0, 0)),
+    (0, (0, 0, 0)),
+])
+def test_hexToRGB(triplet, rgb):
+    assert hexToRGB(triplet) == rgb
@@ -0,0 +1,38 @@
+"""
+Checks that the data of removed ingredients are freed
+"""
+
+import gc
+
+import numpy as np
+
+from lasagna.memory_manager import MemoryManager
+
+
+class storedStack(object):
+    def __init__(self, objectName, data):
+        self.objectName = objectName
+        self._data = data
+
+    def raw_data(self):
+        return self._data
+
+
+def test_releases_are_checked_once_per_batch(monkeypatch):
+    manager = MemoryManager(None)
+    kept = storedStack("kept", np.zeros((4, 4, 4)))
+    held = kept.raw_data()[1:]  # e.g. a plugin holding on to a view of the data
+
+    assert manager.watchRelease(storedStack("freed", np.zeros((4, 4, 4))))
+    assert not manager.watchRelease(kept)  # a check is already due
+    assert not manager.watchRelease(storedStack("points", None))
+    kept._data = None
+
+    collections = []
+    monkeypatch.setattr(gc, "collect", lambda: collections.append(1))
+    assert manager.checkReleases() == ["kept"]
+    assert len(collections) == 1
+
+    assert manager.checkReleases() == []
+    assert len(collections) == 1
+    del held
@@ -0,0 +1,38 @@
+"""
+Oblique planes pivot on the volume, so panning or zooming only changes which part of the same
+plane is shown
+"""
+
+import numpy as np
+import pytest
+
+from lasagna.image_processing.oblique_slice import obliquePlane
+
+
+@pytest.fixture
+def volume():
+    return np.random.default_rng(0).random((30, 40, 50)).astype(np.float32)
+
+
+@pytest.mark.parametrize("interpolation", ["nearest", "linear"])
+def test_sub_region_is_a_crop_of_the_full_view(volume, interpolation):
+    plane = obliquePlane(tiltX=30, tiltY=-20, interpolation=interpolation)
+    full = plane.sample(volume, 12, (0, 0, 40, 50), (40, 50))
+    part = plane.sample(volume, 12, (10, 5, 20, 30), (20, 30))
+
+    np.testing.assert_allclose(part, full[10:30, 5:35], rtol=1e-5, atol=1e-6)
+
+
+def test_grid_does_not_depend_on_region(volume):
+    plane = obliquePlane(tiltX=25, tiltY=10)
+    full = plane.coordinateGrid(volume.shape, (0, 0, 40, 50), (40, 50))[:, 8:24, 16:40].copy()
+    panned = plane.coordinateGrid(volume.shape, (8, 16, 16, 24), (16, 24))
+
+    np.testing.assert_allclose(panned, full, atol=1e-4)
+
+
+def test_untilted_plane_is_the_orthogonal_slice(volume):
+    plane = obliquePlane()
+    for interpolation in ("nearest", "linear"):
+        image = plane.sample(volume, 7, (0, 0, 40, 50), (40, 50), interpolation=interpolation)
+        np.testing.assert_allclose(image, volume[7], atol=1e-6)
@@ -0,0 +1,99 @@
+"""
+The cached list of plugins used to build the menus without importing the plugins
+"""
+
+import os
+
+import pytest
+import yaml
+
+from lasagna.plugins import plugin_handler
+from lasagna.plugins.plugin_handler import plugin_manifest, read_plugin_info
+
+
+PLUGIN_SOURCE = '''
+raise RuntimeError("plugins must not be imported to build the menus")
+
+
+class plugin(object):
+    def __init__(self, lasagna_serving):
+        self.pluginShortName = "{short_name}"
+        self.pluginLongName = "Does something useful"
+        self.pluginAuthor = "Someone"
+
+    def hook_updateStatusBar_End(self):
+        pass
+'''
+
+
+def writePlugin(directory, name, short_name="Example", extra=""):
+    path = os.path.join(str(directory), name)
+    with open(path, "w") as stream:
+        stream.write(PLUGIN_SOURCE.format(short_name=short_name) + extra)
+    return path
+
+
+@pytest.fixture
+def pluginDir(tmp_path):
+    directory = tmp_path / "my_plugins"
+    directory.mkdir()
+    writePlugin(directory, "first_plugin.py", "First")
+    writePlugin(directory, "second_plugin.py", "Second")
+    (directory / "helpers.py").write_text("x = 1\n")
+    return str(directory)
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """
+    The plugin files whose source is read
+    """
+    read_files = []
+    read = plugin_handler.read_plugin_info
+    monkeypatch.setattr(plugin_handler, "read_plugin_info",
+                        lambda file_name: read_files.append(os.path.basename(file_name)) or read(file_name))
+    return read_files
+
+
+def test_read_plugin_info_parses_without_importing(pluginDir):
+    info = read_plugin_info(os.path.join(pluginDir, "first_plugin.py"))
+    assert info == dict(has_hooks=True, pluginShortName="First", pluginLongName="Does something useful")
+
+
+def test_unchanged_plugins_come_from_the_cache(pluginDir, tmp_path, reads):
+    cache_file = str(tmp_path / "manifest.yml")
+    manifest = plugin_manifest([pluginDir], cache_file)
+    assert sorted(entry["module_name"] for entry in manifest) == ["first_plugin", "second_plugin"]
+    assert sorted(reads) == ["first_plugin.py", "second_plugin.py"]
+    assert all(entry["menu_dir"] == "my_plugins" for entry in manifest)
+
+    cache_stamp = os.stat(cache_file).st_mtime_ns
+    del reads[:]
+    assert plugin_manifest([pluginDir], cache_file) == manifest
+    assert reads == []
+    assert os.stat(cache_file).st_mtime_ns == cache_stamp  # not rewritten
+
+
+def test_changed_added_and_removed_plugins(pluginDir, tmp_path, reads):
+    cache_file = str(tmp_path / "manifest.yml")
+    plugin_manifest([pluginDir], cache_file)
+    del reads[:]
+
+    writePlugin(pluginDir, "first_plugin.py", "Renamed", extra="# longer\n")
+    writePlugin(pluginDir, "third_plugin.py", "Third")
+    os.remove(os.path.join(pluginDir, "second_plugin.py"))
+
+    manifest = plugin_manifest([pluginDir], cache_file)
+    assert sorted(reads) == ["first_plugin.py", "third_plugin.py"]
+    assert sorted(entry["pluginShortName"] for entry in manifest) == ["Renamed", "Third"]
+    with open(cache_file) as stream:
+        assert sorted(os.path.basename(path) for path in yaml.safe_load(stream)) == ["first_plugin.py", "third_plugin.py"]
+
+
+def test_unreadable_cache_is_rebuilt(pluginDir, tmp_path, reads):
+    cache_file = tmp_path / "manifest.yml"
+    cache_file.write_text("{ not yaml")
+    assert len(plugin_manifest([pluginDir, str(tmp_path / "missing")], str(cache_file))) == 2
+    assert len(reads) == 2
+    with open(str(cache_file)) as stream:
+        assert len(yaml.safe_load(stream)) == 2
@@ -0,0 +1,125 @@
+"""
+Preferences served from memory, kept in step with the file on disk
+"""
+
+import os
+
+import pytest
+import yaml
+
+from lasagna.utils import preferences
+from lasagna.utils.preferences import preferenceStore
+
+
+@pytest.fixture
+def prefFName(tmp_path):
+    fname = str(tmp_path / "prefs.yml")
+    with open(fname, "w") as stream:
+        yaml.dump(dict(showCrossHairs=True, colorOrder=["red", "green"], defaultLineWidth=2), stream)
+    return fname
+
+
+def editOnDisk(fname, **changes):
+    """
+    Change preferences in the file as a text editor would, making sure the modification time moves on
+    """
+    with open(fname) as stream:
+        contents = yaml.safe_load(stream)
+    contents.update(changes)
+    stamp = os.stat(fname).st_mtime_ns
+    with open(fname, "w") as stream:
+        yaml.dump(contents, stream)
+    os.utime(fname, ns=(stamp + 10 ** 9, stamp + 10 ** 9))
+
+
+def test_values_are_copies(prefFName):
+    store = preferenceStore(prefFName)
+    colors = store.get("colorOrder")
+    colors.append("blue")
+    assert store.get("colorOrder") == ["red", "green"]
+
+
+def test_missing_file_is_created_from_defaults(tmp_path):
+    fname = str(tmp_path / "new.yml")
+    store = preferenceStore(fname)
+    assert store.all(defaultPref=dict(hideAxes=False)) == dict(hideAxes=False)
+    with open(fname) as stream:
+        assert yaml.safe_load(stream) == dict(hideAxes=False)
+
+
+def test_file_is_read_again_only_when_it_changes(prefFName, monkeypatch):
+    store = preferenceStore(prefFName)
+    changes = []
+    store.addListener(lambda name, value: changes.append((name, value)))
+    assert store.get("defaultLineWidth") == 2
+
+    loads = []
+    load = yaml.load
+    monkeypatch.setattr(yaml, "load", lambda *args, **kwargs: loads.append(1) or load(*args, **kwargs))
+    store.get("defaultLineWidth")
+    assert loads == []
+
+    editOnDisk(prefFName, defaultLineWidth=5, hideAxes=False)
+    del loads[:]  # editOnDisk reads the file too
+    assert store.get("defaultLineWidth") == 5
+    assert len(loads) == 1
+    assert sorted(changes) == [("defaultLineWidth", 5), ("hideAxes", False)]
+
+
+def test_set_writes_atomically_and_notifies(prefFName):
+    store = preferenceStore(prefFName)
+    changes = []
+    listener = lambda name, value: changes.append((name, value))
+    store.addListener(listener)
+
+    store.set("showCrossHairs", False)
+    store.set("showCrossHairs", False)  # unchanged: not written or notified again
+    assert changes == [("showCrossHairs", False)]
+    with open(prefFName) as stream:
+        assert yaml.safe_load(stream)["showCrossHairs"] is False
+    assert os.listdir(os.path.dirname(prefFName)) == ["prefs.yml"]
+
+    # Writing the file does not make the store think it was edited outside Lasagna
+    assert store.refresh() == []
+
+    store.removeListener(listener)
+    store.set("showCrossHairs", True)
+    assert changes == [("showCrossHairs", False)]
+
+
+def test_failed_write_leaves_the_file_intact(prefFName, monkeypatch):
+    store = preferenceStore(prefFName)
+    with open(prefFName) as stream:
+        before = stream.read()
+
+    def failingDump(*args, **kwargs):
+        raise IOError("disk full")
+
+    monkeypatch.setattr(yaml, "dump", failingDump)
+    with pytest.raises(IOError):
+        store.set("defaultLineWidth", 3)
+    with open(prefFName) as stream:
+        assert stream.read() == before
+    assert os.listdir(os.path.dirname(prefFName)) == ["prefs.yml"]
+
+
+def test_replace_notifies_only_the_changes(prefFName):
+    store = preferenceStore(prefFName)
+    store.all()
+    changes = []
+    store.addListener(lambda name, value: changes.append(name))
+
+    store.replace(dict(showCrossHairs=True, colorOrder=["blue"]))
+    assert sorted(changes) == ["colorOrder", "defaultLineWidth"]
+
+
+def test_module_functions_use_one_store_per_file(prefFName):
+    assert preferences.preferenceStoreFor(prefFName) is preferences.preferenceStoreFor(prefFName)
+    assert preferences.readPreference("defaultLineWidth", prefFName) == 2
+
+    # Missing preferences come from the defaults and are added to the file
+    assert preferences.readPreference("hoverBudget_ms", prefFName) == preferences.defaultPreferences()["hoverBudget_ms"]
+    assert "hoverBudget_ms" in preferences.loadAllPreferences(prefFName)
+
+    preferences.preferenceWriter("defaultLineWidth", 4, prefFName)
+    assert preferences.readPreference("defaultLineWidth", prefFName) == 4
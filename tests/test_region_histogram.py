@@ -0,0 +1,40 @@
+"""
+Histograms of the visible part of a slice, in the bins of the whole-stack histogram
+"""
+
+import numpy as np
+import pytest
+
+from lasagna.image_processing.region_histogram import binEdges, binIndex, histogramCounts
+
+
+@pytest.mark.parametrize("dtype, low, high", [
+    (np.uint8, 0, 256),
+    (np.uint16, 0, 5000),
+    (np.int16, -3000, 3000),
+    (np.int32, -3000, 3000),
+    (np.float32, -1, 1),
+])
+@pytest.mark.parametrize("nBins", [1, 7, 100])
+def test_counts_match_numpy(dtype, low, high, nBins):
+    rng = np.random.default_rng(0)
+    values = (rng.random((60, 70)) * (high - low) + low).astype(dtype)
+    edges = np.linspace(values.min() + 0.25 * (high - low), values.max(), nBins + 1)
+
+    expected, _ = np.histogram(values, bins=edges)
+    counts = histogramCounts(values, edges)
+    assert counts.dtype.kind == "i"
+    np.testing.assert_array_equal(counts, expected)
+
+
+def test_last_bin_includes_its_right_edge_and_outliers_are_not_counted():
+    edges = np.array([0.0, 10.0, 20.0])
+    values = np.array([-1, 0, 9.99, 10, 20, 20.01, np.nan, np.inf])
+    np.testing.assert_array_equal(binIndex(values, edges), [-1, 0, 0, 1, 1, -1, -1, -1])
+    np.testing.assert_array_equal(histogramCounts(values, edges), [2, 2])
+
+
+def test_binEdges_from_left_edges():
+    np.testing.assert_array_equal(binEdges(dict(x=[0, 5, 10])), [0, 5, 10, 15])
+    np.testing.assert_array_equal(binEdges(dict(x=[3])), [3, 4])
+    assert binEdges(dict(x=[0, 5], edges=[0, 4, 8])) == [0, 4, 8]
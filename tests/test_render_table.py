@@ -0,0 +1,50 @@
+"""
+The pre-quantised slices from renderTable must look exactly like pyqtgraph's own rendering
+"""
+
+import numpy as np
+import pyqtgraph as pg
+import pytest
+
+from lasagna.image_processing.render_table import renderTable
+from lasagna.image_processing.slice_render import colorMapLUT
+
+
+def pyqtgraphRGBA(image, levels, lut):
+    # makeARGB returns the channels in BGRA order
+    argb, _ = pg.functions.makeARGB(image, lut=lut, levels=levels)
+    return argb[..., [2, 1, 0, 3]]
+
+
+def renderedRGBA(image, levels, lut):
+    rows, table = renderTable().apply(image, levels, "key", lambda: lut)
+    if table is None:
+        return rows
+    return table[rows]
+
+
+@pytest.mark.parametrize("dtype, levels", [
+    (np.uint8, (10, 200)),
+    (np.uint16, (100, 3000)),
+    (np.int16, (-500, 1200)),
+    (np.float32, (100, 3000)),
+])
+def test_matches_pyqtgraph(dtype, levels):
+    rng = np.random.default_rng(0)
+    info = np.iinfo(dtype) if np.dtype(dtype).kind in "iu" else np.iinfo(np.uint16)
+    image = rng.integers(max(info.min, -4096), min(info.max, 4096) + 1, size=(40, 50)).astype(dtype)
+    lut = colorMapLUT("red")
+
+    np.testing.assert_array_equal(renderedRGBA(image, levels, lut), pyqtgraphRGBA(image, levels, lut))
+
+
+def test_table_is_reused_until_levels_change():
+    image = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    lut = colorMapLUT("gray")
+    table = renderTable()
+
+    first, _ = table.apply(image, (0, 255), "gray", lambda: lut)
+    np.testing.assert_array_equal(table.apply(image, (0, 255), "gray", lambda: lut)[0], first)
+
+    rows, rowLut = table.apply(image, (0, 127), "gray", lambda: lut)
+    np.testing.assert_array_equal(rowLut[rows], pyqtgraphRGBA(image, (0, 127), lut))
@@ -0,0 +1,100 @@
+"""
+Session files and their array caches
+"""
+
+import os
+
+import numpy as np
+
+from lasagna.io_libs import session_io
+from lasagna.ingredient_registry import IngredientRegistry
+from lasagna.session import SessionManager, isFileMap
+
+
+def test_session_round_trip(tmp_path):
+    fname = str(tmp_path / "session.yml")
+    session = dict(
+        ingredients=[
+            dict(kind="imagestack", objectName="brain", fname="/data/brain.tif",
+                 state=dict(minMax=np.array([0.0, 1200.0]), lut="gray"), cache="brain_abc.npy"),
+            dict(kind="sparsepoints", objectName="cells", fname="", state=dict(color=[255, 0, 0])),
+        ],
+        views=[dict(slice=np.int64(12), flipped=False, ranges=[[0.0, 10.5], [2.0, 30.0]])],
+    )
+    session_io.write_session(fname, session)
+    restored = session_io.read_session(fname)
+
+    assert restored["version"] == session_io.SESSION_VERSION
+    assert [entry["objectName"] for entry in restored["ingredients"]] == ["brain", "cells"]
+    assert restored["ingredients"][0]["state"] == dict(minMax=[0.0, 1200.0], lut="gray")
+    assert restored["ingredients"][0]["cache"] == os.path.join(session_io.cache_dir(fname), "brain_abc.npy")
+    assert "cache" not in restored["ingredients"][1]
+    assert restored["views"] == [dict(slice=12, flipped=False, ranges=[[0.0, 10.5], [2.0, 30.0]])]
+
+
+def test_array_cache_round_trip(tmp_path):
+    data = np.arange(2 * 3 * 4, dtype=np.uint16).reshape(2, 3, 4)
+    fname = os.path.join(session_io.cache_dir(str(tmp_path / "session.yml")), "stack.npy")
+
+    assert session_io.write_array_cache(fname, data)
+    cached = session_io.open_array_cache(fname)
+    assert isinstance(cached, np.memmap)
+    np.testing.assert_array_equal(cached, data)
+    assert session_io.open_array_cache(str(tmp_path / "missing.npy")) is None
+
+
+def test_array_digest():
+    data = np.random.default_rng(0).integers(0, 1000, size=(20, 8, 8)).astype(np.uint16)
+    digest = session_io.array_digest(data)
+
+    assert session_io.array_digest(data.copy()) == digest
+    assert session_io.array_digest(data, chunk_bytes=128) == digest
+    assert session_io.array_digest(data[::-1]) != digest
+    assert session_io.array_digest(data.astype(np.int32)) != digest
+
+
+def test_cache_file_name():
+    assert session_io.cache_file_name("my stack/1") == "my_stack_1.npy"
+    assert session_io.cache_file_name("brain.tif", "abc123") == "brain.tif_abc123.npy"
+
+
+def test_isFileMap(tmp_path):
+    fname = str(tmp_path / "stack.npy")
+    np.save(fname, np.arange(24, dtype=np.uint8).reshape(2, 3, 4))
+    mapped = np.load(fname, mmap_mode="r")
+
+    assert isFileMap(mapped, fname)
+    assert not isFileMap(mapped[::-1], fname)
+    assert not isFileMap(mapped.transpose(1, 0, 2), fname)
+    assert not isFileMap(mapped[:1], fname)
+    assert not isFileMap(np.array(mapped), fname)
+
+
+class storedStack(object):
+    def __init__(self, objectName, data):
+        self.objectName = objectName
+        self._data = data
+
+    def raw_data(self):
+        return self._data
+
+
+class lasagnaStub(object):
+    def __init__(self, *ingredients):
+        self.ingredientRegistry = IngredientRegistry()
+        for ingredient in ingredients:
+            self.ingredientRegistry.add(ingredient)
+
+
+def test_pruneCache_keeps_files_that_are_still_mapped(tmp_path):
+    directory = session_io.cache_dir(str(tmp_path / "session.yml"))
+    for name in ("used.npy", "mapped.npy", "stale.npy"):
+        session_io.write_array_cache(os.path.join(directory, name), np.zeros((2, 2, 2), dtype=np.uint8))
+
+    # A restored stack that has since been flipped no longer matches its cache file but still maps it
+    flipped = np.load(os.path.join(directory, "mapped.npy"), mmap_mode="r")[::-1]
+    manager = SessionManager.__new__(SessionManager)  # only the registry is needed, not the Qt set-up
+    manager.lasagna = lasagnaStub(storedStack("flipped", flipped))
+
+    SessionManager._pruneCache(directory, [dict(cache="used.npy"), dict()], manager._mappedFiles())
+    assert sorted(os.listdir(directory)) == ["mapped.npy", "used.npy"]
@@ -0,0 +1,64 @@
+"""
+Incremental slab projections must match projecting the whole slab with numpy
+"""
+
+import numpy as np
+import pytest
+
+from lasagna.image_processing.slab_projection import slabProjector
+
+
+def reference(volume, sliceToPlot, halfWidth, mode):
+    slab = volume[max(0, sliceToPlot - halfWidth):sliceToPlot + halfWidth + 1]
+    if mode == "max":
+        return slab.max(axis=0)
+    if mode == "mean":
+        return slab.mean(axis=0)
+    return slab.sum(axis=0)
+
+
+@pytest.fixture
+def volume():
+    return np.random.default_rng(0).integers(0, 4096, size=(23, 6, 7)).astype(np.uint16)
+
+
+# Scroll forwards one and several slices at a time, jump, then scroll back
+SCROLL = list(range(0, 23)) + [5, 7, 11, 20, 22, 3, 2, 1, 0, 14, 13, 12, 9]
+
+
+@pytest.mark.parametrize("mode", ["max", "mean", "sum"])
+@pytest.mark.parametrize("halfWidth", [0, 1, 3, 12])
+def test_scrolling_matches_numpy(volume, mode, halfWidth):
+    projector = slabProjector(mode)
+    for sliceToPlot in SCROLL:
+        np.testing.assert_array_equal(
+            projector.project(volume, sliceToPlot, halfWidth),
+            reference(volume, sliceToPlot, halfWidth, mode),
+            err_msg="slice %d" % sliceToPlot,
+        )
+
+
+def test_sum_does_not_overflow_the_stack_type():
+    volume = np.full((10, 2, 2), 250, dtype=np.uint8)
+    np.testing.assert_array_equal(slabProjector("sum").project(volume, 5, 2), np.full((2, 2), 1250))
+
+
+def test_state_is_reset_when_the_data_change(volume):
+    projector = slabProjector("sum")
+    projector.project(volume, 10, 2)
+    changed = volume[::-1].copy()
+    np.testing.assert_array_equal(projector.project(changed, 11, 2), reference(changed, 11, 2, "sum"))
+
+
+def test_only_the_most_recent_max_blocks_are_kept(volume):
+    projector = slabProjector("max", maxCachedBlocks=2)
+    for sliceToPlot in range(23):
+        projector.project(volume, sliceToPlot, 1)
+    assert len(projector._blocks) == 2
+    assert sorted(projector._blocks) == [6, 7]
+    assert projector.nbytes() == 2 * (3 + 2) * volume[0].nbytes  # the last block is clipped at slice 22
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        slabProjector("median")
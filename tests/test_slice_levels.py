@@ -0,0 +1,79 @@
+"""
+Per-slice auto-contrast levels and their cache
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from lasagna.image_processing import slice_levels
+from lasagna.image_processing.slice_levels import sampleStride, sliceLevels, slicePercentiles
+
+
+@pytest.fixture
+def volume():
+    # Brightness rises through the stack, as it does from the surface of a sample to its centre
+    rng = np.random.default_rng(0)
+    return (rng.random((10, 30, 40)) * 100 * np.arange(1, 11)[:, np.newaxis, np.newaxis]).astype(np.uint16)
+
+
+def test_levels_are_the_percentiles_of_each_slice(volume):
+    levels = sliceLevels(percentiles=(1, 99))
+    for sliceToPlot in range(10):
+        expected = np.percentile(volume[sliceToPlot], (1, 99))
+        result = levels.levels(0, sliceToPlot, 10, "key", lambda: volume[sliceToPlot])
+        np.testing.assert_allclose(result, expected, rtol=1e-6)
+
+
+def test_levels_are_computed_once_per_slice_until_the_source_changes(volume):
+    levels = sliceLevels()
+    reads = []
+
+    def getImage():
+        reads.append(1)
+        return volume[3]
+
+    first = levels.levels(1, 3, 30, "key", getImage)
+    assert levels.levels(1, 3, 30, "key", getImage) == first
+    assert len(reads) == 1
+    assert levels.nbytes() == 30 * 2 * 4
+
+    levels.levels(1, 3, 30, "new key", getImage)
+    assert len(reads) == 2
+
+
+def test_uniform_and_non_finite_slices_give_valid_levels():
+    levels = sliceLevels()
+    assert levels.levels(0, 0, 2, "key", lambda: np.full((4, 4), 7, dtype=np.uint8)) == [7.0, 8.0]
+    assert levels.levels(0, 1, 2, "key", lambda: np.full((4, 4), np.nan)) == [0.0, 1.0]
+
+    image = np.array([[np.nan, 1.0], [np.inf, 3.0]])
+    np.testing.assert_allclose(slicePercentiles(image[np.newaxis], (0, 100)), [[1, 3]])
+
+
+def test_large_slices_are_subsampled(monkeypatch):
+    monkeypatch.setattr(slice_levels, "MAX_SAMPLES", 100)
+    assert sampleStride((10, 10)) == 1
+    assert sampleStride((40, 40)) == 4
+    assert sampleStride((41, 40)) == 5
+
+
+def test_background_computation_matches_on_demand_levels(volume):
+    background = sliceLevels()
+    background.precompute(volume, "key", chunkSize=3)
+    end = time.time() + 5
+    while not background.isComplete():
+        assert time.time() < end, "timed out"
+        time.sleep(0.01)
+
+    on_demand = sliceLevels()
+    for axisToPlot in range(3):
+        slices = volume.swapaxes(0, axisToPlot)
+        for sliceToPlot in range(slices.shape[0]):
+            get_image = lambda: slices[sliceToPlot]
+            assert (background.levels(axisToPlot, sliceToPlot, slices.shape[0], "key", None)
+                    == on_demand.levels(axisToPlot, sliceToPlot, slices.shape[0], "key", get_image))
+
+    background.clear()
+    assert background.nbytes() == 0 and not background.isComplete()
@@ -0,0 +1,111 @@
+"""
+Read-ahead of the slices shown during time series playback
+"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from lasagna.io_libs.slice_prefetcher import slicePrefetcher, sliceRingBuffer
+
+
+def waitFor(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+
+class seriesReader(object):
+    """
+    readSlice for slicePrefetcher that records the slices read and can be held mid-read
+    """
+
+    def __init__(self, series):
+        self.series = series
+        self.reads = []
+        self.release = threading.Event()
+        self.release.set()
+        self.reading = threading.Event()
+
+    def __call__(self, timepoint, axis, sliceToPlot):
+        series = self.series
+        self.reading.set()
+        self.release.wait()
+        self.reads.append((timepoint, axis, sliceToPlot))
+        return series[timepoint].swapaxes(0, axis)[sliceToPlot]
+
+
+@pytest.fixture
+def series():
+    return np.arange(6 * 4 * 5 * 3, dtype=np.uint16).reshape(6, 4, 5, 3)
+
+
+@pytest.fixture
+def prefetcher(series):
+    prefetcher = slicePrefetcher(seriesReader(series), depth=2)
+    yield prefetcher
+    prefetcher.stop()
+
+
+def test_ring_buffer_overwrites_oldest_and_keeps_only_given_timepoints():
+    buffer = sliceRingBuffer(capacity=3)
+    for t in range(4):
+        buffer.put((t, 0, 0, 0), np.full((2, 2), t))
+    assert (0, 0, 0, 0) not in buffer
+    assert buffer.nbytes() == 3 * np.full((2, 2), 0).nbytes
+
+    buffer.keepOnly({2}, 0)
+    assert (2, 0, 0, 0) in buffer and (1, 0, 0, 0) not in buffer and (3, 0, 0, 0) not in buffer
+    buffer.keepOnly({2}, 1)
+    assert buffer.nbytes() == 0
+
+
+def test_get_reads_on_a_miss_and_then_hits(prefetcher, series):
+    np.testing.assert_array_equal(prefetcher.get(1, 2, 1), series[1, :, :, 1].T)
+    np.testing.assert_array_equal(prefetcher.get(1, 2, 1), series[1, :, :, 1].T)
+    assert (prefetcher.hits, prefetcher.misses) == (1, 1)
+
+
+def test_prefetch_reads_the_upcoming_timepoints(prefetcher, series):
+    prefetcher.prefetch(4, nTimepoints=6, slices=(1, 2, 0), loop=True)
+    waitFor(lambda: all((t, axis, s, 0) in prefetcher.buffer for t in (5, 0) for axis, s in enumerate((1, 2, 0))))
+
+    np.testing.assert_array_equal(prefetcher.get(0, 1, 2), series[0, :, 2, :])
+    assert prefetcher.misses == 0
+
+    # Without looping there is nothing after the last timepoint to read
+    prefetcher.prefetch(5, nTimepoints=6, slices=(1, 2, 0), loop=False)
+    assert (0, 1, 2, 0) not in prefetcher.buffer
+
+
+def test_slices_of_a_replaced_series_are_discarded(prefetcher, series):
+    reader = prefetcher.readSlice
+    reader.release.clear()
+    prefetcher.prefetch(0, nTimepoints=6, slices=(0, 0, 0))
+    assert reader.reading.wait(5)
+
+    # The series is swapped while the worker is part way through a read of the old one
+    reader.series = series.swapaxes(2, 3).copy()
+    prefetcher.invalidate()
+    reader.release.set()
+    time.sleep(0.05)
+
+    assert prefetcher.buffer.nbytes() == 0
+    np.testing.assert_array_equal(prefetcher.get(1, 0, 0), reader.series[1, 0])
+
+
+def test_clear_drops_the_pending_request(prefetcher):
+    reader = prefetcher.readSlice
+    reader.release.clear()
+    prefetcher.prefetch(0, nTimepoints=6, slices=(0, 0, 0))
+    assert reader.reading.wait(5)
+    prefetcher.prefetch(2, nTimepoints=6, slices=(1, 1, 1))  # waits behind the read in progress
+
+    prefetcher.clear()
+    reader.release.set()
+    time.sleep(0.05)
+    assert not any(read[0] in (3, 4) for read in reader.reads)
@@ -0,0 +1,62 @@
+"""
+Expressions typed by the user to derive a stack from others
+"""
+
+import numpy as np
+import pytest
+
+from lasagna.image_processing.stack_expression import PRESETS, stackExpression
+
+
+@pytest.mark.parametrize("expression", [
+    "__import__('os').system('ls')",
+    "a.T",
+    "a[0]",
+    "np.sum(a)",
+    "where(a > 0, a, b=0)",
+    "lambda: a",
+    "[a, b]",
+    "a if b else 0",
+    "'text'",
+    "0 < a < 1",
+    "a // b",
+    "a % 2",
+    "where",
+    "a +",
+])
+def test_disallowed_expressions_are_rejected(expression):
+    with pytest.raises(ValueError):
+        stackExpression(expression)
+
+
+def test_names_in_order_of_appearance():
+    assert stackExpression("where(b > t, a - b, a)").names == ["b", "t", "a"]
+
+
+def test_unsigned_inputs_do_not_wrap_around():
+    a = np.array([[1, 200]], dtype=np.uint8)
+    b = np.array([[3, 100]], dtype=np.uint8)
+
+    result = stackExpression(PRESETS["difference"]).evaluate(dict(a=a, b=b))
+    assert result.dtype == np.float32
+    np.testing.assert_array_equal(result, [[-2, 100]])
+
+
+def test_integer_division_is_true_division_and_not_finite_values_are_zero():
+    a = np.array([3, 1, 0], dtype=np.uint16)
+    b = np.array([2, 0, 0], dtype=np.uint16)
+
+    np.testing.assert_array_equal(stackExpression("a / b").evaluate(dict(a=a, b=b)), [1.5, 0, 0])
+
+
+def test_functions_comparisons_and_logic():
+    a = np.array([-4.0, 1.0, 9.0])
+    b = np.array([1.0, 0.0, 2.0])
+    result = stackExpression("where((a > 0) & ~(b == 0), sqrt(abs(a)), -1)").evaluate(dict(a=a, b=b))
+    np.testing.assert_array_equal(result, [-1, -1, 3])
+    np.testing.assert_array_equal(stackExpression(PRESETS["thresholded"]).evaluate(dict(a=a, t=0)), [0, 1, 9])
+
+
+def test_missing_variable():
+    with pytest.raises(ValueError):
+        stackExpression("a - b").evaluate(dict(a=np.zeros(3)))
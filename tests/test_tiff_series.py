@@ -0,0 +1,47 @@
+"""
+TIFF time and channel series are loaded as 4-D stacks, other multi-dimensional TIFFs are not
+"""
+
+import numpy as np
+import pytest
+
+tifffile = pytest.importorskip("tifffile")
+
+from lasagna.io_libs.image_stack_loader import is_tiff_series, load_tiff_stack
+
+
+@pytest.mark.parametrize("axes, series", [
+    ("TZYX", True),
+    ("ZCYX", True),
+    ("ZYX", False),
+    ("QYXS", False),
+    ("ZYXS", False),
+])
+def test_is_tiff_series(axes, series):
+    assert is_tiff_series(axes) == series
+
+
+def test_time_series_keeps_time_first(tmp_path):
+    data = np.arange(3 * 4 * 5 * 6, dtype=np.uint16).reshape(3, 4, 5, 6)
+    fname = str(tmp_path / "series.tif")
+    tifffile.imwrite(fname, data, imagej=True, metadata=dict(axes="TZYX"))
+
+    np.testing.assert_array_equal(load_tiff_stack(fname), data.swapaxes(-2, -1))
+
+
+def test_channels_of_a_hyperstack_come_first(tmp_path):
+    data = np.arange(4 * 2 * 5 * 6, dtype=np.uint16).reshape(4, 2, 5, 6)
+    fname = str(tmp_path / "channels.tif")
+    tifffile.imwrite(fname, data, imagej=True, metadata=dict(axes="ZCYX"))
+
+    np.testing.assert_array_equal(load_tiff_stack(fname), np.moveaxis(data, 1, 0).swapaxes(-2, -1))
+
+
+def test_rgb_stack_is_not_a_time_series(tmp_path):
+    data = np.arange(4 * 5 * 6 * 3, dtype=np.uint8).reshape(4, 5, 6, 3)
+    fname = str(tmp_path / "rgb.tif")
+    tifffile.imwrite(fname, data, photometric="rgb")
+
+    im = load_tiff_stack(fname)
+    assert not isinstance(im, np.memmap)
+    np.testing.assert_array_equal(im, data.swapaxes(1, 2))